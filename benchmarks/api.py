@@ -0,0 +1,125 @@
+"""JSON API против HTML-страниц тех же данных.
+
+Для ленты, группы, профиля и поста меряет время ответа, размер тела
+и число запросов к базе. Кэш фрагментов и карточек перед каждым
+запросом очищается, чтобы HTML платил за рендер, как у клиента,
+попавшего на холодную страницу. Отдельно меряется сериализация
+страницы из 100 постов без базы.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.api --posts 2000 --repeat 50
+"""
+import argparse
+
+from benchmarks.utils import django_test_db, print_table, summary, timed
+
+
+def fill(posts, comments):
+    from django.contrib.auth import get_user_model
+    from posts.models import Comment, Group, Post
+
+    User = get_user_model()
+    author = User.objects.create_user(
+        username='author', first_name='Лев', last_name='Толстой'
+    )
+    group = Group.objects.create(
+        title='Группа', slug='group', description='Описание'
+    )
+    Post.objects.bulk_create(
+        Post(author=author, group=group if number % 2 else None,
+             text=f'Текст поста номер {number}. ' * 20)
+        for number in range(posts)
+    )
+    post = Post.objects.order_by('-pk').first()
+    Comment.objects.bulk_create(
+        Comment(post=post, author=author, text=f'Комментарий {number}')
+        for number in range(comments)
+    )
+    return post
+
+
+def fetch(client, url):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    return len(response.content), len(context.captured_queries)
+
+
+def serialize_page(rows, build):
+    from api.serializers import dumps
+
+    return dumps({'results': [build(row) for row in rows], 'next': None})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=20,
+                        help='Комментариев у поста на странице поста.')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with django_test_db():
+        from django.test import Client
+        from django.urls import reverse
+        from api import serializers
+        from posts.models import Post
+
+        post = fill(args.posts, args.comments)
+        client = Client()
+        pages = [
+            ('лента', reverse('posts:index'),
+             reverse('api:post_list') + '?limit=10'),
+            ('группа', reverse('posts:group_list', args=['group']),
+             reverse('api:group_posts', args=['group']) + '?limit=10'),
+            ('профиль', reverse('posts:profile', args=['author']),
+             reverse('api:profile_posts', args=['author']) + '?limit=10'),
+            ('пост', reverse('posts:post_detail', args=[post.pk]),
+             reverse('api:post_detail', args=[post.pk])),
+            ('лента, 100', None,
+             reverse('api:post_list') + '?limit=100'),
+            ('лента, 100, id и text', None,
+             reverse('api:post_list') + '?limit=100&fields=id,text'),
+        ]
+        rows = []
+        for name, html_url, api_url in pages:
+            row = [name]
+            for url in (html_url, api_url):
+                if url is None:
+                    row.extend(['-'] * 4)
+                    continue
+                samples = []
+                for _ in range(args.repeat):
+                    (size, queries), ms = timed(fetch, client, url)
+                    samples.append(ms)
+                p50, p95 = summary(samples)
+                row.extend([f'{p50:.2f}', f'{p95:.2f}', size, queries])
+            rows.append(row)
+        print_table(
+            ['страница', 'html p50', 'html p95', 'html байт', 'html запр.',
+             'api p50', 'api p95', 'api байт', 'api запр.'],
+            rows,
+        )
+
+        columns, build = serializers.POST.plan(serializers.POST.resolve(''))
+        page = list(Post.objects.order_by('-pub_date', '-id').values_list(
+            *columns
+        )[:100])
+        samples = [
+            timed(serialize_page, page, build)[1]
+            for _ in range(args.repeat)
+        ]
+        p50, p95 = summary(samples)
+        encoder = 'orjson' if serializers.orjson else 'json'
+        print(f'\nСериализация 100 постов ({encoder}): '
+              f'p50 {p50:.2f} мс, p95 {p95:.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
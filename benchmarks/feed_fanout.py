@@ -0,0 +1,125 @@
+"""Сравнение push, pull и гибридной ленты подписок.
+
+Для нескольких распределений числа подписчиков меряет усиление записи
+(строк ``TimelineEntry`` на пост и время публикации) и задержку чтения
+первой страницы ``follow_index``.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.feed_fanout --readers 2000 --posts 200
+"""
+import argparse
+import random
+
+from benchmarks.utils import django_test_db, print_table, summary, timed
+
+PER_PAGE = 10
+
+
+def follow_pairs(distribution, readers, authors, follows, rng):
+    """Пары (читатель, автор) для заданного распределения подписчиков."""
+    weights = {
+        'uniform': [1] * len(authors),
+        'zipf': [1 / (rank + 1) for rank in range(len(authors))],
+        'celebrity': [1] * len(authors),
+    }[distribution]
+    pairs = set()
+    for reader in readers:
+        chosen = rng.choices(authors, weights=weights, k=follows)
+        if distribution == 'celebrity':
+            chosen.append(authors[0])
+        pairs.update((reader.pk, author.pk) for author in chosen)
+    return pairs
+
+
+def run_strategy(threshold, authors, readers, posts, rng):
+    from django.test import override_settings
+    from posts import timeline
+    from posts.models import Post, TimelineEntry
+    from posts.paginators import TimelinePaginator
+
+    Post.objects.all().delete()
+    with override_settings(TIMELINE_PULL_THRESHOLD=threshold):
+        write_ms = []
+        for number in range(posts):
+            author = rng.choice(authors)
+            _, elapsed = timed(
+                Post.objects.create, author=author, text=f'Пост {number}'
+            )
+            write_ms.append(elapsed)
+        rows = TimelineEntry.objects.count()
+
+        def read(reader):
+            entries = TimelineEntry.objects.filter(
+                user=reader
+            ).select_related('post__author', 'post__group')
+            paginator = TimelinePaginator(
+                entries, PER_PAGE, pulled=timeline.pulled_posts(reader.pk)
+            )
+            return paginator.get_page()
+
+        sample = rng.sample(readers, min(100, len(readers)))
+        read_ms = [timed(read, reader)[1] for reader in sample]
+    return rows / posts, summary(write_ms), summary(read_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=2000)
+    parser.add_argument('--authors', type=int, default=50)
+    parser.add_argument('--follows', type=int, default=20,
+                        help='Подписок на одного читателя.')
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--threshold', type=int, default=500,
+                        help='Порог подписчиков для гибридной ленты.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with django_test_db():
+        from django.contrib.auth import get_user_model
+        from posts import counters
+        from posts.models import Follow
+
+        User = get_user_model()
+        rng = random.Random(args.seed)
+        User.objects.bulk_create(
+            User(username=f'author{n}') for n in range(args.authors)
+        )
+        User.objects.bulk_create(
+            User(username=f'reader{n}') for n in range(args.readers)
+        )
+        authors = list(User.objects.filter(username__startswith='author'))
+        readers = list(User.objects.filter(username__startswith='reader'))
+        strategies = {
+            'push': args.readers + 1,
+            'pull': -1,
+            'hybrid': args.threshold,
+        }
+        rows = []
+        for distribution in ('uniform', 'zipf', 'celebrity'):
+            Follow.objects.all().delete()
+            Follow.objects.bulk_create(
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, author_id in follow_pairs(
+                    distribution, readers, authors, args.follows, rng
+                )
+            )
+            counters.reconcile_authors([user.pk for user in authors])
+            for name, threshold in strategies.items():
+                amplification, write, read = run_strategy(
+                    threshold, authors, readers, args.posts, rng
+                )
+                rows.append([
+                    distribution, name, f'{amplification:.1f}',
+                    f'{write[0]:.2f}', f'{write[1]:.2f}',
+                    f'{read[0]:.2f}', f'{read[1]:.2f}',
+                ])
+        print_table(
+            ['распределение', 'лента', 'строк/пост', 'запись p50',
+             'запись p95', 'чтение p50', 'чтение p95'],
+            rows,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Скорость ``manage.py import_content`` против построчного ``create``.
+
+Пишет вход JSONL из постов, комментариев к ним и подписок и грузит его
+на очищенную тестовую базу: построчно через ``objects.create`` с сигналами
+(на части входа), пачками и пачками со снятыми индексами. В строки в
+секунду входит и доводка счетчиков, лент и индекса поиска.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.import_content --posts 100000 --db /tmp/import.sqlite3
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from io import StringIO
+
+from benchmarks.utils import django_test_db, print_table
+
+
+def write_input(path, posts, comments, follows, authors, groups):
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8') as file:
+        def write(row):
+            file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+        for number in range(posts):
+            write({
+                'kind': 'post', 'id': number,
+                'author': f'author{rng.randrange(authors)}',
+                'group': f'group-{rng.randrange(groups)}',
+                'text': f'Пост {number} о море, степи и дороге',
+                'pub_date': '2020-01-01T12:00:00',
+            })
+            for _ in range(comments):
+                write({
+                    'kind': 'comment', 'post': number,
+                    'author': f'author{rng.randrange(authors)}',
+                    'text': f'Ответ на пост {number}',
+                    'created': '2020-01-02T12:00:00',
+                })
+        for _ in range(follows):
+            write({
+                'kind': 'follow', 'user': f'author{rng.randrange(authors)}',
+                'author': f'author{rng.randrange(authors)}',
+            })
+
+
+def prepare(authors, groups):
+    from django.contrib.auth import get_user_model
+    from posts.models import Group
+
+    User = get_user_model()
+    for number in range(authors):
+        User.objects.create_user(username=f'author{number}')
+    Group.objects.bulk_create(
+        Group(title=f'Группа {number}', slug=f'group-{number}',
+              description='') for number in range(groups)
+    )
+
+
+def one_by_one(path, limit):
+    """Построчная загрузка с сигналами; возвращает число строк."""
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from posts.importer import parse_date, read_rows
+    from posts.models import Comment, Follow, Group, Post
+
+    users = dict(get_user_model().objects.values_list('username', 'pk'))
+    groups = dict(Group.objects.values_list('slug', 'pk'))
+    posts = {}
+    count = 0
+    with transaction.atomic():
+        for row in read_rows(path):
+            if count == limit:
+                break
+            count += 1
+            if row['kind'] == 'post':
+                posts[row['id']] = Post.objects.create(
+                    author_id=users[row['author']],
+                    group_id=groups[row['group']], text=row['text'],
+                    pub_date=parse_date(row['pub_date']),
+                ).pk
+            elif row['kind'] == 'comment':
+                Comment.objects.create(
+                    post_id=posts[row['post']],
+                    author_id=users[row['author']], text=row['text'],
+                )
+            elif row['user'] != row['author']:
+                Follow.objects.get_or_create(
+                    user_id=users[row['user']],
+                    author_id=users[row['author']],
+                )
+    return count
+
+
+def chunked(path, **options):
+    from django.core.management import call_command
+
+    output = StringIO()
+    call_command('import_content', path, stdout=output, **options)
+    with open(f'{path}.checkpoint', encoding='utf-8') as file:
+        rows = json.load(file)['row']
+    os.remove(f'{path}.checkpoint')
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=2,
+                        help='Комментариев на пост.')
+    parser.add_argument('--follows', type=int, default=10000)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--one-by-one', type=int, default=20000,
+                        help='Сколько строк грузить построчно.')
+    parser.add_argument('--db', default=None,
+                        help='Файл тестовой базы, для больших корпусов.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'input.jsonl')
+    write_input(path, args.posts, args.comments, args.follows,
+                args.authors, args.groups)
+    modes = {
+        'create() по строке': lambda: one_by_one(path, args.one_by_one),
+        'import_content': lambda: chunked(
+            path, chunk_size=args.chunk_size
+        ),
+        'import_content --defer-indexes': lambda: chunked(
+            path, chunk_size=args.chunk_size, defer_indexes=True
+        ),
+    }
+    rows = []
+    try:
+        with django_test_db(args.db):
+            from django.core.management import call_command
+
+            for name, load in modes.items():
+                call_command('flush', interactive=False, verbosity=0)
+                prepare(args.authors, args.groups)
+                start = time.perf_counter()
+                count = load()
+                elapsed = time.perf_counter() - start
+                rows.append([name, count, f'{elapsed:.1f}',
+                             f'{count / elapsed:.0f}'])
+    finally:
+        os.remove(path)
+        os.rmdir(directory)
+    print_table(['способ', 'строк', 'секунд', 'строк/с'], rows)
+
+
+if __name__ == '__main__':
+    main()
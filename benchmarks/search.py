@@ -0,0 +1,143 @@
+"""Задержка поиска по индексу FTS5 против ``text__icontains``.
+
+Заполняет тестовую базу корпусом постов (по умолчанию миллион) и
+комментариев из слов с частотами по Ципфу и меряет первую страницу выдачи:
+глобальный поиск, поиск в группе и в записях автора. Для каждого
+запроса считается и ``count()`` для паджинатора.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.search --posts 1000000 --db /tmp/search.sqlite3
+"""
+import argparse
+import itertools
+import random
+
+from benchmarks.utils import django_test_db, print_table, summary, timed
+
+# Частоты слов в корпусе убывают по закону Ципфа, как в живом тексте:
+# запросы берут частое слово, слово середины словаря и редкое.
+WORDS = [
+    'война', 'мир', 'сад', 'степь', 'море', 'город', 'поезд', 'письмо',
+    'осень', 'снег', 'дорога', 'дом', 'река', 'лес', 'ночь', 'утро',
+    'чайка', 'вишня', 'театр', 'бал', 'охота', 'деревня', 'музыка',
+    'портрет', 'свеча', 'мост', 'окно', 'зеркало', 'песня', 'облако',
+] + [f'слово{number}' for number in range(20000)]
+WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+QUERIES = ('война', 'вишн', 'слово500', 'слово15000')
+CHUNK = 10000
+
+
+def fill(posts, comments, authors, groups):
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from posts.models import Comment, Group, Post
+
+    rng = random.Random(0)
+    cumulative = list(itertools.accumulate(WEIGHTS))
+    User = get_user_model()
+    # SQLite не возвращает ключи из bulk_create: перечитываем строки.
+    User.objects.bulk_create(
+        User(username=f'author{number}') for number in range(authors)
+    )
+    Group.objects.bulk_create(
+        Group(title=f'Группа {number}', slug=f'group-{number}',
+              description='') for number in range(groups)
+    )
+    authors = list(User.objects.order_by('pk'))
+    groups = list(Group.objects.order_by('pk'))
+
+    def text(size):
+        return ' '.join(rng.choices(WORDS, cum_weights=cumulative, k=size))
+
+    for start in range(0, posts, CHUNK):
+        with transaction.atomic():
+            Post.objects.bulk_create(
+                Post(author=rng.choice(authors), group=rng.choice(groups),
+                     text=text(30))
+                for _ in range(min(CHUNK, posts - start))
+            )
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    for start in range(0, comments, CHUNK):
+        with transaction.atomic():
+            Comment.objects.bulk_create(
+                Comment(post_id=rng.choice(post_ids),
+                        author=rng.choice(authors), text=text(8))
+                for _ in range(min(CHUNK, comments - start))
+            )
+    return authors[0], groups[0]
+
+
+def first_page(results):
+    from django.core.paginator import Paginator
+
+    page = Paginator(results, 10).get_page(1)
+    return list(page.object_list)
+
+
+def scan(query, group=None, author=None):
+    from posts.models import Post
+
+    results = Post.objects.select_related('author', 'group').filter(
+        text__icontains=query
+    )
+    if group is not None:
+        results = results.filter(group=group)
+    if author is not None:
+        results = results.filter(author=author)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--comments', type=int, default=None,
+                        help='Комментариев, по умолчанию вдвое больше '
+                             'постов.')
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', default=None,
+                        help='Файл тестовой базы, для больших корпусов.')
+    args = parser.parse_args()
+    comments = args.posts * 2 if args.comments is None else args.comments
+
+    with django_test_db(args.db):
+        from posts import search
+
+        (author, group), fill_ms = timed(
+            fill, args.posts, comments, args.authors, args.groups
+        )
+        _, rebuild_ms = timed(search.rebuild)
+        print(f'Корпус: {args.posts} постов, {comments} комментариев, '
+              f'заполнение {fill_ms / 1000:.1f} с, '
+              f'пересборка индекса {rebuild_ms / 1000:.1f} с')
+        scopes = {
+            'все': {},
+            'группа': {'group': group},
+            'автор': {'author': author},
+        }
+        rows = []
+        for query in QUERIES:
+            for scope, filters in scopes.items():
+                medians = []
+                for make in (search.SearchResults, scan):
+                    samples = [
+                        timed(first_page, make(query, **filters))[1]
+                        for _ in range(args.repeat)
+                    ]
+                    medians.append(summary(samples))
+                rows.append([
+                    query, scope,
+                    search.SearchResults(query, **filters).count(),
+                    *(f'{value:.1f}' for pair in medians for value in pair),
+                ])
+        print_table(
+            ['запрос', 'где', 'найдено', 'fts5 p50', 'fts5 p95',
+             'icontains p50', 'icontains p95'],
+            rows,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Время рендера ленты шаблонами Django и Jinja2.
+
+Рендерит ``posts/index.html`` для страниц из 10, 50 и 100 постов
+с холодным кэшем фрагментов и карточек, чтобы мерить сами шаблоны,
+а не попадания в кэш. Запросы к базе сделаны до замера.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.template_render --repeat 50
+"""
+import argparse
+
+from benchmarks.utils import django_test_db, print_table, summary, timed
+
+PAGE_SIZES = (10, 50, 100)
+ENGINES = ('django', 'jinja2')
+
+
+def page_context(size):
+    from posts import fragments
+    from posts.models import Post
+    from posts.paginators import FeedPaginator
+    from posts.previews import attach_comment_previews
+
+    posts = Post.objects.select_related('author', 'group')
+    page_obj = FeedPaginator(posts, size, scope=fragments.FEED).get_page()
+    attach_comment_previews(page_obj.object_list)
+    for post in page_obj.object_list:
+        # Превью загружаются заранее: меряем шаблон, а не запросы.
+        post.latest_comments()
+    return {
+        'page_obj': page_obj,
+        'generation': fragments.version(fragments.FEED),
+    }
+
+
+def render_cold(template, context, request):
+    from django.core.cache import cache
+
+    cache.clear()
+    return template.render(context, request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--comments', type=int, default=3,
+                        help='Комментариев на пост.')
+    args = parser.parse_args()
+
+    with django_test_db():
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import AnonymousUser
+        from django.template.loader import get_template
+        from django.test import RequestFactory
+        from posts.models import Comment, Group, Post
+
+        User = get_user_model()
+        author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        posts = Post.objects.bulk_create(
+            Post(author=author, group=group if number % 2 else None,
+                 text=f'Текст поста номер {number}. ' * 20)
+            for number in range(max(PAGE_SIZES))
+        )
+        Comment.objects.bulk_create(
+            Comment(post=post, author=author, text=f'Комментарий {number}')
+            for post in posts for number in range(args.comments)
+        )
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        rows = []
+        for size in PAGE_SIZES:
+            context = page_context(size)
+            medians = {}
+            for engine in ENGINES:
+                template = get_template('posts/index.html', using=engine)
+                samples = [
+                    timed(render_cold, template, context, request)[1]
+                    for _ in range(args.repeat)
+                ]
+                medians[engine] = summary(samples)
+            rows.append([
+                size,
+                *(f'{value:.2f}' for engine in ENGINES
+                  for value in medians[engine]),
+                f'{medians["django"][0] / medians["jinja2"][0]:.1f}x',
+            ])
+        print_table(
+            ['постов', 'django p50', 'django p95', 'jinja2 p50',
+             'jinja2 p95', 'ускорение'],
+            rows,
+        )
+
+
+if __name__ == '__main__':
+    main()
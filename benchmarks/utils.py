@@ -0,0 +1,58 @@
+"""Общая обвязка для бенчмарков: Django на тестовой базе и замеры."""
+import contextlib
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'yatube'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+
+@contextlib.contextmanager
+def django_test_db(name=None):
+    """Поднимает Django на отдельной тестовой базе и удаляет ее после.
+
+    ``name`` — файл тестовой базы SQLite: по умолчанию она в памяти,
+    что тесно для корпусов в миллионы строк.
+    """
+    import django
+    django.setup()
+    from django.db import connection
+    if name:
+        connection.settings_dict['TEST']['NAME'] = name
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timed(func, *args, **kwargs):
+    """Возвращает результат вызова и его длительность в миллисекундах."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def summary(samples):
+    """Медиана и 95-й перцентиль выборки в миллисекундах."""
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples), p95
+
+
+def print_table(header, rows):
+    widths = [
+        max(len(str(cell)) for cell in column)
+        for column in zip(header, *rows)
+    ]
+    for row in [header] + rows:
+        print('  '.join(
+            str(cell).rjust(width) for cell, width in zip(row, widths)
+        ))
@@ -0,0 +1,22 @@
+from urllib.parse import urlsplit
+
+import pytest
+from django.core.cache import cache
+from django.urls import resolve
+
+
+@pytest.fixture
+def assert_query_budget(django_assert_max_num_queries):
+    """Запрашивает страницу и проверяет бюджет запросов ее view."""
+    def check(client, url):
+        view = resolve(urlsplit(url).path).func
+        budget = getattr(view, 'query_budget', None)
+        assert budget is not None, (
+            f'Объявите бюджет запросов `@query_budget` для view страницы `{url}`'
+        )
+        cache.clear()
+        with django_assert_max_num_queries(budget) as context:
+            response = client.get(url)
+        assert response.status_code == 200, f'Страница `{url}` недоступна'
+        return len(context.captured_queries)
+    return check
@@ -0,0 +1,51 @@
+import pytest
+from mixer.backend.django import mixer
+
+from posts.models import Comment, Follow, Post
+
+pytestmark = [pytest.mark.django_db]
+
+
+def feed_urls(post):
+    return [
+        '/',
+        f'/group/{post.group.slug}/',
+        f'/profile/{post.author.username}/',
+        '/follow/',
+        f'/posts/{post.id}/',
+    ]
+
+
+def blend_posts(user, author, group, count):
+    posts = mixer.cycle(count).blend(
+        Post, author=author, group=group, image=''
+    )
+    for post in posts:
+        mixer.blend(Comment, post=post, author=user)
+    return posts[-1]
+
+
+class TestQueryBudget:
+
+    def test_feed_views_within_budget(
+            self, user_client, user, another_user, group,
+            assert_query_budget):
+        Follow.objects.create(user=user, author=another_user)
+        post = blend_posts(user, another_user, group, 10)
+        for url in feed_urls(post):
+            assert_query_budget(user_client, url)
+
+    def test_queries_do_not_grow_with_page_size(
+            self, user_client, user, another_user, group,
+            assert_query_budget):
+        Follow.objects.create(user=user, author=another_user)
+        post = blend_posts(user, another_user, group, 1)
+        counts = [assert_query_budget(user_client, url)
+                  for url in feed_urls(post)]
+        post = blend_posts(user, another_user, group, 9)
+        assert [
+            assert_query_budget(user_client, url) for url in feed_urls(post)
+        ] == counts, (
+            'Проверьте, что число запросов страниц не растет вместе '
+            'с числом постов на странице'
+        )
@@ -0,0 +1,154 @@
+"""Сериализация ресурсов API прямо из строк ``values_list``.
+
+Модели не создаются: для набора полей из ``?fields=`` один раз
+собирается план — список колонок и функция, раскладывающая кортеж
+строки в словарь. Автор и группа встраиваются из колонок того же
+запроса через JOIN, поэтому страница любого размера стоит одного
+запроса. Поля встроенных объектов запрашиваются через точку:
+``?fields=id,text,author.username``; имя объекта без точки отдает
+все его поля.
+"""
+import functools
+import json
+
+from core.storage import content_storage
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+
+class FieldError(ValueError):
+    """В ``?fields=`` запрошено поле, которого у ресурса нет."""
+
+
+def isoformat(value):
+    return value.isoformat()
+
+
+def media_url(name):
+    return content_storage.url(name) if name else None
+
+
+USER = {
+    'id': 'id',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+}
+GROUP = {
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+}
+
+
+class Resource:
+    """Поля ресурса: имя в ответе → колонка модели.
+
+    ``embedded`` — встроенные объекты: имя → (внешний ключ, поля
+    объекта). ``null`` у объекта, когда внешний ключ пуст.
+    """
+
+    def __init__(self, fields, embedded=None, converters=None):
+        self.fields = fields
+        self.embedded = embedded or {}
+        self.converters = converters or {}
+
+    def resolve(self, requested):
+        """Разбирает ``?fields=`` в кортеж имен полей ответа."""
+        if not requested:
+            names = list(self.fields)
+            for name, (_, fields) in self.embedded.items():
+                names.extend(f'{name}.{field}' for field in fields)
+            return tuple(names)
+        names = []
+        for name in requested.split(','):
+            name = name.strip()
+            if name in self.embedded:
+                names.extend(
+                    f'{name}.{field}' for field in self.embedded[name][1]
+                )
+                continue
+            embedded, _, field = name.partition('.')
+            if field and field in self.embedded.get(embedded, ('', ()))[1]:
+                names.append(name)
+            elif name in self.fields:
+                names.append(name)
+            else:
+                raise FieldError(name)
+        return tuple(dict.fromkeys(names))
+
+    @functools.lru_cache(maxsize=256)
+    def plan(self, names):
+        """Колонки для ``values_list`` и функция сборки словаря."""
+        flat = [name for name in names if '.' not in name]
+        columns = [self.fields[name] for name in flat]
+        objects = []
+        for embedded, (foreign_key, fields) in self.embedded.items():
+            keys = [
+                name.partition('.')[2] for name in names
+                if name.partition('.')[0] == embedded
+            ]
+            if not keys:
+                continue
+            start = len(columns)
+            columns.extend(f'{embedded}__{fields[key]}' for key in keys)
+            columns.append(foreign_key)
+            objects.append((embedded, keys, start, len(columns) - 1))
+        converters = [
+            (name, convert) for name, convert in self.converters.items()
+            if name in flat
+        ]
+        count = len(flat)
+
+        def build(row):
+            item = dict(zip(flat, row[:count]))
+            for embedded, keys, start, null in objects:
+                item[embedded] = (
+                    None if row[null] is None
+                    else dict(zip(keys, row[start:null]))
+                )
+            for name, convert in converters:
+                value = item[name]
+                if value is not None:
+                    item[name] = convert(value)
+            return item
+
+        return tuple(columns), build
+
+
+POST = Resource(
+    {
+        'id': 'id',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'image': 'image',
+        'comments_count': 'comments_count',
+    },
+    embedded={
+        'author': ('author_id', USER),
+        'group': ('group_id', GROUP),
+    },
+    converters={'pub_date': isoformat, 'image': media_url},
+)
+
+COMMENT = Resource(
+    {
+        'id': 'id',
+        'post': 'post_id',
+        'text': 'text',
+        'created': 'created',
+    },
+    embedded={'author': ('author_id', USER)},
+    converters={'created': isoformat},
+)
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':')
+    ).encode()
@@ -0,0 +1,152 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    '''JSON API отдает ленты курсором, с встроенными автором и группой
+       за один запрос на страницу.'''
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='leo', first_name='Лев', last_name='Толстой'
+        )
+        self.group = Group.objects.create(
+            title='Проза', slug='prose', description='Описание'
+        )
+        self.posts = [
+            Post.objects.create(
+                author=self.author, text=f'Пост {number}',
+                group=self.group if number % 2 else None,
+            )
+            for number in range(5)
+        ]
+        self.client = Client()
+
+    def get(self, url, params=None, status=200, **headers):
+        response = self.client.get(url, params, **headers)
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response
+
+    def test_feed_embeds_author_and_group(self):
+        data = self.get(reverse('api:post_list')).json()
+        self.assertIsNone(data['next'])
+        first, second = data['results'][:2]
+        self.assertEqual(first['id'], self.posts[-1].pk)
+        self.assertEqual(first['text'], 'Пост 4')
+        self.assertIsNone(first['group'])
+        self.assertEqual(second['group'], {
+            'id': self.group.pk, 'slug': 'prose', 'title': 'Проза'
+        })
+        self.assertEqual(first['author'], {
+            'id': self.author.pk, 'username': 'leo',
+            'first_name': 'Лев', 'last_name': 'Толстой',
+        })
+        self.assertEqual(
+            first['pub_date'], self.posts[-1].pub_date.isoformat()
+        )
+        self.assertIsNone(first['image'])
+
+    def test_json_without_orjson_is_the_same(self):
+        url = reverse('api:post_list')
+        content = self.get(url).content
+        with mock.patch('api.serializers.orjson', None):
+            self.assertEqual(self.get(url).content, content)
+
+    def test_cursor_walks_the_feed(self):
+        url, seen = reverse('api:post_list') + '?limit=2', []
+        while url:
+            data = self.get(url).json()
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next']
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+    def test_sparse_fields(self):
+        data = self.get(
+            reverse('api:post_list'), {'fields': 'id,author.username,group'}
+        ).json()
+        self.assertEqual(data['results'][1], {
+            'id': self.posts[3].pk,
+            'author': {'username': 'leo'},
+            'group': {'id': self.group.pk, 'slug': 'prose', 'title': 'Проза'},
+        })
+        response = self.get(
+            reverse('api:post_list'), {'fields': 'id,author.password'},
+            status=400,
+        )
+        self.assertIn('author.password', response.json()['error'])
+
+    def test_bad_limit_and_cursor(self):
+        self.get(reverse('api:post_list'), {'limit': 1000}, status=400)
+        self.get(reverse('api:post_list'), {'limit': 'x'}, status=400)
+        self.get(reverse('api:post_list'), {'cursor': 'junk'}, status=400)
+
+    def test_page_is_one_query(self):
+        for number in range(40):
+            Post.objects.create(
+                author=User.objects.create_user(username=f'user{number}'),
+                group=self.group, text='Еще',
+            )
+        for url in (reverse('api:post_list'),
+                    reverse('api:group_posts', args=['prose']),
+                    reverse('api:profile_posts', args=['leo'])):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as context:
+                    data = self.get(url, {'limit': 100}).json()
+                self.assertTrue(data['results'])
+                selects = [
+                    query for query in context.captured_queries
+                    if 'posts_post' in query['sql']
+                ]
+                self.assertEqual(len(selects), 1)
+
+    def test_group_profile_detail_and_comments(self):
+        data = self.get(reverse('api:group_posts', args=['prose'])).json()
+        self.assertEqual(len(data['results']), 2)
+        data = self.get(reverse('api:profile_posts', args=['leo'])).json()
+        self.assertEqual(len(data['results']), 5)
+        self.get(reverse('api:group_posts', args=['missing']), status=404)
+        self.get(reverse('api:profile_posts', args=['missing']), status=404)
+        post = self.posts[0]
+        Comment.objects.create(post=post, author=self.author, text='Первый')
+        Comment.objects.create(post=post, author=self.author, text='Второй')
+        data = self.get(reverse('api:post_detail', args=[post.pk])).json()
+        self.assertEqual(data['comments_count'], 2)
+        data = self.get(reverse('api:comment_list', args=[post.pk])).json()
+        self.assertEqual(
+            [comment['text'] for comment in data['results']],
+            ['Второй', 'Первый'],
+        )
+        self.assertEqual(data['results'][0]['post'], post.pk)
+        self.get(reverse('api:post_detail', args=[0]), status=404)
+        self.get(reverse('api:comment_list', args=[0]), status=404)
+
+    def test_etag(self):
+        url = reverse('api:group_posts', args=['prose'])
+        etag = self.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        other = self.get(url, {'limit': 1})['ETag']
+        self.assertNotEqual(etag, other)
+        Post.objects.create(author=self.author, group=self.group, text='Новый')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    @override_settings(API_PAGE_SIZE=3)
+    def test_page_size_setting(self):
+        data = self.get(reverse('api:post_list')).json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertIsNotNone(data['next'])
@@ -0,0 +1,207 @@
+"""JSON API v1 только для чтения: ленты, посты и комментарии.
+
+Списки идут курсором по ключу (дата, id), как ленты на сайте, и
+каждая страница — один запрос, см. ``api.serializers``. ETag строится
+по поколениям областей из ``posts.fragments`` и сдвигается при любой
+правке, так что клиент с ``If-None-Match`` получает 304 без запроса
+страницы.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.decorators.http import condition, require_safe
+
+from posts import fragments
+from posts.models import Comment, Group, Post
+from posts.paginators import NEXT, decode_cursor, encode_cursor
+
+from .serializers import COMMENT, POST, FieldError, dumps
+
+User = get_user_model()
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        dumps(data), content_type='application/json', status=status
+    )
+
+
+def api_view(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return json_response({'error': error.message}, error.status)
+    return require_safe(wrapper)
+
+
+def _etag(request, *parts):
+    # Ответ API не зависит от зрителя, только от данных и параметров.
+    raw = '|'.join(map(str, ('api-v1', *parts, request.GET.urlencode())))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _memoized(request, name, load):
+    # ETag и view читают один и тот же ключ области.
+    attribute = f'_api_{name}'
+    if not hasattr(request, attribute):
+        setattr(request, attribute, load())
+    return getattr(request, attribute)
+
+
+def _group_id(request, slug):
+    return _memoized(request, 'group', lambda: Group.objects.filter(
+        slug=slug
+    ).values_list('pk', flat=True).first())
+
+
+def _author_id(request, username):
+    return _memoized(request, 'author', lambda: User.objects.filter(
+        username=username
+    ).values_list('pk', flat=True).first())
+
+
+def _post_version(request, post_id):
+    return _memoized(request, 'post', lambda: Post.objects.filter(
+        pk=post_id
+    ).values_list('version', flat=True).first())
+
+
+def feed_etag(request):
+    return _etag(request, fragments.version(fragments.FEED))
+
+
+def group_etag(request, slug):
+    group_id = _group_id(request, slug)
+    if group_id is None:
+        return None
+    return _etag(request, fragments.version(fragments.group_scope(group_id)))
+
+
+def profile_etag(request, username):
+    author_id = _author_id(request, username)
+    if author_id is None:
+        return None
+    return _etag(
+        request, fragments.version(fragments.author_scope(author_id))
+    )
+
+
+def post_etag(request, post_id):
+    version = _post_version(request, post_id)
+    if version is None:
+        return None
+    return _etag(
+        request, version, fragments.version(fragments.post_scope(post_id))
+    )
+
+
+def _fields(request, resource):
+    try:
+        return resource.resolve(request.GET.get('fields'))
+    except FieldError as error:
+        raise ApiError(f'Неизвестное поле: {error}.')
+
+
+def _limit(request):
+    value = request.GET.get('limit')
+    if value is None:
+        return settings.API_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= settings.API_MAX_PAGE_SIZE:
+        raise ApiError(
+            f'limit — число от 1 до {settings.API_MAX_PAGE_SIZE}.'
+        )
+    return limit
+
+
+def _page(request, queryset, resource, date_field):
+    """Страница списка от курсора и ссылка на следующую."""
+    names = _fields(request, resource)
+    limit = _limit(request)
+    number = 1
+    queryset = queryset.order_by(f'-{date_field}', '-id')
+    if request.GET.get('cursor'):
+        position = decode_cursor(request.GET['cursor'])
+        if position is None or position[0] != NEXT or position[4]:
+            raise ApiError('Неверный курсор.')
+        _, date, pk, number, _ = position
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__lte': date})
+            & (Q(**{f'{date_field}__lt': date}) | Q(id__lt=pk))
+        )
+    columns, build = resource.plan(names)
+    rows = list(queryset.values_list(*columns, date_field, 'id')[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['cursor'] = encode_cursor(NEXT, *rows[-1][-2:], number + 1)
+        next_url = f'{request.path}?{params.urlencode()}'
+    return json_response({
+        'results': [build(row) for row in rows],
+        'next': next_url,
+    })
+
+
+@api_view
+@condition(etag_func=feed_etag)
+def post_list(request):
+    return _page(request, Post.objects.all(), POST, 'pub_date')
+
+
+@api_view
+@condition(etag_func=group_etag)
+def group_posts(request, slug):
+    group_id = _group_id(request, slug)
+    if group_id is None:
+        raise ApiError('Группа не найдена.', 404)
+    return _page(
+        request, Post.objects.filter(group_id=group_id), POST, 'pub_date'
+    )
+
+
+@api_view
+@condition(etag_func=profile_etag)
+def profile_posts(request, username):
+    author_id = _author_id(request, username)
+    if author_id is None:
+        raise ApiError('Автор не найден.', 404)
+    return _page(
+        request, Post.objects.filter(author_id=author_id), POST, 'pub_date'
+    )
+
+
+@api_view
+@condition(etag_func=post_etag)
+def post_detail(request, post_id):
+    columns, build = POST.plan(_fields(request, POST))
+    row = Post.objects.filter(pk=post_id).values_list(*columns).first()
+    if row is None:
+        raise ApiError('Пост не найден.', 404)
+    return json_response(build(row))
+
+
+@api_view
+@condition(etag_func=post_etag)
+def comment_list(request, post_id):
+    if _post_version(request, post_id) is None:
+        raise ApiError('Пост не найден.', 404)
+    return _page(
+        request, Comment.objects.filter(post_id=post_id), COMMENT, 'created'
+    )
@@ -0,0 +1,277 @@
+import os
+import pickle
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import registry
+
+try:
+    import lz4.frame
+except ImportError:  # lz4 — необязательная зависимость
+    lz4 = None
+
+RAW, ZLIB, LZ4 = b'r', b'z', b'l'
+# Накладные расходы словаря и кортежа на запись, кроме ключа и данных.
+ENTRY_OVERHEAD = 200
+COUNTERS = ('hits', 'misses', 'evictions', 'raw_bytes', 'stored_bytes')
+# Реестр ключей снимков (см. registry): слот воркера живет столько же,
+# сколько его снимок, и освобожденные номера занимают новые воркеры.
+SNAPSHOTS_KEY = 'cache-memory:snapshots'
+
+# Хранилища общие для потоков процесса, как у LocMemCache.
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class _Store:
+    def __init__(self):
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.used = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.published = 0
+        self.slot = None
+
+
+class BoundedMemoryCache(BaseCache):
+    """Кэш процесса, ограниченный по байтам, со сжатием и LRU.
+
+    В отличие от LocMemCache, который считает записи, здесь считается
+    объем: сумма сериализованных значений, ключей и накладных расходов
+    не превышает ``MAX_BYTES``, лишнее вытесняется с давно не читанного
+    конца. Значения от ``COMPRESS_MIN_SIZE`` байт сжимаются zlib или lz4
+    (``COMPRESSOR``), если это их уменьшает. Снимок статистики раз в
+    ``PUBLISH_INTERVAL`` секунд кладется в кэш ``STATS_CACHE``, откуда
+    его читают команда ``cache_stats`` и страница статистики.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.name = name or 'default'
+        self.max_bytes = options.get('MAX_BYTES', 32 * 1024 * 1024)
+        self.compress_min_size = options.get('COMPRESS_MIN_SIZE', 1024)
+        self.compressor = options.get('COMPRESSOR', 'zlib')
+        if self.compressor not in ('zlib', 'lz4'):
+            raise ImproperlyConfigured(
+                f'Unknown cache compressor {self.compressor!r}.'
+            )
+        if self.compressor == 'lz4' and lz4 is None:
+            raise ImproperlyConfigured('COMPRESSOR lz4 requires lz4.')
+        self.stats_alias = options.get('STATS_CACHE')
+        self.publish_interval = options.get('PUBLISH_INTERVAL', 10)
+        with _stores_lock:
+            self._store = _stores.setdefault(self.name, _Store())
+
+    def _dumps(self, value):
+        raw = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(raw) < self.compress_min_size:
+            return RAW + raw, len(raw)
+        if self.compressor == 'lz4':
+            packed = LZ4 + lz4.frame.compress(raw)
+        else:
+            packed = ZLIB + zlib.compress(raw, 1)
+        if len(packed) >= len(raw) + 1:
+            return RAW + raw, len(raw)
+        return packed, len(raw)
+
+    @staticmethod
+    def _loads(payload):
+        kind, data = payload[:1], payload[1:]
+        if kind == ZLIB:
+            data = zlib.decompress(data)
+        elif kind == LZ4:
+            data = lz4.frame.decompress(data)
+        return pickle.loads(data)
+
+    @staticmethod
+    def _size(key, payload):
+        return len(key) + len(payload) + ENTRY_OVERHEAD
+
+    # Методы с подчеркиванием вызываются под блокировкой хранилища.
+
+    def _live(self, key):
+        entry = self._store.data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.time():
+            self._delete(key)
+            return None
+        return entry
+
+    def _delete(self, key):
+        store = self._store
+        entry = store.data.pop(key, None)
+        if entry is None:
+            return False
+        _, payload, raw_size = entry
+        store.used -= self._size(key, payload)
+        store.counters['raw_bytes'] -= raw_size
+        store.counters['stored_bytes'] -= len(payload)
+        return True
+
+    def _set(self, key, value, expires):
+        payload, raw_size = self._dumps(value)
+        store = self._store
+        self._delete(key)
+        size = self._size(key, payload)
+        if size > self.max_bytes:
+            return False
+        while store.used + size > self.max_bytes:
+            oldest = next(iter(store.data))
+            self._delete(oldest)
+            store.counters['evictions'] += 1
+        store.data[key] = (expires, payload, raw_size)
+        store.used += size
+        store.counters['raw_bytes'] += raw_size
+        store.counters['stored_bytes'] += len(payload)
+        return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._store.lock:
+            if self._live(key) is not None:
+                return False
+            return self._set(key, value, self.get_backend_timeout(timeout))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        store = self._store
+        with store.lock:
+            entry = self._live(key)
+            if entry is None:
+                store.counters['misses'] += 1
+            else:
+                store.counters['hits'] += 1
+                store.data.move_to_end(key)
+        self._maybe_publish()
+        if entry is None:
+            return default
+        return self._loads(entry[1])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._store.lock:
+            self._set(key, value, self.get_backend_timeout(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._store.lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._store.data[key] = (
+                self.get_backend_timeout(timeout), *entry[1:]
+            )
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._store.lock:
+            entry = self._live(key)
+            if entry is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._loads(entry[1]) + delta
+            self._set(key, value, entry[0])
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._store.lock:
+            return self._delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._store.lock:
+            return self._live(key) is not None
+
+    def clear(self):
+        store = self._store
+        with store.lock:
+            store.data.clear()
+            store.used = 0
+            store.counters['raw_bytes'] = store.counters['stored_bytes'] = 0
+
+    def stats(self):
+        """Счетчики хранилища этого процесса."""
+        store = self._store
+        with store.lock:
+            stats = dict(store.counters)
+            stats.update(
+                entries=len(store.data), used_bytes=store.used,
+                max_bytes=self.max_bytes,
+            )
+        return stats
+
+    def _maybe_publish(self):
+        store = self._store
+        now = time.monotonic()
+        if not self.stats_alias or now - store.published < (
+            self.publish_interval
+        ):
+            return
+        store.published = now
+        stats_cache = caches[self.stats_alias]
+        key = f'cache-memory:{self.name}:{socket.gethostname()}:{os.getpid()}'
+        # Снимок живет несколько интервалов: остановленный воркер пропадет.
+        timeout = max(self.publish_interval * 3, 60)
+        stats_cache.set(key, self.stats(), timeout)
+        slot = store.slot
+        if (slot is None or stats_cache.get(slot) != key
+                or not stats_cache.touch(slot, timeout)):
+            store.slot = registry.register(
+                stats_cache, SNAPSHOTS_KEY, key, timeout
+            )
+
+
+def collect_stats(alias):
+    """Сводка опубликованных снимков по кэшу ``alias`` всех воркеров."""
+    stats_cache = caches[alias]
+    snapshots = stats_cache.get_many(
+        registry.members(stats_cache, SNAPSHOTS_KEY)
+    )
+    by_cache = {}
+    for key, snapshot in snapshots.items():
+        name = key.split(':')[1]
+        total = by_cache.setdefault(name, {'workers': 0})
+        total['workers'] += 1
+        for counter, value in snapshot.items():
+            if counter == 'max_bytes':
+                total[counter] = value
+            else:
+                total[counter] = total.get(counter, 0) + value
+    for total in by_cache.values():
+        requests = total.get('hits', 0) + total.get('misses', 0)
+        total['hit_ratio'] = total.get('hits', 0) / requests if requests else 0
+        stored = total.get('stored_bytes', 0)
+        total['compression_ratio'] = (
+            total.get('raw_bytes', 0) / stored if stored else 1
+        )
+    return by_cache
+
+
+def memory_stats():
+    """Сводки всех кэшей с ограничением по байтам из ``CACHES``."""
+    aliases = {
+        caches[alias].stats_alias for alias in settings.CACHES
+        if isinstance(caches[alias], BoundedMemoryCache)
+    }
+    stats = {}
+    for alias in sorted(filter(None, aliases)):
+        stats.update(collect_stats(alias))
+    return stats
@@ -0,0 +1,41 @@
+"""Реестр значений в кэше без чтения-изменения-записи.
+
+Каждое значение лежит в своем слоте ``<name>:<номер>``, а слот
+занимается через ``add``, поэтому воркеры не затирают друг друга.
+Счетчик ``<name>`` хранит наибольший выданный номер. Новый слот берется
+только тогда, когда все слоты до счетчика заняты: освобожденные по сроку
+номера переиспользуются, и реестр не растет с перезапусками воркеров.
+"""
+
+
+def _slot(name, number):
+    return f'{name}:{number}'
+
+
+def _slots(cache, name):
+    count = cache.get(name) or 0
+    return [_slot(name, number) for number in range(1, count + 1)]
+
+
+def register(cache, name, value, timeout=None):
+    """Кладет ``value`` в свободный слот реестра и возвращает его ключ."""
+    slots = _slots(cache, name)
+    taken = cache.get_many(slots)
+    for slot in slots:
+        if slot not in taken and cache.add(slot, value, timeout):
+            return slot
+    while True:
+        try:
+            number = cache.incr(name)
+        except ValueError:
+            # Счетчик пропал вместе с очисткой кэша: слоты тоже.
+            cache.add(name, 0, None)
+            continue
+        slot = _slot(name, number)
+        if cache.add(slot, value, timeout):
+            return slot
+
+
+def members(cache, name):
+    """Значения живых слотов реестра."""
+    return list(cache.get_many(_slots(cache, name)).values())
@@ -0,0 +1,272 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'YTBCACHE'
+HEADER = struct.Struct('<8sIII')
+HEADER_SIZE = 64
+# Слот: md5 ключа, срок жизни, время последнего обращения в наносекундах
+# (секунд мало, чтобы различить соседние чтения), длина данных.
+SLOT = struct.Struct('<16sdqI')
+FOREVER = float('inf')
+
+# Отображения открываются по одному на процесс и путь, как общие
+# словари LocMemCache: экземпляры бэкенда Django создает на поток.
+_mappings = {}
+_mappings_lock = threading.Lock()
+
+
+class _Mapping:
+    def __init__(self, path, slot_size, ways, sets):
+        self.slot_size = slot_size
+        self.ways = ways
+        self.sets = sets
+        self.size = HEADER_SIZE + sets * ways * slot_size
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        geometry = HEADER.pack(MAGIC, slot_size, ways, sets)
+        while True:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            with self.locked(0, 0):
+                if not self._replaced(path):
+                    if os.pread(self.fd, HEADER.size, 0) != geometry:
+                        self._create(path, geometry)
+                    else:
+                        self.map = mmap.mmap(self.fd, self.size)
+                        return
+            # Файл подменен нами или соседом, пока ждали блокировку.
+            os.close(self.fd)
+
+    def _replaced(self, path):
+        try:
+            return os.stat(path).st_ino != os.fstat(self.fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _create(self, path, geometry):
+        # Новый файл или другая геометрия. Старый файл нельзя обрезать
+        # на месте: его держат в памяти другие процессы, и обращение за
+        # новый конец убило бы их SIGBUS. Пустой файл подменяет старый
+        # переименованием, а старые процессы дорабатывают со своим.
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, self.size)
+            os.pwrite(fd, geometry, 0)
+            os.replace(temporary, path)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def locked(self, start, length):
+        # flock между процессами по байтам набора, Lock — между потоками:
+        # блокировки fcntl не разделяют потоки одного процесса.
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+
+    def slot_offset(self, index, way):
+        return HEADER_SIZE + (index * self.ways + way) * self.slot_size
+
+    @contextmanager
+    def bucket(self, digest):
+        index = int.from_bytes(digest[:8], 'little') % self.sets
+        start = self.slot_offset(index, 0)
+        with self.locked(start, self.ways * self.slot_size):
+            yield _Bucket(self, [
+                self.slot_offset(index, way) for way in range(self.ways)
+            ])
+
+
+class _Bucket:
+    """Набор слотов одного хэша; вызывается под блокировкой набора."""
+
+    def __init__(self, mapping, offsets):
+        self.map = mapping.map
+        self.capacity = mapping.slot_size - SLOT.size
+        self.offsets = offsets
+
+    def header(self, offset):
+        return SLOT.unpack_from(self.map, offset)
+
+    def find(self, digest, now):
+        """Смещение живого слота с ключом или None; протухший чистится."""
+        for offset in self.offsets:
+            slot_digest, expires, _, length = self.header(offset)
+            if slot_digest != digest or not length:
+                continue
+            if expires <= now:
+                self.clear(offset)
+                return None
+            return offset
+        return None
+
+    def read(self, offset):
+        digest, expires, _, length = self.header(offset)
+        SLOT.pack_into(
+            self.map, offset, digest, expires, time.time_ns(), length
+        )
+        start = offset + SLOT.size
+        return self.map[start:start + length]
+
+    def write(self, digest, data, expires, now):
+        if len(data) > self.capacity:
+            self.delete(digest, now)
+            return False
+        offset = self.find(digest, now)
+        if offset is None:
+            offset = self._victim(now)
+        SLOT.pack_into(
+            self.map, offset, digest, expires, time.time_ns(), len(data)
+        )
+        start = offset + SLOT.size
+        self.map[start:start + len(data)] = data
+        return True
+
+    def _victim(self, now):
+        # Свободный или протухший слот, иначе давно не читанный (LRU).
+        oldest, oldest_used = None, None
+        for offset in self.offsets:
+            _, expires, used, length = self.header(offset)
+            if not length or expires <= now:
+                return offset
+            if oldest_used is None or used < oldest_used:
+                oldest, oldest_used = offset, used
+        return oldest
+
+    def touch(self, offset, expires):
+        digest, _, used, length = self.header(offset)
+        SLOT.pack_into(self.map, offset, digest, expires, used, length)
+
+    def delete(self, digest, now):
+        offset = self.find(digest, now)
+        if offset is not None:
+            self.clear(offset)
+        return offset is not None
+
+    def clear(self, offset):
+        SLOT.pack_into(self.map, offset, bytes(16), 0, 0, 0)
+
+
+class SharedMemoryCache(BaseCache):
+    """Кэш в отображенном в память файле, общий для процессов машины.
+
+    Файл ``LOCATION`` делится на наборы по ``WAYS`` слотов размером
+    ``SLOT_SIZE``; ключ попадает в набор по своему хэшу, при нехватке
+    места вытесняется давно не читанная запись набора. Объем файла
+    ограничен ``MAX_SIZE``, значение больше слота не кэшируется.
+    Каждая операция идет под блокировкой своего набора, поэтому
+    ``incr`` и ``add`` атомарны между процессами, а ``clear`` и
+    сдвиг поколений сразу видны всем воркерам.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        slot_size = options.get('SLOT_SIZE', 64 * 1024)
+        ways = options.get('WAYS', 8)
+        max_size = options.get('MAX_SIZE', 64 * 1024 * 1024)
+        # Заголовок входит в MAX_SIZE: файл не больше заданного объема.
+        sets = (max_size - HEADER_SIZE) // (slot_size * ways)
+        if sets < 1:
+            raise ImproperlyConfigured(
+                f'MAX_SIZE {max_size} is less than one set of {ways} '
+                f'slots of {slot_size} bytes plus {HEADER_SIZE}.'
+            )
+        with _mappings_lock:
+            mapping = _mappings.get(location)
+            if mapping is None:
+                mapping = _Mapping(location, slot_size, ways, sets)
+                _mappings[location] = mapping
+        self._mapping = mapping
+
+    def _digest(self, key, version):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return hashlib.md5(key.encode()).digest()
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return FOREVER if expires is None else expires
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        digest = self._digest(key, version)
+        data = self._dumps(value)
+        now = time.time()
+        with self._mapping.bucket(digest) as bucket:
+            if bucket.find(digest, now) is not None:
+                return False
+            return bucket.write(digest, data, self._expires(timeout), now)
+
+    def get(self, key, default=None, version=None):
+        digest = self._digest(key, version)
+        now = time.time()
+        with self._mapping.bucket(digest) as bucket:
+            offset = bucket.find(digest, now)
+            if offset is None:
+                return default
+            data = bucket.read(offset)
+        return pickle.loads(data)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        digest = self._digest(key, version)
+        data = self._dumps(value)
+        now = time.time()
+        with self._mapping.bucket(digest) as bucket:
+            bucket.write(digest, data, self._expires(timeout), now)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        digest = self._digest(key, version)
+        with self._mapping.bucket(digest) as bucket:
+            offset = bucket.find(digest, time.time())
+            if offset is None:
+                return False
+            bucket.touch(offset, self._expires(timeout))
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        digest = self._digest(key, version)
+        now = time.time()
+        with self._mapping.bucket(digest) as bucket:
+            offset = bucket.find(digest, now)
+            if offset is None:
+                raise ValueError(f"Key '{key}' not found")
+            _, expires, _, _ = bucket.header(offset)
+            value = pickle.loads(bucket.read(offset)) + delta
+            bucket.write(digest, self._dumps(value), expires, now)
+        return value
+
+    def delete(self, key, version=None):
+        digest = self._digest(key, version)
+        with self._mapping.bucket(digest) as bucket:
+            return bucket.delete(digest, time.time())
+
+    def has_key(self, key, version=None):
+        digest = self._digest(key, version)
+        with self._mapping.bucket(digest) as bucket:
+            return bucket.find(digest, time.time()) is not None
+
+    def clear(self):
+        mapping = self._mapping
+        with mapping.locked(0, 0):
+            for index in range(mapping.sets * mapping.ways):
+                offset = HEADER_SIZE + index * mapping.slot_size
+                SLOT.pack_into(mapping.map, offset, bytes(16), 0, 0, 0)
@@ -0,0 +1,108 @@
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+from . import registry
+
+METRICS = ('hits', 'misses', 'early', 'lock_waits', 'recomputes',
+           'recompute_ms')
+PREFIXES_KEY = 'cache-stats:prefixes'
+
+# Сколько ждать чужой пересчет и как часто проверять его результат.
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+
+def _stats_key(prefix, metric):
+    return f'cache-stats:{prefix}:{metric}'
+
+
+def record(prefix, metric, amount=1):
+    key = _stats_key(prefix, metric)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if cache.add(key, amount, None):
+            _register(prefix)
+        else:
+            cache.incr(key, amount)
+
+
+def _register(prefix):
+    # Префикс заносится в реестр один раз на все свои метрики.
+    if cache.add(f'{PREFIXES_KEY}:{prefix}', 1, None):
+        registry.register(cache, PREFIXES_KEY, prefix)
+
+
+def stats():
+    """Метрики ``get_or_compute`` по каждому префиксу ключей."""
+    prefixes = sorted(set(registry.members(cache, PREFIXES_KEY)))
+    keys = [
+        _stats_key(prefix, metric)
+        for prefix in prefixes for metric in METRICS
+    ]
+    values = cache.get_many(keys)
+    return {
+        prefix: {
+            metric: values.get(_stats_key(prefix, metric), 0)
+            for metric in METRICS
+        }
+        for prefix in prefixes
+    }
+
+
+def _is_fresh(expires, delta, beta):
+    # XFetch: чем ближе срок и чем дороже пересчет, тем вероятнее
+    # пересчитать заранее. log(random()) отрицателен, сдвиг — в будущее.
+    if expires is None:
+        return True
+    return time.time() - delta * beta * math.log(random.random()) < expires
+
+
+def _compute(key, compute, timeout, prefix):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    expires = None if timeout is None else time.time() + timeout
+    cache.set(key, (value, delta, expires), timeout)
+    record(prefix, 'recomputes')
+    record(prefix, 'recompute_ms', round(delta * 1000))
+    return value
+
+
+def get_or_compute(key, compute, timeout, prefix, beta=1.0):
+    """Значение из кэша или результат ``compute()``, посчитанный один раз.
+
+    Промах пересчитывает только тот, кто взял блокировку ``cache.add``,
+    остальные ждут его результат до ``LOCK_TIMEOUT`` секунд. Незадолго
+    до истечения значение с некоторой вероятностью пересчитывается
+    заранее, а остальные в это время получают старое.
+    """
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if _is_fresh(expires, delta, beta) or not cache.add(
+            lock_key, 1, LOCK_TIMEOUT
+        ):
+            record(prefix, 'hits')
+            return value
+        record(prefix, 'early')
+    else:
+        record(prefix, 'misses')
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            record(prefix, 'lock_waits')
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry[0]
+            # Пересчитывающий процесс не успел: считаем сами.
+            return _compute(key, compute, timeout, prefix)
+    try:
+        return _compute(key, compute, timeout, prefix)
+    finally:
+        cache.delete(lock_key)
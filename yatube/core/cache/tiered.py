@@ -0,0 +1,113 @@
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """Двухъярусный кэш: кэш процесса перед общим бэкендом.
+
+    Чтения сначала идут в локальный ярус ``OPTIONS['LOCAL']``, промах
+    дочитывается из общего ``OPTIONS['SHARED']`` (алиасы из ``CACHES``).
+    Все записи уходят в общий ярус и обновляют локальный. Запись живет
+    в процессе не дольше ``LOCAL_TIMEOUT`` секунд: на это время другие
+    процессы могут видеть старое значение, в том числе поколения
+    фрагментов. При ``LOCAL_TIMEOUT = 0`` локальный ярус не используется.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.local_alias = options.get('LOCAL', 'local')
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+
+    @property
+    def local(self):
+        return caches[self.local_alias]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _local_timeout(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.local_timeout
+        return min(self.local_timeout, max(timeout - time.time(), 0))
+
+    def _remember(self, key, value, version, timeout=DEFAULT_TIMEOUT):
+        local_timeout = self._local_timeout(timeout)
+        if local_timeout > 0:
+            self.local.set(key, value, local_timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self._remember(key, value, version, timeout)
+        else:
+            self.local.delete(key, version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        if self.local_timeout:
+            value = self.local.get(key, MISSING, version)
+            if value is not MISSING:
+                return value
+        value = self.shared.get(key, MISSING, version)
+        if value is MISSING:
+            return default
+        self._remember(key, value, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        values = {}
+        if self.local_timeout:
+            values = self.local.get_many(keys, version)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            shared = self.shared.get_many(missing, version)
+            for key, value in shared.items():
+                self._remember(key, value, version)
+            values.update(shared)
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self._remember(key, value, version, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, value, version, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(key, version)
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(key, version)
+        value = self.shared.incr(key, delta, version)
+        self._remember(key, value, version)
+        return value
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version)
+        return self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        self.local.delete_many(keys, version)
+        self.shared.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        if self.local_timeout and self.local.has_key(key, version):
+            return True
+        return self.shared.has_key(key, version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
@@ -0,0 +1,79 @@
+"""Окружение Jinja2 для быстрых шаблонов лент (см. ``yatube/jinja2``).
+
+Повторяет поведение шаблонов Django, на которое они опираются: вывод
+значений с учетом часового пояса и локали, фильтры ``date``,
+``truncatechars`` и ``addclass``, ``url``, ``static`` и ``post_thumbnail``.
+"""
+from django.template import defaultfilters
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.formats import localize
+from django.utils.timezone import template_localtime
+from jinja2 import Environment, Undefined
+from jinja2.ext import Extension
+from jinja2.nodes import CallBlock, List
+
+from core.templatetags.user_filters import addclass
+from posts import fragments
+from posts.cards import attach_cards
+from posts.thumbnails import for_post as post_thumbnail
+
+
+def finalize(value):
+    # Так выводит значения Django: даты в местном времени и по локали.
+    return localize(template_localtime(value))
+
+
+def date(value, arg=None):
+    return defaultfilters.date(template_localtime(value), arg)
+
+
+def url(name, *args, **kwargs):
+    return reverse(name, args=args or None, kwargs=kwargs or None)
+
+
+def post_cards(posts):
+    attach_cards(posts, using='jinja2')
+    return ''
+
+
+class FeedCacheExtension(Extension):
+    """``{% feedcache 'index', generation, page_obj.cursor %}`` для Jinja2.
+
+    Ключ и поколения те же, что у одноименного тега Django.
+    """
+
+    tags = {'feedcache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        vary_on = []
+        while parser.stream.skip_if('comma'):
+            vary_on.append(parser.parse_expression())
+        args.append(List(vary_on))
+        body = parser.parse_statements(['name:endfeedcache'], drop_needle=True)
+        return CallBlock(
+            self.call_method('_render', args), [], [], body
+        ).set_lineno(lineno)
+
+    @staticmethod
+    def _render(name, vary_on, caller):
+        return fragments.cached(name, vary_on, caller)
+
+
+def environment(**options):
+    # Отсутствующая переменная печатается пустой строкой, как в Django,
+    # а не исходным выражением DebugUndefined.
+    options['undefined'] = Undefined
+    options.setdefault('extensions', []).append(FeedCacheExtension)
+    env = Environment(finalize=finalize, **options)
+    env.globals.update(
+        url=url, static=static, post_thumbnail=post_thumbnail,
+        post_cards=post_cards,
+    )
+    env.filters.update(
+        date=date, truncatechars=defaultfilters.truncatechars,
+        addclass=addclass,
+    )
+    return env
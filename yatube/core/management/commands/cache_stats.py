@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import bounded, stampede
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает попадания, ожидания и время пересчетов по префиксам '
+        'и заполнение кэшей процессов.'
+    )
+
+    def handle(self, *args, **options):
+        for prefix, counts in stampede.stats().items():
+            total = counts['hits'] + counts['misses'] + counts['early']
+            ratio = counts['hits'] / total if total else 0
+            recomputes = counts['recomputes']
+            average = counts['recompute_ms'] / recomputes if recomputes else 0
+            self.stdout.write(
+                f'{prefix}: доля попаданий {ratio:.0%}, '
+                f'промахов {counts["misses"]}, '
+                f'ранних пересчетов {counts["early"]}, '
+                f'ожиданий блокировки {counts["lock_waits"]}, '
+                f'пересчетов {recomputes} '
+                f'(в среднем {average:.1f} мс)'
+            )
+        for name, stats in bounded.memory_stats().items():
+            self.stdout.write(
+                f'{name}: воркеров {stats["workers"]}, '
+                f'доля попаданий {stats["hit_ratio"]:.0%}, '
+                f'вытеснений {stats["evictions"]}, '
+                f'занято {stats["used_bytes"]} байт '
+                f'(предел {stats["max_bytes"]} на воркер), '
+                f'записей {stats["entries"]}, '
+                f'сжатие {stats["compression_ratio"]:.1f}x'
+            )
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import storage
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы хранилища по содержимому, на которые нет ссылок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы, сохраненные меньше стольких секунд назад.'
+        )
+
+    def handle(self, *args, **options):
+        removed = storage.collect(storage.content_storage, options['grace'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов без ссылок: {removed}'
+        ))
@@ -0,0 +1,166 @@
+"""Отдача загруженных файлов вместо ``django.views.static.serve``.
+
+Файл не читается в Python целиком: ``FileResponse`` отдается серверу
+через ``wsgi.file_wrapper``, и gunicorn или uWSGI шлют его
+``os.sendfile``. Если перед приложением стоит nginx или Apache,
+``MEDIA_SENDFILE`` передает отдачу им заголовком ``X-Accel-Redirect``
+или ``X-Sendfile``, и воркер освобождается сразу. Поддерживаются
+запросы диапазонов и условные запросы; файлы, названные по содержимому
+(см. ``core.storage``), кэшируются клиентами навсегда.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .storage import is_content_name
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UnsatisfiableRange(Exception):
+    """Диапазон начинается за концом файла: ответ 416."""
+
+
+class RangedFile:
+    """Файл, который читается только в пределах диапазона.
+
+    ``fileno`` остается у файла: сервер с ``sendfile`` начнет с текущей
+    позиции и отправит ``Content-Length`` байт.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Границы ``(start, end)`` из ``Range`` включительно.
+
+    None — отдать файл целиком: заголовка нет, он не разобран или
+    просит несколько диапазонов.
+    """
+    match = RANGE.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or not int(last):
+            return None
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise UnsatisfiableRange
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def file_etag(name, stat_result):
+    # Имя по содержимому уже и есть хэш файла.
+    if is_content_name(name):
+        digest = os.path.splitext(os.path.basename(name))[0]
+        return f'"{digest}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def set_validators(response, name, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if is_content_name(name):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(
+            response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE
+        )
+
+
+def serve(request, name, path):
+    """Ответ с файлом ``path``, доступным в MEDIA_ROOT как ``name``.
+
+    Возвращает None, если это не обычный файл.
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    etag = file_etag(name, stat_result)
+    last_modified = int(stat_result.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = _file_response(request, name, path, stat_result, etag)
+    if response.status_code != 416:
+        set_validators(response, name, etag, last_modified)
+    return response
+
+
+def _file_response(request, name, path, stat_result, etag):
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    handoff = settings.MEDIA_SENDFILE
+    if handoff:
+        # Диапазоны и отдачу берет на себя сервер перед приложением.
+        response = HttpResponse(content_type=content_type)
+        if handoff == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = (
+                settings.MEDIA_SENDFILE_PREFIX + quote(name)
+            )
+        else:
+            response['X-Sendfile'] = path
+        return response
+    size = stat_result.st_size
+    bounds = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None or if_range in (
+        etag, http_date(int(stat_result.st_mtime))
+    ):
+        try:
+            bounds = parse_range(request.META.get('HTTP_RANGE', ''), size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    file = open(path, 'rb')
+    if bounds is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = bounds
+        length = end - start + 1
+        response = FileResponse(
+            RangedFile(file, start, length), status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+from posts import fragments, thumbnails
+
+from .query_budget import QueryBudgetExceeded, QueryCounter
+
+logger = logging.getLogger(__name__)
+
+# Счетчики одного запроса: в кэш ответов они не попадают, иначе каждое
+# попадание отдавало бы цифры того запроса, который заполнил запись.
+DIAGNOSTIC_HEADERS = {'x-query-count', 'x-thumbnails', 'x-page-cache'}
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэш целых ответов для анонимных читателей.
+
+    Работает только для GET/HEAD без cookies, поэтому ответ не зависит
+    от пользователя. Сохраняются лишь ответы, которым view назначила
+    ``cache_tags``; запись действует, пока не сдвинулось поколение ни
+    одного из ее тегов (см. ``posts.fragments``). Попадание отдается
+    до сессий, аутентификации и самой view — без запросов к базе.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable_request(request):
+            return self.get_response(request)
+        key = self.cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            tags, tag_version, status, headers, content = cached
+            if fragments.version(*tags) == tag_version:
+                response = HttpResponse(content, status=status)
+                for header, value in headers:
+                    response[header] = value
+                response['X-Page-Cache'] = 'hit'
+                return response
+        response = self.get_response(request)
+        if self.is_cacheable_response(response):
+            tags = list(response.cache_tags)
+            cache.set(key, (
+                tags, fragments.version(*tags), response.status_code,
+                [
+                    (header, value) for header, value in response.items()
+                    if header.lower() not in DIAGNOSTIC_HEADERS
+                ],
+                response.content,
+            ), settings.PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    @staticmethod
+    def is_cacheable_request(request):
+        return request.method in ('GET', 'HEAD') and not request.COOKIES
+
+    @staticmethod
+    def is_cacheable_response(response):
+        return (
+            response.status_code == 200
+            and getattr(response, 'cache_tags', None)
+            and not response.streaming
+            and not response.cookies
+        )
+
+    @staticmethod
+    def cache_key(request):
+        query = urlencode(sorted(request.GET.lists()), doseq=True)
+        url = f'{request.path}?{query}'
+        return f'page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+class QueryBudgetMiddleware:
+    """Отладочная проверка бюджетов запросов, объявленных у views.
+
+    Включается только при DEBUG. Превышение бюджета пишется в лог,
+    а при ``QUERY_BUDGET_RAISE = True`` прерывает запрос исключением.
+    Фактическое число запросов отдается в заголовке ``X-Query-Count``.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        response['X-Query-Count'] = counter.count
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and counter.count > budget:
+            message = (
+                f'{request.path}: {counter.count} SQL-запросов '
+                f'при бюджете {budget}'
+            )
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+
+class ThumbnailStatsMiddleware:
+    """Счетчики миниатюр за запрос: попадания, заглушки и время поиска.
+
+    Отдаются в заголовке ``X-Thumbnails`` и копятся по имени страницы
+    под префиксом ``thumbnail:<url_name>`` (см. ``manage.py cache_stats``).
+    Время нарезки пишет воркер под префиксом ``thumbnail:worker``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        thumbnails.start_page()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = thumbnails.finish_page()
+        if stats.lookups:
+            response['X-Thumbnails'] = (
+                f'hits={stats.hits}, misses={stats.misses}, ms={stats.ms}'
+            )
+            match = request.resolver_match
+            stats.publish(f'thumbnail:{match.url_name if match else "other"}')
+        return response
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('touched', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['refs', 'touched'], name='media_refs_touched_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import models
+
+
+class MediaFile(models.Model):
+    """Файл в хранилище по содержимому и число ссылок на него."""
+
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refs = models.PositiveIntegerField(default=0)
+    # Сборщик не трогает файлы, которые недавно сохраняли: ссылку
+    # на только что загруженный файл еще могут не успеть записать.
+    touched = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+        indexes = [
+            models.Index(fields=['refs', 'touched'],
+                         name='media_refs_touched_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,32 @@
+import functools
+
+
+class QueryBudgetExceeded(Exception):
+    """View выполнила больше запросов, чем объявила."""
+
+
+def query_budget(max_queries):
+    """Объявляет, сколько SQL-запросов может сделать один запрос к view.
+
+    Бюджет считается на весь HTTP-запрос, включая сессию и пользователя,
+    и не должен зависеть от числа постов на странице. Его проверяют
+    ``core.middleware.QueryBudgetMiddleware`` в режиме DEBUG и тесты.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+class QueryCounter:
+    """Обертка для ``connection.execute_wrapper``, считающая запросы."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
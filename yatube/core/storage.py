@@ -0,0 +1,148 @@
+"""Хранилище загрузок, адресуемое по содержимому.
+
+Файл называется SHA-256 своего содержимого и раскладывается по двум
+уровням каталогов: ``posts/ab/cd/abcd….webp``. Одинаковые загрузки
+ложатся в один файл, а число ссылок на него ведется в ``MediaFile``:
+модели увеличивают и уменьшают его через ``retain`` и ``release``.
+Файлы без ссылок удаляет ``manage.py collect_media`` — не раньше,
+чем через ``MEDIA_GC_GRACE`` секунд после последнего сохранения.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+CONTENT_NAME = re.compile(
+    r'(^|/)(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/'
+    r'(?P=a)(?P=b)[0-9a-f]{60}(\.\w+)?$'
+)
+
+
+def content_name(directory, content, extension):
+    """Имя файла по SHA-256 содержимого, разложенное на два уровня."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    digest = digest.hexdigest()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], digest + extension.lower()
+    )
+
+
+def is_content_name(name):
+    return bool(CONTENT_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """``FileSystemStorage``, называющий файлы по содержимому.
+
+    Каталог из ``upload_to`` сохраняется, имя файла — нет. Повторная
+    загрузка того же содержимого не пишет файл заново.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        name = content_name(
+            directory, content, os.path.splitext(filename)[1]
+        )
+        # Сначала отметка, потом проверка файла: после отметки сборщик
+        # его уже не удалит, а удаление, начатое раньше, закончится до
+        # нее — и файл будет записан заново.
+        touch(name, content.size)
+        if not self.exists(name):
+            name = self._save(name, content)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя по содержимому не получает суффикса: тот же файл и есть
+        # то же содержимое.
+        if is_content_name(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if not is_content_name(name):
+            return super()._save(name, content)
+        # Одинаковое содержимое могут загружать одновременно: файл пишется
+        # под временным именем и атомарно переименовывается, так что
+        # вторая загрузка заменяет его тем же содержимым.
+        directory = posixpath.dirname(name)
+        temporary = super()._save(
+            posixpath.join(directory, f'.{uuid.uuid4().hex}.part'), content
+        )
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+def _media_files():
+    # Модель core грузится лениво: хранилище создается при импорте
+    # моделей, до готовности реестра приложений.
+    from .models import MediaFile
+    return MediaFile.objects
+
+
+def touch(name, size=0):
+    """Отмечает свежее сохранение файла, чтобы сборщик его не тронул."""
+    files = _media_files()
+    if not files.filter(name=name).update(touched=timezone.now()):
+        files.get_or_create(name=name, defaults={'size': size})
+
+
+def retain(name):
+    """Добавляет ссылку на файл."""
+    if name:
+        files = _media_files()
+        if files.filter(name=name).update(refs=F('refs') + 1):
+            return
+        _, created = files.get_or_create(name=name, defaults={'refs': 1})
+        if not created:
+            files.filter(name=name).update(refs=F('refs') + 1)
+
+
+def release(name):
+    """Убирает ссылку на файл; сам файл удалит ``collect``."""
+    if name:
+        _media_files().filter(name=name).update(
+            refs=Greatest(F('refs') - 1, 0)
+        )
+
+
+def collect(storage, grace):
+    """Удаляет файлы без ссылок, не сохранявшиеся ``grace`` секунд.
+
+    Строка удаляется условным DELETE по ``refs=0``: если ссылку успели
+    добавить, файл остается. Файл удаляется в той же транзакции, поэтому
+    ``touch`` одновременного сохранения ждет ее конца и видит, что файла
+    уже нет. Возвращает число удаленных файлов.
+    """
+    files = _media_files()
+    deadline = timezone.now() - timedelta(seconds=grace)
+    removed = 0
+    orphans = files.filter(refs=0, touched__lt=deadline)
+    for pk, name in orphans.values_list('pk', 'name').iterator():
+        with transaction.atomic():
+            deleted, _ = files.filter(
+                pk=pk, refs=0, touched__lt=deadline
+            ).delete()
+            if deleted:
+                storage.delete(name)
+                removed += 1
+    return removed
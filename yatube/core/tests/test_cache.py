@@ -0,0 +1,289 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..cache import bounded, shared_memory, stampede
+from ..cache.bounded import BoundedMemoryCache
+from ..cache.shared_memory import SharedMemoryCache
+
+
+def incr_many(location, options, times):
+    backend = SharedMemoryCache(location, {'OPTIONS': options})
+    for _ in range(times):
+        backend.incr('counter')
+
+
+class TieredCacheTests(TestCase):
+    '''Локальный ярус отвечает сам и не расходится с общим.'''
+
+    def setUp(self):
+        cache.clear()
+
+    def test_local_tier_serves_repeated_reads(self):
+        cache.set('key', 'value')
+        with mock.patch.object(caches['shared'], 'get') as shared_get:
+            self.assertEqual(cache.get('key'), 'value')
+        shared_get.assert_not_called()
+
+    def test_writes_reach_shared_tier(self):
+        cache.set('counter', 1)
+        cache.incr('counter')
+        self.assertEqual(caches['shared'].get('counter'), 2)
+        cache.delete('counter')
+        self.assertIsNone(cache.get('counter'))
+        self.assertIsNone(caches['shared'].get('counter'))
+
+    def test_local_entries_expire(self):
+        cache.set('key', 'value')
+        caches['shared'].set('key', 'other')
+        with mock.patch('time.time', return_value=time.time() + 60):
+            self.assertEqual(cache.get('key'), 'other')
+
+
+class GetOrComputeTests(TestCase):
+    '''Один пересчет на промах и статистика по префиксам.'''
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(True)
+            started.set()
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+
+        def worker():
+            results.append(
+                stampede.get_or_compute('slow', compute, 60, prefix='test')
+            )
+
+        first = threading.Thread(target=worker)
+        first.start()
+        started.wait()
+        worker()
+        first.join()
+        self.assertEqual(results, ['value', 'value'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(stampede.stats()['test']['lock_waits'], 1)
+
+    def test_early_recompute_near_expiry(self):
+        def compute():
+            time.sleep(0.05)
+            return 'old'
+
+        stampede.get_or_compute('key', compute, 60, prefix='test')
+        with mock.patch('time.time', return_value=time.time() + 59.9), \
+                mock.patch('random.random', return_value=1e-300):
+            value = stampede.get_or_compute(
+                'key', lambda: 'new', 60, prefix='test'
+            )
+        self.assertEqual(value, 'new')
+        counts = stampede.stats()['test']
+        self.assertEqual(counts['early'], 1)
+        self.assertEqual(counts['recomputes'], 2)
+
+    def test_fresh_value_is_a_hit(self):
+        for _ in range(3):
+            stampede.get_or_compute('key', lambda: 'value', 60, prefix='test')
+        counts = stampede.stats()['test']
+        self.assertEqual(counts['hits'], 2)
+        self.assertEqual(counts['misses'], 1)
+
+    def test_concurrent_prefixes_are_both_registered(self):
+        get = cache.get
+        raced = []
+
+        def racing_get(key, *args, **kwargs):
+            value = get(key, *args, **kwargs)
+            # Другой воркер регистрирует свой префикс между чтением
+            # и записью реестра.
+            if key == stampede.PREFIXES_KEY and not raced:
+                raced.append(True)
+                stampede.record('other', 'hits')
+            return value
+
+        with mock.patch.object(cache, 'get', racing_get):
+            stampede.record('test', 'hits')
+        self.assertEqual(set(stampede.stats()), {'test', 'other'})
+        stampede.record('test', 'misses')
+        self.assertEqual(sorted(stampede.stats()), ['other', 'test'])
+
+
+class BoundedMemoryCacheTests(TestCase):
+    '''Кэш процесса держит объем в байтах, сжимает и считает статистику.'''
+
+    def make_cache(self, **options):
+        return BoundedMemoryCache(
+            f'test-{self._testMethodName}', {'OPTIONS': options}
+        )
+
+    def test_bytes_are_bounded_by_lru(self):
+        local = self.make_cache(MAX_BYTES=5000, COMPRESS_MIN_SIZE=10 ** 6)
+        local.set('old', 'x' * 1500)
+        local.set('recent', 'y' * 1500)
+        local.get('old')
+        local.set('new', 'z' * 1500)
+        self.assertIsNotNone(local.get('old'))
+        self.assertIsNone(local.get('recent'))
+        stats = local.stats()
+        self.assertLessEqual(stats['used_bytes'], 5000)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_large_values_are_compressed(self):
+        local = self.make_cache(COMPRESS_MIN_SIZE=1024)
+        page = '<article>Пост</article>' * 1000
+        local.set('page', page)
+        self.assertEqual(local.get('page'), page)
+        stats = local.stats()
+        self.assertGreater(stats['raw_bytes'], stats['stored_bytes'] * 5)
+
+    def test_stats_command_and_endpoint(self):
+        cache.clear()
+        local = self.make_cache(STATS_CACHE='shared', PUBLISH_INTERVAL=0)
+        local.get('missing')
+        collected = bounded.collect_stats('shared')[local.name]
+        self.assertEqual(collected['misses'], 1)
+        with mock.patch.object(bounded, 'memory_stats',
+                               return_value={local.name: collected}):
+            out = StringIO()
+            call_command('cache_stats', stdout=out)
+            self.assertIn(f'{local.name}: воркеров 1', out.getvalue())
+            url = reverse('cache_stats')
+            self.assertEqual(self.client.get(url).status_code, 302)
+            self.client.force_login(get_user_model().objects.create_user(
+                username='admin', is_staff=True
+            ))
+            response = self.client.get(url)
+        self.assertEqual(response.json()['memory'][local.name]['misses'], 1)
+
+    def test_each_worker_keeps_its_snapshot(self):
+        cache.clear()
+        local = self.make_cache(STATS_CACHE='shared', PUBLISH_INTERVAL=0)
+        local.get('missing')
+        # Соседний воркер с тем же номером после очистки реестра.
+        caches['shared'].delete(bounded.SNAPSHOTS_KEY)
+        with mock.patch.object(bounded.os, 'getpid', return_value=0):
+            local.get('missing')
+        local.get('missing')
+        collected = bounded.collect_stats('shared')[local.name]
+        self.assertEqual(collected['workers'], 2)
+
+    def test_expired_slots_are_reused(self):
+        cache.clear()
+        local = self.make_cache(STATS_CACHE='shared', PUBLISH_INTERVAL=0)
+        for pid in range(1, 6):
+            # Воркер перезапустился, а слот прежнего истек.
+            caches['shared'].delete(local._store.slot or 'none')
+            with mock.patch.object(bounded.os, 'getpid', return_value=pid):
+                local.get('missing')
+        self.assertEqual(caches['shared'].get(bounded.SNAPSHOTS_KEY), 1)
+
+    def test_touch_validates_key(self):
+        with self.assertWarns(CacheKeyWarning):
+            self.make_cache().touch('key with spaces')
+
+
+@skipUnless(hasattr(os, 'fork'), 'Процессы запускаются через fork')
+class SharedMemoryCacheTests(TestCase):
+    '''Кэш в общем файле: атомарность, LRU и ограничение размера.'''
+
+    OPTIONS = {'SLOT_SIZE': 1024, 'WAYS': 2, 'MAX_SIZE': 64 + 2 * 2 * 1024}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.mmap')
+        self.cache = SharedMemoryCache(
+            self.location, {'OPTIONS': self.OPTIONS}
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_file_size_is_capped(self):
+        self.cache.set('big', 'x' * 2048)
+        self.assertIsNone(self.cache.get('big'))
+        self.assertLessEqual(
+            os.path.getsize(self.location), self.OPTIONS['MAX_SIZE']
+        )
+
+    def test_too_small_max_size_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            SharedMemoryCache(
+                os.path.join(self.directory, 'small.mmap'),
+                {'OPTIONS': {'SLOT_SIZE': 1024, 'WAYS': 2,
+                             'MAX_SIZE': 2048}},
+            )
+
+    def test_new_geometry_replaces_file(self):
+        # Старый процесс дорабатывает со своим файлом, а не падает
+        # от обрезанного под ним отображения.
+        self.cache.set('key', 1)
+        shared_memory._Mapping(self.location, 512, 2, 1)
+        self.assertEqual(self.cache.get('key'), 1)
+        self.assertEqual(os.path.getsize(self.location), 64 + 2 * 512)
+        self.assertEqual(os.listdir(self.directory), ['cache.mmap'])
+
+    def test_least_recently_used_is_evicted(self):
+        # Один набор на два слота: третий ключ вытесняет давно не читанный.
+        cache = SharedMemoryCache(
+            os.path.join(self.directory, 'small.mmap'),
+            {'OPTIONS': {'SLOT_SIZE': 1024, 'WAYS': 2,
+                         'MAX_SIZE': 64 + 2048}},
+        )
+        cache.set('old', 1)
+        cache.set('recent', 2)
+        cache.get('old')
+        cache.set('new', 3)
+        self.assertEqual(cache.get('old'), 1)
+        self.assertIsNone(cache.get('recent'))
+        self.assertEqual(cache.get('new'), 3)
+
+    def test_workers_share_values_and_clear(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(
+                target=incr_many, args=(self.location, self.OPTIONS, 50)
+            )
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        other = multiprocessing.get_context('fork').Process(
+            target=SharedMemoryCache(
+                self.location, {'OPTIONS': self.OPTIONS}
+            ).clear
+        )
+        other.start()
+        other.join()
+        self.assertIsNone(self.cache.get('counter'))
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import Client, TestCase, override_settings
+from django.utils.http import http_date
+
+from ..storage import content_storage
+
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ServeMediaTests(TestCase):
+    '''Загрузки отдаются потоком, с диапазонами и условными запросами.'''
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.name = content_storage.save(
+            'posts/photo.jpg', ContentFile(CONTENT)
+        )
+        self.url = f'/media/{self.name}'
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, **headers)
+
+    def test_file_is_streamed_with_immutable_headers(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        digest = os.path.splitext(os.path.basename(self.name))[0]
+        self.assertEqual(response['ETag'], f'"{digest}"')
+
+    def test_mutable_file_is_not_immutable(self):
+        name = default_storage.save('other/plain.txt', ContentFile(b'x'))
+        response = self.get(f'/media/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_conditional_requests(self):
+        response = self.get()
+        not_modified = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        not_modified = self.get(
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[10:20])
+        self.assertEqual(
+            response['Content-Range'], f'bytes 10-19/{len(CONTENT)}'
+        )
+        self.assertEqual(response['Content-Length'], '10')
+        response = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[-5:])
+        response = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[1000:])
+
+    def test_unsatisfiable_and_stale_ranges(self):
+        response = self.get(HTTP_RANGE=f'bytes={len(CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.get(
+            HTTP_RANGE='bytes=0-9',
+            HTTP_IF_RANGE=http_date(os.path.getmtime(
+                content_storage.path(self.name)
+            ))
+        )
+        self.assertEqual(response.status_code, 206)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_handoff_to_nginx(self):
+        response = self.get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'], f'/protected-media/{self.name}'
+        )
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_handoff_to_apache(self):
+        response = self.get()
+        self.assertEqual(
+            response['X-Sendfile'], content_storage.path(self.name)
+        )
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.get('/media/posts/missing.jpg').status_code, 404)
+        self.assertEqual(self.get('/media/posts').status_code, 404)
+        self.assertEqual(
+            self.get('/media/../yatube/settings.py').status_code, 404
+        )
+
+    def test_hidden_files_are_not_served(self):
+        directory = os.path.dirname(content_storage.path(self.name))
+        with open(os.path.join(directory, '.upload.part'), 'wb') as file:
+            file.write(CONTENT)
+        self.assertEqual(
+            self.get(f'/media/{os.path.dirname(self.name)}/.upload.part')
+            .status_code, 404
+        )
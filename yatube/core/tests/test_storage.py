@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from posts.models import Post
+
+from .. import storage
+from ..models import MediaFile
+
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTests(TestCase):
+    '''Одинаковые загрузки делят файл, а сборщик удаляет только файлы
+       без ссылок.'''
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+
+    def create_post(self, content=b'image', name='photo.gif'):
+        return Post.objects.create(
+            author=self.author, text='Пост',
+            image=ContentFile(content, name=name),
+        )
+
+    def refs(self, name):
+        return MediaFile.objects.get(name=name).refs
+
+    def test_name_is_sharded_content_hash(self):
+        post = self.create_post()
+        self.assertTrue(storage.is_content_name(post.image.name))
+        directory, first, second, filename = post.image.name.split('/')
+        self.assertEqual(directory, 'posts')
+        self.assertEqual(filename[:4], first + second)
+        self.assertTrue(filename.endswith('.gif'))
+
+    def test_identical_uploads_share_file(self):
+        first = self.create_post(name='a.gif')
+        second = self.create_post(name='b.gif')
+        other = self.create_post(b'other')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertEqual(self.refs(first.image.name), 2)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(first.image.path))), 1
+        )
+
+    def test_delete_and_replace_release_refs(self):
+        first = self.create_post()
+        second = self.create_post()
+        name = first.image.name
+        first.delete()
+        self.assertEqual(self.refs(name), 1)
+        second.image = ContentFile(b'new', name='new.gif')
+        second.save()
+        self.assertEqual(self.refs(name), 0)
+        self.assertEqual(self.refs(second.image.name), 1)
+
+    def test_collect_keeps_referenced_and_fresh_files(self):
+        kept = self.create_post().image.name
+        orphan = self.create_post(b'orphan')
+        orphan_name = orphan.image.name
+        orphan.delete()
+        fresh = self.create_post(b'fresh')
+        fresh_name = fresh.image.name
+        fresh.delete()
+        MediaFile.objects.exclude(name=fresh_name).update(
+            touched=timezone.now() - timedelta(hours=2)
+        )
+        call_command('collect_media', grace=3600, stdout=StringIO())
+        self.assertTrue(storage.content_storage.exists(kept))
+        self.assertTrue(storage.content_storage.exists(fresh_name))
+        self.assertFalse(storage.content_storage.exists(orphan_name))
+        self.assertFalse(MediaFile.objects.filter(name=orphan_name).exists())
+
+    def test_save_survives_concurrent_collect(self):
+        orphan = self.create_post(b'again')
+        name = orphan.image.name
+        orphan.delete()
+        MediaFile.objects.update(touched=timezone.now() - timedelta(hours=2))
+        exists = storage.ContentAddressedStorage.exists
+
+        def collect_after_check(instance, path):
+            found = exists(instance, path)
+            storage.collect(instance, grace=3600)
+            return found
+
+        with mock.patch.object(storage.ContentAddressedStorage, 'exists',
+                               collect_after_check):
+            post = self.create_post(b'again')
+        self.assertEqual(post.image.name, name)
+        self.assertTrue(storage.content_storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+
+    def test_concurrent_identical_save_reuses_name(self):
+        name = self.create_post().image.name
+        saved = storage.content_storage._save(name, ContentFile(b'image'))
+        self.assertEqual(saved, name)
+        self.assertEqual(
+            os.listdir(os.path.dirname(storage.content_storage.path(name))),
+            [os.path.basename(name)]
+        )
+
+    def test_migrate_media_moves_flat_files(self):
+        old_name = default_storage.save('posts/old.gif', ContentFile(b'old'))
+        first = Post.objects.create(author=self.author, text='Пост')
+        second = Post.objects.create(author=self.author, text='Копия')
+        Post.objects.filter(pk__in=[first.pk, second.pk]).update(
+            image=old_name
+        )
+        call_command('migrate_media', stdout=StringIO())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(storage.is_content_name(first.image.name))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.refs(first.image.name), 2)
+        self.assertEqual(first.image.read(), b'old')
+        self.assertFalse(default_storage.exists(old_name))
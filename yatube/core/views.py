@@ -1,4 +1,16 @@
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+from . import media
+from .cache import bounded, stampede
 
 
 def page_not_found(request, exception):
@@ -14,3 +26,32 @@ def csrf_failure(request, reason=''):
 def server_error(request):
     template = 'core/500.html'
     return render(request, template, status=500)
+
+
+@staff_member_required
+def cache_stats(request):
+    """Статистика кэшей: сводка воркеров и счетчики этого процесса."""
+    local = caches['local']
+    return JsonResponse({
+        'prefixes': stampede.stats(),
+        'memory': bounded.memory_stats(),
+        'process': local.stats() if hasattr(local, 'stats') else None,
+    })
+
+
+@require_safe
+def serve_media(request, path):
+    """Загруженный файл из MEDIA_ROOT, см. ``core.media``."""
+    # Скрытые файлы не отдаются: среди них недописанные загрузки
+    # ``.<uuid>.part`` хранилища.
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    response = media.serve(request, name, full_path)
+    if response is None:
+        raise Http404
+    return response
@@ -1,12 +1,106 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.utils.text import Truncator
+
+from . import search
 from .models import Post, Group, Comment
+from .paginators import EstimatedCountPaginator
+
+# Сколько символов текста показывать в строке списка.
+TEXT_PREVIEW_LENGTH = 100
+
+
+class IndexedSearchMixin:
+    """Поиск по тексту в админке через полнотекстовый индекс."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip() or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(
+            pk__in=search.matching_ids(self.model, search_term)
+        ), False
+
+
+class RowAutocompleteSelect(AutocompleteSelect):
+    """``AutocompleteSelect``, которому выбранный объект дает строка списка.
+
+    Стандартный виджет дочитывает выбранное значение отдельным запросом,
+    в ``list_editable`` это запрос на каждую строку.
+    """
+
+    instance = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = [str(v) for v in value if v not in ('', None)]
+        if self.instance is None or selected != [str(self.instance.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, self.instance.pk,
+            self.choices.field.label_from_instance(self.instance),
+            True, len(options),
+        ))
+        return [(None, options, 0)]
+
+
+class FastChangeListMixin:
+    """Список, который рисуется за постоянное число запросов.
 
+    Связи выбираются автодополнением и берутся из ``list_select_related``,
+    число строк оценивается, а не считается. Колонка ``text`` в списке
+    показывает только начало текста, ``TEXT_PREVIEW_LENGTH`` символов.
+    """
 
-class PostAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_list_display(self, request):
+        return tuple(
+            'short_text' if name == 'text' else name
+            for name in super().get_list_display(request)
+        )
+
+    def short_text(self, obj):
+        return Truncator(obj.text).chars(TEXT_PREVIEW_LENGTH)
+
+    short_text.short_description = 'Текст'
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if ('widget' not in kwargs
+                and db_field.name in self.get_autocomplete_fields(request)):
+            kwargs['widget'] = RowAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_formset(self, request, **kwargs):
+        formset = super().get_changelist_formset(request, **kwargs)
+
+        class RowFormSet(formset):
+            def _construct_form(self, i, **kwargs):
+                form = super()._construct_form(i, **kwargs)
+                for name, field in form.fields.items():
+                    widget = getattr(field.widget, 'widget', field.widget)
+                    if isinstance(widget, RowAutocompleteSelect):
+                        widget.instance = getattr(form.instance, name)
+                return form
+
+        return RowFormSet
+
+
+class PostAdmin(FastChangeListMixin, IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
     list_editable = ('group',)
+    autocomplete_fields = ('author', 'group')
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
 
 
@@ -15,13 +109,21 @@ admin.site.register(Post, PostAdmin)
 
 class GroupAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
+    search_fields = ('title', 'slug')
 
 
 admin.site.register(Group, GroupAdmin)
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FastChangeListMixin, IndexedSearchMixin,
+                   admin.ModelAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    search_fields = ('text',)
     list_filter = ('created',)
+    autocomplete_fields = ('author', 'post')
+    date_hierarchy = 'created'
+    empty_value_display = '-пусто-'
 
 
 admin.site.register(Comment, CommentAdmin)
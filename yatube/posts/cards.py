@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from . import fragments, thumbnails
+
+CARD_TEMPLATE = 'posts/includes/post_list.html'
+
+
+def attach_cards(posts, using=None):
+    """Дает каждому посту ``card`` — готовую карточку из кэша.
+
+    Карточки всей страницы читаются одним ``get_many`` по ключам
+    ``(id, версия, поколения имени автора и группы, язык)``; заново
+    рендерятся и сохраняются только промахи, а миниатюры для них
+    ищутся одной пачкой. Карточка не
+    зависит от зрителя и ленты, поэтому одна и та же служит главной,
+    группе, профилю и подпискам. ``using`` — движок шаблонов, которым
+    рендерятся промахи.
+    """
+    posts = list(posts)
+    generations = fragments.generations(*{
+        scope for post in posts for scope in fragments.card_scopes(post)
+    })
+    keys = {post.pk: fragments.card_key(post, generations) for post in posts}
+    cards = cache.get_many(keys.values())
+    missing = {}
+    template = None
+    thumbnails.prefetch(
+        [post for post in posts if keys[post.pk] not in cards]
+    )
+    for post in posts:
+        card = cards.get(keys[post.pk])
+        if card is None:
+            template = template or get_template(CARD_TEMPLATE, using=using)
+            card = template.render({'post': post})
+            missing[keys[post.pk]] = card
+        post.card = mark_safe(card)
+    if missing:
+        cache.set_many(missing, settings.CARD_CACHE_TIMEOUT)
+        fragments.record('card', hit=False, count=len(missing))
+    if len(missing) < len(posts):
+        fragments.record('card', hit=True, count=len(posts) - len(missing))
+    return posts
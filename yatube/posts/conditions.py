@@ -0,0 +1,108 @@
+"""Валидаторы условных GET для страниц поста, группы и профиля.
+
+Функции передаются в ``django.views.decorators.http.condition``
+и считаются до view: на совпавший ``If-None-Match`` или
+``If-Modified-Since`` отдается 304 без запросов страницы и шаблонов.
+ETag лент строится по поколениям областей из ``posts.fragments``,
+которые сдвигаются при любой правке, удалении и комментарии;
+Last-Modified ленты — дата самого свежего поста в ней: правку или
+удаление он не отражает, их ловит ETag, который клиенты шлют вместе
+с ``If-Modified-Since`` и который тогда имеет приоритет.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery
+
+from . import fragments
+from .models import Group, Post
+
+User = get_user_model()
+
+
+def _etag(request, *parts):
+    # Страница зависит от зрителя (кнопки автора, подписка) и от курсора.
+    viewer = request.user.pk if request.user.is_authenticated else 0
+    query = request.GET.urlencode()
+    raw = '|'.join(map(str, (*parts, viewer, query)))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _memoized(request, name, load):
+    # condition() зовет функции ETag и Last-Modified по отдельности,
+    # а данные для них одни и те же.
+    attribute = f'_condition_{name}'
+    if not hasattr(request, attribute):
+        setattr(request, attribute, load())
+    return getattr(request, attribute)
+
+
+def _newest(**lookup):
+    return Subquery(
+        Post.objects.filter(**lookup).order_by(
+            '-pub_date', '-id'
+        ).values('pub_date')[:1]
+    )
+
+
+def _post_state(request, post_id):
+    return _memoized(request, 'post', lambda: Post.objects.filter(
+        pk=post_id
+    ).values_list(
+        'version', 'updated_at', 'author__stats__posts_count'
+    ).first())
+
+
+def post_etag(request, post_id):
+    state = _post_state(request, post_id)
+    if state is None:
+        return None
+    version, _, posts_count = state
+    return _etag(request, 'post', post_id, version, posts_count)
+
+
+def post_last_modified(request, post_id):
+    state = _post_state(request, post_id)
+    return state and state[1]
+
+
+def _group_state(request, slug):
+    return _memoized(request, 'group', lambda: Group.objects.filter(
+        slug=slug
+    ).annotate(
+        newest=_newest(group=OuterRef('pk'))
+    ).values_list('pk', 'newest').first())
+
+
+def group_etag(request, slug):
+    state = _group_state(request, slug)
+    if state is None:
+        return None
+    generation = fragments.version(fragments.group_scope(state[0]))
+    return _etag(request, 'group', generation)
+
+
+def group_last_modified(request, slug):
+    state = _group_state(request, slug)
+    return state and state[1]
+
+
+def _author_state(request, username):
+    return _memoized(request, 'author', lambda: User.objects.filter(
+        username=username
+    ).annotate(
+        newest=_newest(author=OuterRef('pk'))
+    ).values_list('pk', 'newest').first())
+
+
+def profile_etag(request, username):
+    state = _author_state(request, username)
+    if state is None:
+        return None
+    generation = fragments.version(fragments.author_scope(state[0]))
+    return _etag(request, 'profile', generation)
+
+
+def profile_last_modified(request, username):
+    state = _author_state(request, username)
+    return state and state[1]
@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+AUTHOR_COUNTERS = {
+    'posts_count': (Post, 'author_id'),
+    'followers_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+}
+
+
+def shifted(name, delta):
+    # Разошедшийся счетчик не должен уходить ниже нуля и ронять удаление.
+    return Greatest(F(name) + delta, 0) if delta < 0 else F(name) + delta
+
+
+def bump_author(user_id, **deltas):
+    """Сдвигает счетчики автора одним UPDATE без гонок."""
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{name: shifted(name, delta) for name, delta in deltas.items()}
+    )
+
+
+def bump_comments(post_id, delta):
+    """Сдвигает счетчик комментариев; страница поста при этом меняется."""
+    if post_id is not None:
+        Post.objects.filter(pk=post_id).update(
+            comments_count=shifted('comments_count', delta),
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+
+
+def count_authors(user_ids):
+    """Настоящие значения счетчиков для пачки авторов."""
+    actual = {
+        user_id: dict.fromkeys(AUTHOR_COUNTERS, 0) for user_id in user_ids
+    }
+    for name, (model, field) in AUTHOR_COUNTERS.items():
+        rows = model.objects.filter(**{f'{field}__in': user_ids}).order_by(
+        ).values(field).annotate(total=Count('pk')).values_list(
+            field, 'total'
+        )
+        for user_id, total in rows:
+            actual[user_id][name] = total
+    return actual
+
+
+def get_stats(user):
+    """Счетчики автора; отсутствующая строка создается по факту."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        stats, _ = AuthorStats.objects.get_or_create(
+            user=user, defaults=count_authors([user.pk])[user.pk]
+        )
+        return stats
+
+
+def reconcile_authors(user_ids):
+    """Исправляет расхождения счетчиков авторов, возвращает их число."""
+    actual = count_authors(user_ids)
+    stats = AuthorStats.objects.in_bulk(user_ids, field_name='user_id')
+    drifted, missing = [], []
+    for user_id, counters in actual.items():
+        row = stats.get(user_id)
+        if row is None:
+            missing.append(AuthorStats(user_id=user_id, **counters))
+            continue
+        if any(getattr(row, name) != value
+               for name, value in counters.items()):
+            for name, value in counters.items():
+                setattr(row, name, value)
+            drifted.append(row)
+    AuthorStats.objects.bulk_create(missing)
+    AuthorStats.objects.bulk_update(drifted, list(AUTHOR_COUNTERS))
+    return len(drifted) + len(missing)
+
+
+def reconcile_comments(post_ids):
+    """Исправляет расхождения Post.comments_count, возвращает их число."""
+    actual = dict(
+        Comment.objects.filter(post_id__in=post_ids).order_by().values(
+            'post_id'
+        ).annotate(total=Count('pk')).values_list('post_id', 'total')
+    )
+    drifted = []
+    posts = Post.objects.filter(pk__in=post_ids).only(
+        'comments_count', 'version'
+    )
+    for post in posts:
+        total = actual.get(post.pk, 0)
+        if post.comments_count != total:
+            post.comments_count = total
+            post.version += 1
+            drifted.append(post)
+    Post.objects.bulk_update(drifted, ['comments_count', 'version'])
+    return len(drifted)
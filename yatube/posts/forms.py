@@ -1,5 +1,7 @@
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from . import images
 from .models import Post, Comment
 from django.utils.translation import gettext_lazy as _
 
@@ -28,6 +30,14 @@ class PostForm(forms.ModelForm):
             }
         }
 
+    def clean_image(self):
+        # Новая загрузка проходит прием: проверку, уменьшение и
+        # перекодирование без EXIF. Сохраненная картинка не трогается.
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return images.ingest(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,158 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.translation import get_language
+
+from core.cache.stampede import get_or_compute
+
+FEED = 'feed'
+FRAGMENTS = ('index', 'group', 'profile', 'follow', 'card')
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def author_info_scope(author_id):
+    # Только имя автора: сдвигается при переименовании, а не при
+    # каждом новом посте, как author_scope.
+    return f'author-info:{author_id}'
+
+
+def group_info_scope(group_id):
+    return f'group-info:{group_id}'
+
+
+def _generation_key(scope):
+    return f'generation:{scope}'
+
+
+def _fresh_generation():
+    # Счетчик, вытесненный из кэша, не должен вернуться к старому значению
+    # и оживить устаревшие фрагменты, поэтому начинаем со времени.
+    return int(time.time() * 1000)
+
+
+def generations(*scopes):
+    """Поколения областей одним ``get_many``: словарь область -> число."""
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _fresh_generation(), None)
+            found[key] = cache.get(key)
+    return {scope: found[key] for scope, key in zip(scopes, keys)}
+
+
+def version(*scopes):
+    """Строка поколений областей для ключа фрагмента."""
+    found = generations(*scopes)
+    return ','.join(f'{scope}={found[scope]}' for scope in scopes)
+
+
+def bump(*scopes):
+    """Сдвигает поколения: все фрагменты этих областей устаревают."""
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _fresh_generation(), None)
+
+
+def post_scopes(post, group_ids=()):
+    scopes = {FEED, post_scope(post.pk), author_scope(post.author_id)}
+    for group_id in (post.group_id, *group_ids):
+        if group_id is not None:
+            scopes.add(group_scope(group_id))
+    return sorted(scopes)
+
+
+def follow_version(user_id, author_ids):
+    """Версия ленты подписок: набор авторов и поколение каждого из них."""
+    author_ids = sorted(author_ids)
+    generations = version(*map(author_scope, author_ids))
+    digest = hashlib.md5(
+        f'{author_ids}|{generations}'.encode()
+    ).hexdigest()
+    return f'{user_id}:{digest}'
+
+
+def cached(fragment_name, vary_on, render):
+    """Фрагмент ленты из кэша или результат ``render()``.
+
+    Ключ тот же, что у ``{% cache %}``, поэтому фрагмент общий для
+    шаблонов Django и Jinja2.
+    """
+    key = make_template_fragment_key(fragment_name, vary_on)
+    rendered = []
+
+    def compute():
+        rendered.append(True)
+        return render()
+
+    value = get_or_compute(
+        key, compute, settings.FEED_CACHE_TIMEOUT,
+        prefix=f'fragment:{fragment_name}',
+    )
+    record(fragment_name, hit=not rendered)
+    return value
+
+
+def card_scopes(post):
+    """Области, чьи поколения входят в ключ карточки ``post``."""
+    scopes = [author_info_scope(post.author_id)]
+    if post.group_id is not None:
+        scopes.append(group_info_scope(post.group_id))
+    return scopes
+
+
+def card_key(post, generations):
+    """Ключ карточки поста: правка меняет версию и только этот ключ.
+
+    В карточке есть имя автора и группа, поэтому в ключ входят и их
+    поколения из ``generations`` (см. ``card_scopes``).
+    """
+    names = ','.join(
+        str(generations[scope]) for scope in card_scopes(post)
+    )
+    return f'card:{post.pk}:{post.version}:{names}:{get_language()}'
+
+
+def _stats_key(fragment, outcome):
+    return f'fragment-stats:{fragment}:{outcome}'
+
+
+def record(fragment, hit, count=1):
+    key = _stats_key(fragment, 'hits' if hit else 'misses')
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        cache.add(key, count, None)
+
+
+def stats():
+    """Попадания и промахи по каждому фрагменту ленты."""
+    keys = [
+        _stats_key(fragment, outcome)
+        for fragment in FRAGMENTS for outcome in ('hits', 'misses')
+    ]
+    values = cache.get_many(keys)
+    return {
+        fragment: {
+            outcome: values.get(_stats_key(fragment, outcome), 0)
+            for outcome in ('hits', 'misses')
+        }
+        for fragment in FRAGMENTS
+    }
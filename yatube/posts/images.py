@@ -0,0 +1,201 @@
+"""Прием картинок постов перед сохранением.
+
+Загруженная картинка проверяется по размеру файла и числу пикселей еще
+до полного декодирования, JPEG декодируется сразу в уменьшенном
+масштабе (draft), поворот из EXIF применяется к пикселям, а сами
+метаданные отбрасываются. Картинка уменьшается до ``IMAGE_MAX_SIDE``
+и перекодируется в WebP или оптимизированный JPEG. Выигрыш по байтам
+и пикселям и время декодирования копятся в счетчиках (см. команду
+``image_ingest``).
+"""
+import io
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('images', 'bytes_in', 'bytes_out', 'pixels_in', 'pixels_out',
+           'decode_ms')
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+CONTENT_TYPES = {
+    'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png',
+}
+
+
+class IngestReport:
+    """Что прием сделал с одной картинкой."""
+
+    def __init__(self, name, bytes_in, bytes_out, pixels_in, pixels_out,
+                 decode_ms):
+        self.name = name
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.pixels_in = pixels_in
+        self.pixels_out = pixels_out
+        # Декодирование при приеме (JPEG — в масштабе).
+        self.decode_ms = decode_ms
+
+    @property
+    def saved_bytes(self):
+        return self.bytes_in - self.bytes_out
+
+    def __str__(self):
+        return (
+            f'{self.name}: {filesizeformat(self.bytes_in)} -> '
+            f'{filesizeformat(self.bytes_out)}, пикселей '
+            f'{self.pixels_in} -> {self.pixels_out}, '
+            f'декодирование {self.decode_ms} мс'
+        )
+
+
+def check_size(file):
+    """Отказывает файлу больше ``IMAGE_MAX_UPLOAD_BYTES`` до чтения."""
+    if file.size > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(settings.IMAGE_MAX_UPLOAD_BYTES)},
+        )
+
+
+def check_pixels(image):
+    """Отказывает картинке больше ``IMAGE_MAX_PIXELS`` по заголовку."""
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка больше %(limit)s пикселей.',
+            code='too_many_pixels',
+            params={'limit': settings.IMAGE_MAX_PIXELS},
+        )
+
+
+def fit(size, max_side):
+    """Размер, вписанный в квадрат ``max_side`` с сохранением пропорций."""
+    width, height = size
+    scale = min(1, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def target_format(image):
+    """WebP, если Pillow собран с ним, иначе JPEG или PNG для прозрачных."""
+    fmt = settings.IMAGE_FORMAT
+    if fmt == 'WEBP' and not features.check('webp'):
+        fmt = 'JPEG'
+    if fmt == 'JPEG' and has_alpha(image):
+        fmt = 'PNG'
+    return fmt
+
+
+def decode(file, max_side=None):
+    """Открывает и декодирует картинку, JPEG — сразу в масштабе.
+
+    Возвращает картинку, ее исходный размер и время декодирования
+    в миллисекундах.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    check_pixels(image)
+    original_size = image.size
+    started = time.monotonic()
+    if max_side is not None and image.format == 'JPEG':
+        # draft уменьшает JPEG кратно 1/2–1/8 прямо при декодировании,
+        # не опускаясь ниже запрошенного размера.
+        image.draft('RGB', fit(image.size, max_side))
+    image.load()
+    return image, original_size, round((time.monotonic() - started) * 1000)
+
+
+def encode(image, max_side):
+    """Поворачивает по EXIF, уменьшает и перекодирует без метаданных."""
+    image = ImageOps.exif_transpose(image)
+    fmt = target_format(image)
+    # Палитровые картинки уменьшаются без сглаживания, поэтому сначала
+    # переводим в полноцветные; JPEG прозрачных не получает.
+    image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    # Сохраняем только цветовой профиль: EXIF с координатами и моделью
+    # камеры в файл не попадает.
+    icc_profile = image.info.get('icc_profile')
+    image.info = {}
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    if fmt == 'JPEG':
+        options.update(
+            quality=settings.IMAGE_QUALITY, optimize=True, progressive=True
+        )
+    elif fmt == 'WEBP':
+        options.update(quality=settings.IMAGE_QUALITY, method=6)
+    else:
+        options.update(optimize=True)
+    output = io.BytesIO()
+    image.save(output, fmt, **options)
+    return output.getvalue(), fmt, image.size
+
+
+def ingest(file):
+    """Готовит загруженную картинку к хранению.
+
+    Возвращает новый файл для ``ImageField``. Анимированные картинки
+    только проверяются и сохраняются как есть.
+    """
+    check_size(file)
+    try:
+        image, (width, height), decode_ms = decode(
+            file, settings.IMAGE_MAX_SIDE
+        )
+        animated = getattr(image, 'is_animated', False)
+        if not animated:
+            data, fmt, size = encode(image, settings.IMAGE_MAX_SIDE)
+    except OSError:
+        # Обрезанный или битый файл проходит проверку заголовка и
+        # падает только при декодировании.
+        raise ValidationError(
+            'Файл поврежден или не является картинкой.',
+            code='invalid_image',
+        )
+    if animated:
+        file.seek(0)
+        record(IngestReport(file.name, file.size, file.size,
+                            width * height, width * height, decode_ms))
+        return file
+    stem = os.path.splitext(os.path.basename(file.name))[0]
+    ingested = SimpleUploadedFile(
+        f'{stem}.{EXTENSIONS[fmt]}', data, CONTENT_TYPES[fmt]
+    )
+    record(IngestReport(file.name, file.size, len(data), width * height,
+                        size[0] * size[1], decode_ms))
+    return ingested
+
+
+def _stats_key(metric):
+    return f'image-ingest:{metric}'
+
+
+def record(report):
+    logger.info('Картинка принята: %s', report)
+    for metric in METRICS:
+        amount = 1 if metric == 'images' else getattr(report, metric)
+        key = _stats_key(metric)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.add(key, amount, None)
+
+
+def stats():
+    """Сколько картинок принято и сколько байт и пикселей сэкономлено."""
+    values = cache.get_many([_stats_key(metric) for metric in METRICS])
+    return {metric: values.get(_stats_key(metric), 0) for metric in METRICS}
@@ -0,0 +1,451 @@
+"""Потоковый импорт постов, комментариев и подписок.
+
+Строки читаются из JSONL или CSV по одной и пишутся пачками через
+``bulk_create``, каждая пачка — своя транзакция. У строки есть ``kind``:
+
+* ``post`` — ``id`` (внешний, для ссылок комментариев), ``author``,
+  ``group``, ``text``, ``pub_date``;
+* ``comment`` — ``post`` (внешний id поста из этого же импорта),
+  ``author``, ``text``, ``created``;
+* ``follow`` — ``user``, ``author``.
+
+Пользователи и группы ищутся в словарях, загруженных один раз.
+``bulk_create`` не возвращает ключи в SQLite, поэтому id постов
+и комментариев назначаются заранее: ``first_post_id`` плюс номер поста
+во входе, так же для комментариев. Диапазон под весь вход занимается
+в ``sqlite_sequence`` до загрузки, и посты, созданные на сайте во время
+импорта, получают id за ним.
+Сигналы при ``bulk_create`` не срабатывают, и счетчики, ленты подписок
+и поколения фрагментов доводятся один раз в ``finish`` запросами по
+диапазонам новых id. С ``defer_indexes`` на время загрузки снимаются вторичные
+индексы и триггеры поиска; они возвращаются и при сбое загрузки, а
+индекс поиска тогда собирается заново целиком.
+
+После каждой пачки в файл контрольной точки пишется номер строки:
+прерванный импорт продолжается с нее, а словарь постов восстанавливается
+перечитыванием уже загруженной части входа. Если сбой пришелся между
+фиксацией пачки и записью точки, пачка загружается повторно: строки с
+уже занятыми id пропускаются базой.
+"""
+import contextlib
+import csv
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, fragments, paginators, search, timeline
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+KINDS = ('post', 'comment', 'follow')
+DEFERRED_MODELS = (Post, Comment)
+
+
+class InputError(ValueError):
+    """Вход нельзя импортировать: неизвестный формат или вид строки."""
+
+
+def read_rows(path, format=None):
+    """Строки входа как словари, по одной."""
+    format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+    with open(path, encoding='utf-8', newline='') as file:
+        if format == 'csv':
+            for row in csv.DictReader(file):
+                yield {key: value for key, value in row.items() if value}
+        elif format == 'jsonl':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise InputError(f'Неизвестный формат: {format}')
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(value)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+@contextlib.contextmanager
+def original_dates():
+    """Даты из входа вместо ``auto_now_add`` на время импорта."""
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Comment._meta.get_field('created'),
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _existing_indexes(model):
+    with connection.cursor() as cursor:
+        return set(connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        ))
+
+
+def drop_indexes():
+    """Снимает вторичные индексы ``Meta.indexes`` и триггеры поиска."""
+    editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        for model in DEFERRED_MODELS:
+            existing = _existing_indexes(model)
+            for index in model._meta.indexes:
+                if index.name in existing:
+                    cursor.execute(str(index.remove_sql(model, editor)))
+    if search.available():
+        search.suspend()
+
+
+def restore_indexes():
+    """Строит снятые индексы заново и пересобирает индекс поиска."""
+    editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        for model in DEFERRED_MODELS:
+            existing = _existing_indexes(model)
+            for index in model._meta.indexes:
+                if index.name not in existing:
+                    cursor.execute(str(index.create_sql(model, editor)))
+    if search.available():
+        search.resume()
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _reserve_ids(model, count):
+    """Первый из ``count`` id, которые база больше не выдаст сама."""
+    if connection.vendor != 'sqlite':
+        return _next_id(model)
+    table = model._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Пустой UPDATE берет блокировку записи до чтения счетчика,
+        # и вставка на сайте ждет, пока диапазон не будет занят.
+        cursor.execute(
+            'UPDATE sqlite_sequence SET seq = seq WHERE name = %s', [table]
+        )
+        cursor.execute(
+            'SELECT seq FROM sqlite_sequence WHERE name = %s', [table]
+        )
+        row = cursor.fetchone()
+        first = max(row[0] + 1 if row else 1, _next_id(model))
+        if row:
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = %s WHERE name = %s',
+                [first + count - 1, table],
+            )
+        else:
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                [table, first + count - 1],
+            )
+    return first
+
+
+def count_rows(path, format=None):
+    """Сколько во входе строк каждого вида."""
+    counts = dict.fromkeys(KINDS, 0)
+    for row in read_rows(path, format):
+        if row.get('kind') in counts:
+            counts[row['kind']] += 1
+    return counts
+
+
+def _chunked(ids, size):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class Checkpoint:
+    """Состояние импорта в JSON-файле рядом со входом.
+
+    Файл переписывается целиком через переименование, поэтому после
+    сбоя в нем всегда состояние последней завершенной пачки.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.state = json.load(file)
+
+    def __getitem__(self, name):
+        return self.state[name]
+
+    def get(self, name, default=None):
+        return self.state.get(name, default)
+
+    def save(self, **values):
+        self.state.update(values)
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file)
+        os.replace(temporary, self.path)
+
+
+class Importer:
+    """Импорт одного входа; ``run`` возвращает счетчики строк."""
+
+    def __init__(self, path, checkpoint, format=None, chunk_size=5000,
+                 create_users=False, create_groups=False,
+                 defer_indexes=False, progress=None):
+        self.path = path
+        self.format = format
+        self.checkpoint = checkpoint
+        self.chunk_size = chunk_size
+        self.create_users = create_users
+        self.create_groups = create_groups
+        self.defer_indexes = defer_indexes
+        self.progress = progress or (lambda stats: None)
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.posts = {}
+        self.stats = dict.fromkeys(KINDS, 0)
+        self.stats['skipped'] = 0
+
+    def run(self):
+        if self.checkpoint.get('done'):
+            return self.checkpoint['stats']
+        if 'row' not in self.checkpoint.state:
+            counts = count_rows(self.path, self.format)
+            self.checkpoint.save(
+                row=0, posts=0, comments=0, stats=self.stats,
+                first_post_id=_reserve_ids(Post, counts['post']),
+                first_comment_id=_reserve_ids(Comment, counts['comment']),
+                first_follow_id=_next_id(Follow),
+                deferred=self.defer_indexes,
+            )
+        elif self.defer_indexes:
+            self.checkpoint.save(deferred=True)
+        self.stats = dict(self.checkpoint['stats'])
+        if self.checkpoint['deferred']:
+            drop_indexes()
+        try:
+            self._import()
+        finally:
+            # Сайт не должен остаться без индексов лент и без синхронизации
+            # поиска ни после ошибки во входе, ни после Ctrl-C.
+            if self.checkpoint['deferred']:
+                restore_indexes()
+        self.finish()
+        return self.stats
+
+    def _import(self):
+        rows = read_rows(self.path, self.format)
+        self._replay(rows, self.checkpoint['row'])
+        started = time.perf_counter()
+        done = 0
+        chunk = []
+        with original_dates():
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    self._load(chunk)
+                    done += len(chunk)
+                    chunk = []
+                    self._report(done, started)
+            if chunk:
+                self._load(chunk)
+                done += len(chunk)
+                self._report(done, started)
+
+    def _replay(self, rows, count):
+        """Восстанавливает словарь постов по уже загруженным строкам."""
+        if not count:
+            return
+        first = self.checkpoint['first_post_id']
+        loaded = set(Post.objects.filter(pk__gte=first).values_list(
+            'pk', flat=True
+        ))
+        ordinal = 0
+        for _, row in zip(range(count), rows):
+            if row.get('kind') != 'post':
+                continue
+            if first + ordinal in loaded and row.get('id') is not None:
+                self.posts[str(row['id'])] = first + ordinal
+            ordinal += 1
+
+    def _report(self, done, started):
+        elapsed = time.perf_counter() - started
+        self.progress({
+            'rows': self.checkpoint['row'],
+            'rate': done / elapsed if elapsed else 0,
+            **self.stats,
+        })
+
+    def _load(self, chunk):
+        with transaction.atomic():
+            self._create_missing(chunk)
+            posts, comments, follows = [], [], []
+            ordinal = self.checkpoint['posts']
+            comment_ordinal = self.checkpoint['comments']
+            first = self.checkpoint['first_post_id']
+            first_comment = self.checkpoint['first_comment_id']
+            for row in chunk:
+                kind = row.get('kind')
+                if kind == 'post':
+                    # Номер занимают и пропущенные посты: так словарь
+                    # восстанавливается при продолжении без решений.
+                    post = self._post(row, first + ordinal)
+                    ordinal += 1
+                    target = posts
+                    item = post
+                elif kind == 'comment':
+                    pk = first_comment + comment_ordinal
+                    comment_ordinal += 1
+                    target, item = comments, self._comment(row, pk)
+                elif kind == 'follow':
+                    target, item = follows, self._follow(row)
+                else:
+                    raise InputError(f'Неизвестный вид строки: {kind}')
+                if item is None:
+                    self.stats['skipped'] += 1
+                else:
+                    target.append(item)
+                    self.stats[kind] += 1
+            # Id заняты под импорт, поэтому конфликт бывает только при
+            # повторе пачки, зафиксированной до сбоя.
+            Post.objects.bulk_create(posts, ignore_conflicts=True)
+            Comment.objects.bulk_create(comments, ignore_conflicts=True)
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.checkpoint.save(
+            row=self.checkpoint['row'] + len(chunk),
+            posts=ordinal, comments=comment_ordinal, stats=self.stats,
+        )
+
+    def _create_missing(self, chunk):
+        usernames, slugs = set(), set()
+        for row in chunk:
+            usernames.update(
+                row[field] for field in ('author', 'user') if row.get(field)
+            )
+            if row.get('group'):
+                slugs.add(row['group'])
+        if self.create_users:
+            missing = usernames - set(self.users)
+            User.objects.bulk_create(
+                User(username=username, password=make_password(None))
+                for username in missing
+            )
+            self.users.update(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'pk'))
+        if self.create_groups:
+            missing = slugs - set(self.groups)
+            Group.objects.bulk_create(
+                Group(slug=slug, title=slug, description='')
+                for slug in missing
+            )
+            self.groups.update(Group.objects.filter(
+                slug__in=missing
+            ).values_list('slug', 'pk'))
+
+    def _post(self, row, pk):
+        author_id = self.users.get(row.get('author'))
+        group_id = None
+        if row.get('group'):
+            group_id = self.groups.get(row['group'])
+            if group_id is None:
+                return None
+        if author_id is None or not row.get('text'):
+            return None
+        if row.get('id') is not None:
+            self.posts[str(row['id'])] = pk
+        return Post(
+            pk=pk, author_id=author_id, group_id=group_id,
+            text=row['text'], pub_date=parse_date(row.get('pub_date')),
+        )
+
+    def _comment(self, row, pk):
+        post_id = self.posts.get(str(row.get('post')))
+        author_id = self.users.get(row.get('author'))
+        if post_id is None or author_id is None or not row.get('text'):
+            return None
+        return Comment(
+            pk=pk, post_id=post_id, author_id=author_id, text=row['text'],
+            created=parse_date(row.get('created')),
+        )
+
+    def _follow(self, row):
+        user_id = self.users.get(row.get('user'))
+        author_id = self.users.get(row.get('author'))
+        if user_id is None or author_id is None or user_id == author_id:
+            return None
+        return Follow(user_id=user_id, author_id=author_id)
+
+    def finish(self):
+        """Индексы, счетчики, ленты и кэш — один раз на весь импорт.
+
+        Затронутые строки берутся по диапазонам новых id, поэтому шаг
+        можно повторить после сбоя.
+        """
+        first_post_id = self.checkpoint['first_post_id']
+        first_comment_id = self.checkpoint['first_comment_id']
+        new_posts = Post.objects.filter(pk__gte=first_post_id)
+        new_comments = Comment.objects.filter(pk__gte=first_comment_id)
+        new_follows = Follow.objects.filter(
+            pk__gte=self.checkpoint['first_follow_id']
+        )
+        with transaction.atomic():
+            # Ключи постов и комментариев назначены явно, и счетчик
+            # последовательности в PostgreSQL о них не знает.
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Post, Comment]
+                ):
+                    cursor.execute(sql)
+            authors = set(new_posts.values_list('author_id', flat=True))
+            groups = set(new_posts.exclude(group=None).values_list(
+                'group_id', flat=True
+            ))
+            commented = set(new_comments.values_list('post_id', flat=True))
+            followed = set()
+            for user_id, author_id in new_follows.values_list(
+                'user_id', 'author_id'
+            ):
+                followed.update((user_id, author_id))
+            for user_ids in _chunked(authors | followed, self.chunk_size):
+                counters.reconcile_authors(user_ids)
+            # Комментарии ссылаются только на посты этого же импорта:
+            # их счетчики ставятся одним UPDATE по диапазону новых постов.
+            new_posts.update(
+                comments_count=Coalesce(Subquery(
+                    Comment.objects.filter(post=OuterRef('pk')).order_by()
+                    .values('post').annotate(total=Count('pk'))
+                    .values('total')
+                ), 0),
+                version=F('version') + 1,
+            )
+            timeline.add_imported(
+                first_post_id, self.checkpoint['first_follow_id']
+            )
+        scopes = {fragments.FEED}
+        scopes.update(fragments.author_scope(pk) for pk in authors | followed)
+        scopes.update(fragments.group_scope(pk) for pk in groups)
+        scopes.update(fragments.post_scope(pk) for pk in commented)
+        fragments.bump(*scopes)
+        paginators.forget_counts(*scopes)
+        self.checkpoint.save(done=True, deferred=False)
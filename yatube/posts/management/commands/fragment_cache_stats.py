@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import fragments
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша фрагментов лент.'
+
+    def handle(self, *args, **options):
+        for fragment, counts in fragments.stats().items():
+            total = counts['hits'] + counts['misses']
+            ratio = counts['hits'] / total if total else 0
+            self.stdout.write(
+                f'{fragment}: попаданий {counts["hits"]}, '
+                f'промахов {counts["misses"]}, доля попаданий {ratio:.0%}'
+            )
@@ -0,0 +1,65 @@
+import io
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает, сколько места и времени декодирования сэкономил '
+        'прием картинок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scan', action='store_true',
+            help='Измерить выигрыш на уже сохраненных картинках постов, '
+                 'ничего не меняя.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help='Сколько картинок измерять при --scan.'
+        )
+
+    def handle(self, *args, **options):
+        counts = images.stats()
+        self.stdout.write(
+            f'Принято картинок: {counts["images"]}, '
+            f'{filesizeformat(counts["bytes_in"])} -> '
+            f'{filesizeformat(counts["bytes_out"])}, '
+            f'пикселей {counts["pixels_in"]} -> {counts["pixels_out"]}, '
+            f'декодирование при приеме {counts["decode_ms"]} мс'
+        )
+        if options['scan']:
+            self.scan(options['limit'])
+
+    def scan(self, limit):
+        posts = Post.objects.exclude(image='').only('image').order_by('-pk')
+        bytes_in = bytes_out = decode_in = decode_out = measured = 0
+        for post in posts[:limit]:
+            try:
+                with post.image.open('rb') as file:
+                    # Полное декодирование, как при нарезке миниатюр.
+                    image, _, full_ms = images.decode(file)
+                    data, _, _ = images.encode(
+                        image, settings.IMAGE_MAX_SIDE
+                    )
+                    size = file.size
+            except Exception as error:
+                self.stderr.write(f'{post.image.name}: {error}')
+                continue
+            _, _, stored_ms = images.decode(io.BytesIO(data))
+            bytes_in += size
+            bytes_out += len(data)
+            decode_in += full_ms
+            decode_out += stored_ms
+            measured += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Измерено картинок: {measured}, '
+            f'{filesizeformat(bytes_in)} -> {filesizeformat(bytes_out)}, '
+            f'декодирование {decode_in} мс -> {decode_out} мс'
+        ))
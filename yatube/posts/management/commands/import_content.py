@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import Checkpoint, Importer
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты, комментарии и подписки из JSONL или CSV '
+        'пачками, с продолжением после сбоя.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL или CSV.')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат входа; по умолчанию — по расширению файла.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Сколько строк писать в одной транзакции.'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки; по умолчанию <path>.checkpoint.'
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создавать неизвестных пользователей без пароля.'
+        )
+        parser.add_argument(
+            '--create-groups', action='store_true',
+            help='Создавать неизвестные группы.'
+        )
+        parser.add_argument(
+            '--defer-indexes', action='store_true',
+            help='Снять вторичные индексы и триггеры поиска до конца '
+                 'импорта.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint = Checkpoint(
+            options['checkpoint'] or f'{path}.checkpoint'
+        )
+        if checkpoint.get('done'):
+            self.stdout.write(f'Импорт {path} уже завершен.')
+            return
+        if checkpoint.get('row'):
+            self.stdout.write(
+                f'Продолжение со строки {checkpoint["row"]}.'
+            )
+        importer = Importer(
+            path, checkpoint, format=options['format'],
+            chunk_size=options['chunk_size'],
+            create_users=options['create_users'],
+            create_groups=options['create_groups'],
+            defer_indexes=options['defer_indexes'],
+            progress=self.progress,
+        )
+        started = time.perf_counter()
+        first_row = checkpoint.get('row', 0)
+        try:
+            stats = importer.run()
+            elapsed = time.perf_counter() - started
+        except ValueError as error:
+            raise CommandError(
+                f'Ошибка во входе после строки {checkpoint["row"]}: {error}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: постов {stats["post"]}, '
+            f'комментариев {stats["comment"]}, '
+            f'подписок {stats["follow"]}, пропущено {stats["skipped"]}; '
+            f'{(checkpoint["row"] - first_row) / elapsed:.0f} строк/с'
+        ))
+
+    def progress(self, stats):
+        self.stdout.write(
+            f'Строк: {stats["rows"]}, {stats["rate"]:.0f} строк/с'
+        )
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail import delete as delete_thumbnails
+
+from core import storage
+from posts import thumbnails
+from posts.models import Post
+
+from .reconcile_counters import batches
+
+
+class Command(BaseCommand):
+    help = 'Переносит картинки постов в хранилище по содержимому.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить за проход.'
+        )
+
+    def handle(self, *args, **options):
+        moved, missing, old_names = 0, 0, set()
+        posts = Post.objects.exclude(image='')
+        for pks in batches(posts, options['batch_size']):
+            batch = []
+            for post in Post.objects.filter(pk__in=pks).only('image'):
+                old_name = post.image.name
+                if storage.is_content_name(old_name):
+                    continue
+                try:
+                    with storage.content_storage.open(old_name) as file:
+                        new_name = storage.content_storage.save(
+                            old_name, file
+                        )
+                except FileNotFoundError:
+                    self.stderr.write(f'Нет файла {old_name}')
+                    missing += 1
+                    continue
+                with transaction.atomic():
+                    Post.objects.filter(pk=post.pk).update(image=new_name)
+                    storage.retain(new_name)
+                    post.image.name = new_name
+                    thumbnails.enqueue(post)
+                old_names.add(old_name)
+                batch.append(post.pk)
+            if batch:
+                thumbnails.publish(batch)
+                moved += len(batch)
+        # Старый файл мог делить не один пост, поэтому удаляем его,
+        # когда перенесены все, вместе с миниатюрами sorl.
+        deleted = 0
+        for old_name in old_names:
+            if not Post.objects.filter(image=old_name).exists():
+                delete_thumbnails(old_name)
+                deleted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено картинок: {moved}, старых файлов удалено: '
+            f'{deleted}, не найдено: {missing}'
+        ))
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+from posts.models import Post
+
+User = get_user_model()
+
+
+def batches(queryset, size):
+    """Первичные ключи пачками по возрастанию, без OFFSET."""
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', flat=True
+        )[:size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики постов, подписок и комментариев с данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк сверять в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        fixed_authors = fixed_posts = 0
+        for user_ids in batches(User.objects.all(), size):
+            with transaction.atomic():
+                fixed_authors += counters.reconcile_authors(user_ids)
+        for post_ids in batches(Post.objects.all(), size):
+            with transaction.atomic():
+                fixed_posts += counters.reconcile_comments(post_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков: авторов {fixed_authors}, '
+            f'постов {fixed_posts}'
+        ))
@@ -0,0 +1,101 @@
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.cache.stampede import record
+from posts import thumbnails
+from posts.models import Post, ThumbnailTask
+
+WORKER_PREFIX = 'thumbnail:worker'
+
+
+class Command(BaseCommand):
+    help = 'Нарезает миниатюры из очереди в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Сколько процессов нарезают миниатюры; 0 — в этом же.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько задач забирать из очереди за раз.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и выйти, а не ждать новых задач.'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Сначала поставить в очередь картинки всех постов.'
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            for post in Post.objects.exclude(image='').only('image'):
+                thumbnails.enqueue(post)
+        pool = None
+        if options['workers'] > 0:
+            pool = ProcessPoolExecutor(options['workers'])
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        done = 0
+        try:
+            while True:
+                tasks = thumbnails.claim(worker, options['batch_size'])
+                if not tasks:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                done += self.process(pool, tasks)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюр нарезано: {done}'
+        ))
+
+    def process(self, pool, tasks):
+        # Правки одного поста между проходами дают повторы задач,
+        # а нарезать каждую миниатюру достаточно один раз.
+        jobs = sorted({(post_id, size) for _, post_id, size in tasks})
+        post_ids, sizes = zip(*jobs)
+        if pool is None:
+            results = list(map(thumbnails.generate, post_ids, sizes))
+        else:
+            # Дочерние процессы не должны делить соединение с базой
+            # с родителем: каждый откроет свое.
+            connections.close_all()
+            results = list(pool.map(thumbnails.generate, post_ids, sizes))
+        results = dict(zip(jobs, results))
+        finished, failed = [], {}
+        for pk, post_id, size in tasks:
+            error = results[post_id, size][1]
+            if error is None:
+                finished.append(pk)
+            else:
+                # Неудачные задачи остаются в очереди и повторяются.
+                failed.setdefault(error, []).append(pk)
+        ThumbnailTask.objects.filter(pk__in=finished).delete()
+        for error, pks in failed.items():
+            thumbnails.fail(pks, error)
+        ready = {
+            post_id for (post_id, _), (timing, _) in results.items()
+            if timing is not None
+        }
+        if ready:
+            thumbnails.publish(ready)
+        done = [timing for timing, _ in results.values() if timing is not None]
+        if done:
+            record(WORKER_PREFIX, 'recomputes', len(done))
+            record(WORKER_PREFIX, 'recompute_ms', round(sum(done) * 1000))
+        return len(done)
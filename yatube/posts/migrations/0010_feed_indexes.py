@@ -0,0 +1,79 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:58
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+BATCH_SIZE = 1000
+
+
+def drop_duplicate_follows(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Follow = apps.get_model('posts', 'Follow')
+    # Дубли ищутся группировкой: в каждой паре остается первая подписка.
+    groups = Follow.objects.order_by().values('user', 'author').annotate(
+        total=Count('pk'), keep=Min('pk')
+    ).filter(total__gt=1).values_list('user', 'author', 'keep')
+    users = set()
+    for user_id, author_id, keep in groups.iterator():
+        while True:
+            pks = list(Follow.objects.filter(
+                user_id=user_id, author_id=author_id
+            ).exclude(pk=keep).values_list('pk', flat=True)[:BATCH_SIZE])
+            if not pks:
+                break
+            Follow.objects.filter(pk__in=pks).delete()
+        users.update((user_id, author_id))
+    # Счетчики из 0009 посчитаны вместе с дублями.
+    users = sorted(users)
+    for start in range(0, len(users), BATCH_SIZE):
+        user_ids = users[start:start + BATCH_SIZE]
+        followers = dict(Follow.objects.filter(
+            author_id__in=user_ids
+        ).order_by().values('author').annotate(
+            total=Count('pk')
+        ).values_list('author', 'total'))
+        following = dict(Follow.objects.filter(
+            user_id__in=user_ids
+        ).order_by().values('user').annotate(
+            total=Count('pk')
+        ).values_list('user', 'total'))
+        stats = list(AuthorStats.objects.filter(user_id__in=user_ids))
+        for row in stats:
+            row.followers_count = followers.get(row.user_id, 0)
+            row.following_count = following.get(row.user_id, 0)
+        AuthorStats.objects.bulk_update(
+            stats, ['followers_count', 'following_count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            drop_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
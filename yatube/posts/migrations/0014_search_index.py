@@ -0,0 +1,84 @@
+from django.db import migrations
+
+# SQL заморожен здесь, а не берется из posts.search: миграция должна
+# выполняться одинаково, как бы потом ни менялся модуль поиска.
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE posts_search USING fts5(
+        text, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search (rowid, text) VALUES (new.id << 32, new.text);
+    END""",
+    """CREATE TRIGGER posts_search_post_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        UPDATE posts_search SET text = new.text WHERE rowid = new.id << 32;
+    END""",
+    """CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id << 32;
+    END""",
+    """CREATE TRIGGER posts_search_comment_insert
+    AFTER INSERT ON posts_comment WHEN new.post_id IS NOT NULL
+    BEGIN
+        INSERT INTO posts_search (rowid, text)
+        VALUES (new.post_id << 32 | new.id, new.text);
+    END""",
+    """CREATE TRIGGER posts_search_comment_update
+    AFTER UPDATE OF text, post_id ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.post_id << 32 | old.id;
+        INSERT INTO posts_search (rowid, text)
+        SELECT new.post_id << 32 | new.id, new.text
+        WHERE new.post_id IS NOT NULL;
+    END""",
+    """CREATE TRIGGER posts_search_comment_delete
+    AFTER DELETE ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.post_id << 32 | old.id;
+    END""",
+]
+
+FILL_SQL = [
+    """INSERT INTO posts_search (rowid, text)
+    SELECT id << 32, text FROM posts_post""",
+    """INSERT INTO posts_search (rowid, text)
+    SELECT post_id << 32 | id, text FROM posts_comment
+    WHERE post_id IS NOT NULL""",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS posts_search_post_insert',
+    'DROP TRIGGER IF EXISTS posts_search_post_update',
+    'DROP TRIGGER IF EXISTS posts_search_post_delete',
+    'DROP TRIGGER IF EXISTS posts_search_comment_insert',
+    'DROP TRIGGER IF EXISTS posts_search_comment_update',
+    'DROP TRIGGER IF EXISTS posts_search_comment_delete',
+    'DROP TABLE IF EXISTS posts_search',
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL + FILL_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
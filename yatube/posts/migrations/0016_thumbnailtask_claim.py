@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_comment_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnailtask',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thumbnailtask',
+            name='available_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='thumbnailtask',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='thumbnailtask',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddIndex(
+            model_name='thumbnailtask',
+            index=models.Index(fields=['available_at'], name='thumbnail_task_available_idx'),
+        ),
+    ]
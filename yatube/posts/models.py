@@ -1,5 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from core.storage import content_storage
 
 User = get_user_model()
 
@@ -22,13 +25,34 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True
     )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    # Меняются при правке поста и его комментариев: по ним строятся
+    # валидаторы условных запросов и ключи кэша.
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # id замыкает ключ курсорной паджинации: без него SQLite
+        # досортировывает строки с одинаковой датой во временном B-дереве.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -63,6 +87,15 @@ class Comment(models.Model):
         ordering = ['-created']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created'], name='comment_post_created_idx'
+            ),
+            # Для date_hierarchy и порядка по умолчанию в админке.
+            models.Index(
+                fields=['-created', '-id'], name='comment_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -70,3 +103,80 @@ class Follow(models.Model):
                              related_name="follower")
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name="following")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Поддерживаемые счетчики автора, чтобы не считать их на лету."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                related_name='stats')
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: пост в ленте одного читателя."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_post'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+
+class ThumbnailTask(models.Model):
+    """Очередь миниатюр: пост, чьи картинки еще нужно нарезать."""
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='thumbnail_tasks')
+    size = models.CharField(max_length=32)
+    created = models.DateTimeField(auto_now_add=True)
+    # Задачу берут, когда наступил ``available_at``: захват воркером
+    # и неудачная попытка отодвигают его, а упавший воркер отпускает
+    # задачу по истечении захвата.
+    available_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['pk']
+        verbose_name = 'Задача миниатюры'
+        verbose_name_plural = 'Задачи миниатюр'
+        indexes = [
+            models.Index(fields=['available_at'],
+                         name='thumbnail_task_available_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}:{self.size}'
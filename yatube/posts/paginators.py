@@ -0,0 +1,423 @@
+import base64
+import binascii
+import heapq
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .models import TimelineEntry
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, pub_date, pk, number, skip=0):
+    """Упаковывает позицию (pub_date, id) в непрозрачный токен.
+
+    ``skip`` — сколько строк пропустить от позиции в сторону ``direction``:
+    так ссылка ведет через несколько страниц от текущей.
+    """
+    raw = f'{direction}|{pub_date.isoformat()}|{pk}|{number}'
+    if skip:
+        raw += f'|{skip}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, для битого токена возвращает None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk, number, *skip = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk, number = int(pk), int(number)
+        skip = int(*skip or [0])
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None or skip < 0:
+        return None
+    return direction, pub_date, pk, max(number, 1), skip
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id) без OFFSET и COUNT(*).
+
+    Каждая страница выбирается одним диапазонным запросом от курсора,
+    поэтому страница 10 000 стоит столько же, сколько первая.
+    Старые ссылки вида ``?page=N`` сводятся к курсору по граничной записи.
+    """
+
+    key_fields = ('pub_date', 'pk')
+
+    def __init__(self, object_list, per_page, **kwargs):
+        ordering = [f'-{field}' for field in self.key_fields]
+        super().__init__(object_list.order_by(*ordering), per_page, **kwargs)
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        # Общее число страниц неизвестно: достаточно знать, есть ли
+        # страница после текущей.
+        return self._num_pages
+
+    def get_page(self, cursor=None, page=None):
+        if cursor:
+            position = decode_cursor(cursor)
+            if position is not None:
+                return self._page_from_position(cursor, *position)
+        if page:
+            return self._page_from_number(page)
+        return self._build_page(None, 1, has_previous=False)
+
+    def _position(self, obj):
+        return tuple(getattr(obj, field) for field in self.key_fields)
+
+    def _after(self, lookup, pub_date, pk, key_fields=None):
+        # Условие на pub_date вынесено за скобки, чтобы оно стало
+        # диапазоном по индексу, а не разбиением OR на два поиска.
+        date_field, pk_field = key_fields or self.key_fields
+        return Q(**{f'{date_field}__{lookup}e': pub_date}) & (
+            Q(**{f'{date_field}__{lookup}': pub_date})
+            | Q(**{f'{pk_field}__{lookup}': pk})
+        )
+
+    def _fetch(self, lookup, position, limit):
+        """Выбирает до ``limit`` строк за позицией в порядке обхода.
+
+        ``lookup='lt'`` — вглубь ленты, ``'gt'`` — назад, к новым постам.
+        """
+        rows = self.object_list
+        if lookup == 'gt':
+            rows = rows.reverse()
+        if position is not None:
+            rows = rows.filter(self._after(lookup, *position))
+        return list(rows[:limit])
+
+    def _boundary(self, offset):
+        """Позиция последней строки перед ``offset``, None — строк меньше."""
+        rows = self.object_list.values_list(*self.key_fields)
+        return rows[offset - 1:offset].first()
+
+    def _page_from_position(self, cursor, direction, pub_date, pk, number,
+                            skip=0):
+        position = (pub_date, pk)
+        if skip:
+            # Переход через несколько страниц — диапазон в ``skip`` строк
+            # от курсора, а не OFFSET от начала ленты.
+            lookup = 'lt' if direction == NEXT else 'gt'
+            rows = self._fetch(lookup, position, skip)
+            if len(rows) < skip:
+                return self._build_page(None, 1, has_previous=False)
+            position = self._position(rows[-1])
+            cursor = encode_cursor(direction, *position, number)
+        if direction == NEXT:
+            return self._build_page(position, number, True, cursor)
+        objects = self._fetch('gt', position, self.per_page + 1)
+        has_previous = len(objects) > self.per_page
+        objects = objects[:self.per_page][::-1]
+        return self._make_page(
+            objects, number if has_previous else 1, has_previous, True, cursor
+        )
+
+    def _page_from_number(self, page):
+        try:
+            number = self.validate_number(page)
+        except InvalidPage:
+            number = 1
+        if number == 1:
+            return self._build_page(None, 1, has_previous=False)
+        boundary = self._boundary((number - 1) * self.per_page)
+        if boundary is None:
+            return self._build_page(None, 1, has_previous=False)
+        cursor = encode_cursor(NEXT, *boundary, number)
+        return self._page_from_position(cursor, NEXT, *boundary, number)
+
+    def validate_number(self, number):
+        # Без COUNT(*) проверяем только, что номер — целое больше нуля.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage
+        if number < 1:
+            raise InvalidPage
+        return number
+
+    def _build_page(self, position, number, has_previous, cursor=''):
+        objects = self._fetch('lt', position, self.per_page + 1)
+        has_next = len(objects) > self.per_page
+        return self._make_page(
+            objects[:self.per_page], number, has_previous, has_next, cursor
+        )
+
+    def _make_page(self, objects, number, has_previous, has_next, cursor):
+        if has_previous:
+            number = max(number, 2)
+        self._num_pages = number + 1 if has_next and objects else number
+        page = self._get_page(objects, number, self)
+        page.cursor = cursor
+        page.next_cursor = None
+        page.previous_cursor = None
+        if objects and has_next:
+            page.next_cursor = encode_cursor(
+                NEXT, *self._position(objects[-1]), number + 1
+            )
+        if objects and has_previous:
+            page.previous_cursor = encode_cursor(
+                PREVIOUS, *self._position(objects[0]), number - 1
+            )
+        return page
+
+
+def _count_key(scope):
+    return f'page-count:{scope}'
+
+
+def is_approximate(count):
+    return count > settings.PAGINATOR_APPROXIMATE_COUNT
+
+
+def cached_count(scope, rows):
+    """Число записей области: COUNT(*) считается раз на время жизни."""
+    key = _count_key(scope)
+    count = cache.get(key)
+    if count is None:
+        count = rows.count()
+        cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+    return count
+
+
+def forget_counts(*scopes):
+    """Сбрасывает точные счетчики областей после создания или удаления.
+
+    Большие счетчики показываются приблизительно, поэтому их не
+    пересчитывают на каждый новый пост: они живут до истечения таймаута.
+    """
+    keys = [_count_key(scope) for scope in scopes]
+    counts = cache.get_many(keys)
+    cache.delete_many([
+        key for key, count in counts.items() if not is_approximate(count)
+    ])
+
+
+def estimated_count(queryset):
+    """Оценка числа строк таблицы без прохода по ней.
+
+    PostgreSQL знает ее из статистики планировщика, в остальных базах
+    берется наибольший первичный ключ — это одно чтение с конца
+    индекса. Удаленные строки оценку только завышают.
+    """
+    connection = connections[queryset.db]
+    model = queryset.model
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return max(row[0], 0) if row else 0
+    last = model._default_manager.using(queryset.db).aggregate(
+        last=Max('pk')
+    )['last']
+    return last or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Паджинатор для админки без COUNT(*) по всей таблице.
+
+    Для списка без фильтров число берется из ``estimated_count``, если
+    оно выше ``PAGINATOR_APPROXIMATE_COUNT``. Отфильтрованный список
+    считается не дальше порога: дальние страницы большой выборки
+    открываются уточнением фильтра, а не номером.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.PAGINATOR_APPROXIMATE_COUNT
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate > limit:
+                return estimate
+            return self.object_list.count()
+        return self.object_list[:limit + 1].count()
+
+
+class FeedPaginator(CursorPaginator):
+    """Курсорный паджинатор с общим числом записей и номерами страниц.
+
+    Число берется готовым (``count``) или из кэша области (``scope``)
+    и сбрасывается при создании и удалении постов. Выше порога
+    ``PAGINATOR_APPROXIMATE_COUNT`` оно показывается как «около N».
+    Ссылки на страницы сворачиваются вокруг текущей, как
+    ``Paginator.get_elided_page_range`` в новых версиях Django, и
+    ни одна не требует OFFSET: соседние страницы — курсоры с пропуском
+    строк от текущей, последняя находится с хвоста ленты.
+    """
+
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, scope=None, count=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.scope = scope
+        self._count = count
+
+    @cached_property
+    def count(self):
+        if self._count is not None:
+            return self._count
+        if self.scope is not None:
+            return cached_count(self.scope, self.object_list)
+        return self.object_list.count()
+
+    @property
+    def approximate(self):
+        return is_approximate(self.count)
+
+    @property
+    def display_count(self):
+        # Две значащие цифры: «около 52 000», а не «около 51 873».
+        if not self.approximate:
+            return self.count
+        return round(self.count, 2 - len(str(self.count)))
+
+    @property
+    def total_pages(self):
+        # num_pages по-прежнему знает только о следующей странице:
+        # от него зависит has_next, а счетчик может отставать.
+        pages = math.ceil(self.count / self.per_page)
+        return max(pages, self.num_pages, 1)
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        total = self.total_pages
+        # Номер последней страницы при приблизительном счете неточен,
+        # ссылку на нее не даем.
+        tail = 0 if self.approximate else on_ends
+        if total <= (on_each_side + on_ends) * 2:
+            yield from range(1, total + 1)
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < total - on_each_side - tail - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(total - tail + 1, total + 1)
+        else:
+            yield from range(number + 1, total + 1)
+
+    def _tail_boundary(self, offset):
+        # Страницы во второй половине ленты ищутся с хвоста: ссылка на
+        # последнюю читает не больше страницы строк.
+        remaining = self.count - offset
+        if self.approximate or not 0 < remaining < offset:
+            return None
+        rows = self._fetch('gt', None, remaining + 1)
+        if len(rows) <= remaining:
+            return None
+        return self._position(rows[-1])
+
+    def _boundary(self, offset):
+        position = self._tail_boundary(offset)
+        if position is None:
+            position = super()._boundary(offset)
+        return position
+
+    def _page_query(self, objects, current, number):
+        """Строка запроса ссылки на страницу ``number`` с ``current``."""
+        if number == 1:
+            return ''
+        distance = number - current
+        if (number == self.total_pages and not self.approximate
+                and distance > 1):
+            return f'page={number}'
+        if distance > 0:
+            direction, edge = NEXT, objects[-1]
+        else:
+            direction, edge = PREVIOUS, objects[0]
+        skip = (abs(distance) - 1) * self.per_page
+        token = encode_cursor(direction, *self._position(edge), number, skip)
+        return f'cursor={token}'
+
+    def _make_page(self, objects, number, *args):
+        page = super()._make_page(objects, number, *args)
+        # Ссылки (номер, строка запроса); у текущей и многоточия — None.
+        page.page_links = [
+            (item, None if item in (page.number, self.ELLIPSIS) or not objects
+             else self._page_query(objects, page.number, item))
+            for item in self.get_elided_page_range(page.number)
+        ]
+        return page
+
+
+class TimelinePaginator(FeedPaginator):
+    """Курсорный паджинатор по ленте подписок.
+
+    Листает материализованные записи ``TimelineEntry`` и на лету сливает
+    с ними посты «тяжелых» авторов из ``pulled``: на каждого автора
+    приходится один диапазонный запрос, потоки сливаются по pub_date.
+    На страницу отдаются сами посты.
+    """
+
+    key_fields = ('pub_date', 'post_id')
+    pulled_key_fields = ('pub_date', 'pk')
+
+    def __init__(self, object_list, per_page, pulled=(), **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.pulled = [
+            posts.order_by('-pub_date', '-pk') for posts in pulled
+        ]
+
+    def _fetch(self, lookup, position, limit):
+        streams = [super()._fetch(lookup, position, limit)]
+        for posts in self.pulled:
+            if lookup == 'gt':
+                posts = posts.reverse()
+            if position is not None:
+                posts = posts.filter(
+                    self._after(lookup, *position, self.pulled_key_fields)
+                )
+            streams.append([
+                TimelineEntry(post=post, author_id=post.author_id,
+                              pub_date=post.pub_date)
+                for post in posts[:limit]
+            ])
+        if len(streams) == 1:
+            return streams[0]
+        merged = heapq.merge(
+            *streams, key=self._position, reverse=lookup == 'lt'
+        )
+        rows, seen = [], set()
+        for entry in merged:
+            if entry.post_id in seen:
+                continue
+            seen.add(entry.post_id)
+            rows.append(entry)
+            if len(rows) == limit:
+                break
+        return rows
+
+    def _boundary(self, offset):
+        if not self.pulled:
+            return super()._boundary(offset)
+        position = self._tail_boundary(offset)
+        if position is not None:
+            return position
+        rows = self._fetch('lt', None, offset)
+        if len(rows) < offset:
+            return None
+        return self._position(rows[-1])
+
+    def _get_page(self, object_list, number, paginator):
+        posts = [entry.post for entry in object_list]
+        return super()._get_page(posts, number, paginator)
@@ -0,0 +1,75 @@
+import functools
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.functional import cached_property
+
+from .models import Comment
+
+
+class CommentPreviews:
+    """Последние комментарии для всех постов страницы разом.
+
+    Выборка ленивая и делается за два запроса на всю страницу: оконная
+    функция нумерует комментарии внутри каждого поста и оставляет
+    первые ``limit``, затем они загружаются вместе с авторами.
+    Если фрагмент ленты взят из кэша, запросов нет вовсе.
+    """
+
+    def __init__(self, posts, limit):
+        self.post_ids = [post.pk for post in posts]
+        self.limit = limit
+
+    @cached_property
+    def by_post(self):
+        by_post = {post_id: [] for post_id in self.post_ids}
+        ids = self.latest_ids() if self.post_ids else []
+        if ids:
+            # Строк не больше limit на пост, сортируем их здесь, а не в БД.
+            comments = Comment.objects.filter(pk__in=ids).select_related(
+                'author'
+            ).order_by()
+            for comment in comments:
+                by_post[comment.post_id].append(comment)
+        for comments in by_post.values():
+            comments.sort(key=lambda comment: comment.created, reverse=True)
+        return by_post
+
+    def latest_ids(self):
+        # Окно повторяет индекс (post, -created), поэтому нумерация идет
+        # по нему без отдельной сортировки.
+        ranked = Comment.objects.filter(post_id__in=self.post_ids).order_by(
+        ).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F('post_id')],
+                order_by=F('created').desc(),
+            )
+        ).values('pk', 'position')
+        sql, params = ranked.query.sql_with_params()
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {quote("id")} FROM ({sql}) ranked '
+                f'WHERE {quote("position")} <= %s',
+                (*params, self.limit),
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def for_post(self, post_id):
+        return self.by_post.get(post_id, [])
+
+
+def attach_comment_previews(posts, limit=None):
+    """Дает каждому посту ``latest_comments`` без запроса на пост."""
+    posts = list(posts)
+    previews = CommentPreviews(
+        posts, limit or settings.COMMENT_PREVIEW_SIZE
+    )
+    for post in posts:
+        post.latest_comments = functools.partial(
+            previews.for_post, post.pk
+        )
+    return posts
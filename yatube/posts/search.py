@@ -0,0 +1,245 @@
+"""Полнотекстовый поиск по постам и комментариям на SQLite FTS5.
+
+Индекс ``posts_search`` — виртуальная таблица FTS5 с текстами постов
+и комментариев. Пост и его комментарии лежат рядом: rowid строки —
+``post_id << 32 | comment_id`` (у самого поста младшая половина нулевая),
+так что пост находится по rowid без чтения хранимых колонок, а
+группировка и фильтры не трогают содержимое индекса. Индекс
+поддерживают триггеры на ``posts_post`` и ``posts_comment`` (миграция
+0014), поэтому он не отстает и от ``update()`` и ``bulk_create``;
+``manage.py rebuild_search_index`` собирает его заново. Пост
+ранжируется по лучшему bm25 среди своего текста и комментариев.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+TABLE = 'posts_search'
+# Младшие 32 бита rowid — id комментария, старшие — id поста.
+SHIFT = 32
+MASK = (1 << SHIFT) - 1
+POST_ID = f'({TABLE}.rowid >> {SHIFT})'
+COMMENT_ID = f'({TABLE}.rowid & {MASK})'
+# Границы совпадения в snippet(): текст экранируется до замены на <mark>.
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+
+TRIGGERS_SQL = [
+    f"""CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO {TABLE} (rowid, text) VALUES (new.id << {SHIFT}, new.text);
+    END""",
+    f"""CREATE TRIGGER posts_search_post_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        UPDATE {TABLE} SET text = new.text WHERE rowid = new.id << {SHIFT};
+    END""",
+    f"""CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM {TABLE} WHERE rowid = old.id << {SHIFT};
+    END""",
+    f"""CREATE TRIGGER posts_search_comment_insert
+    AFTER INSERT ON posts_comment WHEN new.post_id IS NOT NULL
+    BEGIN
+        INSERT INTO {TABLE} (rowid, text)
+        VALUES (new.post_id << {SHIFT} | new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER posts_search_comment_update
+    AFTER UPDATE OF text, post_id ON posts_comment
+    BEGIN
+        DELETE FROM {TABLE} WHERE rowid = old.post_id << {SHIFT} | old.id;
+        INSERT INTO {TABLE} (rowid, text)
+        SELECT new.post_id << {SHIFT} | new.id, new.text
+        WHERE new.post_id IS NOT NULL;
+    END""",
+    f"""CREATE TRIGGER posts_search_comment_delete
+    AFTER DELETE ON posts_comment
+    BEGIN
+        DELETE FROM {TABLE} WHERE rowid = old.post_id << {SHIFT} | old.id;
+    END""",
+]
+
+DROP_TRIGGERS_SQL = [
+    'DROP TRIGGER IF EXISTS posts_search_post_insert',
+    'DROP TRIGGER IF EXISTS posts_search_post_update',
+    'DROP TRIGGER IF EXISTS posts_search_post_delete',
+    'DROP TRIGGER IF EXISTS posts_search_comment_insert',
+    'DROP TRIGGER IF EXISTS posts_search_comment_update',
+    'DROP TRIGGER IF EXISTS posts_search_comment_delete',
+]
+
+FILL_POSTS_SQL = f"""INSERT INTO {TABLE} (rowid, text)
+    SELECT id << {SHIFT}, text FROM posts_post WHERE id >= %s"""
+FILL_COMMENTS_SQL = f"""INSERT INTO {TABLE} (rowid, text)
+    SELECT post_id << {SHIFT} | id, text FROM posts_comment
+    WHERE post_id IS NOT NULL AND id >= %s"""
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def rebuild():
+    """Собирает индекс заново и сливает его сегменты."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(FILL_POSTS_SQL, [0])
+        cursor.execute(FILL_COMMENTS_SQL, [0])
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {TABLE}')
+        return cursor.fetchone()[0]
+
+
+def suspend():
+    """Снимает триггеры индекса на время массовой загрузки."""
+    with connection.cursor() as cursor:
+        for sql in DROP_TRIGGERS_SQL:
+            cursor.execute(sql)
+
+
+def resume():
+    """Ставит триггеры назад и собирает индекс заново.
+
+    Пока триггеров не было, на сайте могли править и удалять старые
+    посты, поэтому дописать только новые строки мало.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for sql in DROP_TRIGGERS_SQL + TRIGGERS_SQL:
+                cursor.execute(sql)
+        rebuild()
+
+
+def match_expression(text):
+    """Запрос пользователя как выражение MATCH: все слова, последнее —
+    как префикс. Операторы FTS5 из ввода не проходят.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class MatchingIds(RawSQL):
+    # Лукап ``__in`` сам берет правую часть в скобки, а вторые скобки
+    # превратили бы подзапрос в скалярное значение — первую строку.
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def matching_ids(model, text):
+    """Подзапрос первичных ключей ``model``, подходящих под ``text``.
+
+    Годится для ``pk__in`` — так поиск в админке идет по индексу.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return MatchingIds('SELECT NULL WHERE 0', [])
+    if model is Post:
+        sql = f'SELECT DISTINCT {POST_ID} FROM {TABLE} WHERE {TABLE} MATCH %s'
+    else:
+        sql = (
+            f'SELECT {COMMENT_ID} FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'AND {COMMENT_ID} != 0'
+        )
+    return MatchingIds(sql, [expression])
+
+
+class SearchResults:
+    """Найденные посты по рангу; срезы и ``count()`` для ``Paginator``.
+
+    Фильтры по группе и автору сужают совпадения подзапросом по
+    индексу внешнего ключа, bm25 считается только для оставшихся.
+    """
+
+    def __init__(self, text, group=None, author=None):
+        self.expression = match_expression(text)
+        self.filters = []
+        self.params = [self.expression]
+        if group is not None:
+            self.filters.append('group_id = %s')
+            self.params.append(group.pk)
+        if author is not None:
+            self.filters.append('author_id = %s')
+            self.params.append(author.pk)
+
+    def _from(self):
+        sql = f'FROM {TABLE} WHERE {TABLE} MATCH %s'
+        if self.filters:
+            sql += (
+                f' AND {POST_ID} IN (SELECT id FROM posts_post WHERE '
+                + ' AND '.join(self.filters) + ')'
+            )
+        return sql
+
+    def count(self):
+        if self.expression is None:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(DISTINCT {POST_ID}) {self._from()}',
+                self.params,
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if self.expression is None:
+            return []
+        start = index.start or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {POST_ID} AS post_id, min(rank) AS score '
+                f'{self._from()} GROUP BY post_id '
+                f'ORDER BY score, post_id DESC LIMIT %s OFFSET %s',
+                [*self.params, index.stop - start, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        found = [posts[pk] for pk in ids if pk in posts]
+        attach_snippets(found, self.expression)
+        return found
+
+
+def attach_snippets(posts, expression):
+    """Дает постам ``snippet`` — отрывок текста с подсвеченными словами.
+
+    Берется отрывок из текста поста, а если совпали только
+    комментарии, — из лучшего из них.
+    """
+    for post in posts:
+        post.snippet = None
+    if not posts:
+        return
+    snippets = {}
+    placeholders = ', '.join(['%s'] * len(posts))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {POST_ID}, snippet({TABLE}, 0, %s, %s, '…', %s) "
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'AND {POST_ID} IN ({placeholders}) '
+            f'ORDER BY {COMMENT_ID} != 0, rank',
+            [MARK_START, MARK_END, SNIPPET_TOKENS, expression,
+             *(post.pk for post in posts)],
+        )
+        for post_id, snippet in cursor.fetchall():
+            snippets.setdefault(post_id, snippet)
+    for post in posts:
+        snippet = snippets.get(post.pk)
+        if snippet is not None:
+            post.snippet = mark_safe(
+                escape(snippet)
+                .replace(MARK_START, '<mark>')
+                .replace(MARK_END, '</mark>')
+            )
@@ -0,0 +1,187 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import storage
+
+from . import counters, fragments, paginators, timeline
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Поля пользователя, которые видны в карточках и лентах.
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_author(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_author(instance.user_id, following_count=1)
+        counters.bump_author(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.bump_author(instance.user_id, following_count=-1)
+    counters.bump_author(instance.author_id, followers_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        timeline.push_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.remove_author(instance.user_id, instance.author_id)
+    # Счетчик подписчиков уже уменьшен в count_deleted_follow.
+    timeline.unfollowed(instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def bump_post_version(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance.version += 1
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_post(sender, instance, raw=False, **kwargs):
+    # Пост, перенесенный в другую группу, должен пропасть и из старой,
+    # а у замененной картинки — убавиться ссылка.
+    instance._old_group_ids = ()
+    instance._old_image = None
+    if instance.pk is not None and not raw:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image'
+        ).first()
+        if old is not None:
+            instance._old_group_ids = (old[0],)
+            instance._old_image = old[1]
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, created, raw=False, **kwargs):
+    old_image = getattr(instance, '_old_image', None)
+    if not raw and instance.image.name != old_image:
+        storage.retain(instance.image.name)
+        storage.release(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    storage.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_generations(sender, instance, **kwargs):
+    fragments.bump(*fragments.post_scopes(
+        instance, getattr(instance, '_old_group_ids', ())
+    ))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def forget_page_counts(sender, instance, created=True, **kwargs):
+    # Правка поста меняет число записей, только если сменилась группа.
+    group_ids = getattr(instance, '_old_group_ids', ())
+    if not created and instance.group_id in group_ids:
+        return
+    paginators.forget_counts(*fragments.post_scopes(instance, group_ids))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_generations(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author', 'group'
+    ).first()
+    if post is not None:
+        fragments.bump(*fragments.post_scopes(post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follow_generations(sender, instance, **kwargs):
+    # Счетчики подписок видны на странице профиля.
+    fragments.bump(
+        fragments.author_scope(instance.user_id),
+        fragments.author_scope(instance.author_id),
+    )
+
+
+@receiver(post_save, sender=Group)
+def bump_group_generation(sender, instance, **kwargs):
+    # Название и адрес группы есть и на главной.
+    fragments.bump(
+        fragments.FEED,
+        fragments.group_scope(instance.pk),
+        fragments.group_info_scope(instance.pk),
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_old_names(sender, instance, raw=False, update_fields=None,
+                       **kwargs):
+    # Вход сохраняет только last_login: имена тогда не сравниваются.
+    instance._old_names = None
+    if instance.pk is None or raw or (
+        update_fields is not None
+        and not set(update_fields) & set(NAME_FIELDS)
+    ):
+        return
+    instance._old_names = User.objects.filter(pk=instance.pk).values_list(
+        *NAME_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=User)
+def bump_author_generations(sender, instance, **kwargs):
+    old_names = getattr(instance, '_old_names', None)
+    names = tuple(getattr(instance, field) for field in NAME_FIELDS)
+    if old_names is not None and old_names != names:
+        # Имя автора есть в лентах главной, его групп и подписок.
+        group_ids = Post.objects.filter(author=instance).exclude(
+            group=None
+        ).order_by().values_list('group_id', flat=True).distinct()
+        fragments.bump(
+            fragments.FEED,
+            fragments.author_scope(instance.pk),
+            fragments.author_info_scope(instance.pk),
+            *map(fragments.group_scope, group_ids),
+        )
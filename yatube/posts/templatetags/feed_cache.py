@@ -0,0 +1,57 @@
+from django import template
+
+from posts import fragments
+from posts.cards import attach_cards
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return fragments.cached(
+            self.fragment_name, vary_on,
+            lambda: self.nodelist.render(context),
+        )
+
+
+@register.tag('feedcache')
+def do_feedcache(parser, token):
+    """Кэширует фрагмент ленты по поколению его областей.
+
+    Использование::
+
+        {% feedcache index generation page_obj.cursor %}
+        ...
+        {% endfeedcache %}
+
+    Фрагмент живет ``FEED_CACHE_TIMEOUT`` секунд, но устаревает сразу,
+    как только сигналы сдвинут поколение в переменной ``generation``.
+    """
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 2:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires at least 1 argument."
+        )
+    return FeedCacheNode(
+        nodelist, tokens[1],
+        [parser.compile_filter(token) for token in tokens[2:]],
+    )
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Готовит карточки постов страницы, см. ``posts.cards``::
+
+        {% post_cards page_obj %}
+        {% for post in page_obj %}{{ post.card }}{% endfor %}
+    """
+    attach_cards(posts)
+    return ''
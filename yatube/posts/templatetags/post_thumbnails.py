@@ -0,0 +1,18 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, size):
+    """Миниатюра поста или заглушка; картинку тег не ресайзит.
+
+    Берет результат ``thumbnails.prefetch``, если страница его сделала.
+    Использование::
+
+        {% post_thumbnail post 'card' as im %}
+        {% if im %}<img src="{{ im.url }}">{% endif %}
+    """
+    return thumbnails.for_post(post, size)
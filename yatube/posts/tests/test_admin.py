@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class AdminChangeListTests(TestCase):
+    '''Списки постов и комментариев в админке не растут в запросах
+       и разметке вместе с таблицей.'''
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = Post.objects.count()
+        for number in range(start, start + count):
+            author = User.objects.create_user(username=f'user{number}')
+            group = Group.objects.create(
+                title=f'Группа {number}', slug=f'group-{number}',
+                description='Описание'
+            )
+            post = Post.objects.create(
+                author=author, group=group, text=f'Пост {number}'
+            )
+            Comment.objects.create(
+                post=post, author=author, text=f'Комментарий {number}'
+            )
+
+    def queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for name in ('admin:posts_post_changelist',
+                     'admin:posts_comment_changelist'):
+            with self.subTest(name=name):
+                self.add_rows(2)
+                few, _ = self.queries(reverse(name))
+                self.add_rows(20)
+                many, _ = self.queries(reverse(name))
+                self.assertEqual(few, many)
+
+    def test_long_text_is_truncated(self):
+        self.add_rows(1)
+        Post.objects.update(text='слово ' * 10000)
+        Comment.objects.update(text='реплика ' * 10000)
+        for name in ('admin:posts_post_changelist',
+                     'admin:posts_comment_changelist'):
+            with self.subTest(name=name):
+                _, response = self.queries(reverse(name))
+                self.assertLess(len(response.content), 20000)
+                self.assertContains(response, '…')
+
+    def test_editable_group_renders_only_selected_option(self):
+        self.add_rows(20)
+        _, response = self.queries(reverse('admin:posts_post_changelist'))
+        content = response.content.decode()
+        self.assertIn('admin-autocomplete', content)
+        # Пустой вариант и выбранная группа на каждой из 20 строк
+        # и два варианта в списке действий.
+        self.assertEqual(content.count('<option'), 20 * 2 + 2)
+
+    @override_settings(PAGINATOR_APPROXIMATE_COUNT=5)
+    def test_result_count_is_estimated(self):
+        self.add_rows(10)
+        Post.objects.filter(text='Пост 0').delete()
+        _, response = self.queries(reverse('admin:posts_post_changelist'))
+        last_pk = Post.objects.order_by('-pk').first().pk
+        self.assertEqual(response.context['cl'].result_count, last_pk)
+        _, response = self.queries(
+            reverse('admin:posts_post_changelist'), {'q': 'пост'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 6)
+
+    def test_date_hierarchy_lists_periods(self):
+        self.add_rows(3)
+        years = (2020, 2022, 2022)
+        for post, year in zip(Post.objects.order_by('pk'), years):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=timezone.make_aware(datetime(year, 5, 17))
+            )
+        url = reverse('admin:posts_post_changelist')
+        _, response = self.queries(url)
+        self.assertContains(response, '?pub_date__year=2020')
+        self.assertContains(response, '?pub_date__year=2022')
+        self.assertNotContains(response, '?pub_date__year=2021')
+        _, response = self.queries(url, {'pub_date__year': 2022})
+        self.assertContains(
+            response, '?pub_date__month=5&amp;pub_date__year=2022'
+        )
+
+    def test_autocomplete_uses_search_index(self):
+        self.add_rows(3)
+        response = self.client.get(
+            reverse('admin:posts_post_autocomplete'), {'term': 'пост 1'}
+        )
+        self.assertEqual(
+            [result['text'] for result in response.json()['results']],
+            ['Пост 1'],
+        )
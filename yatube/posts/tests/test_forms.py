@@ -1,9 +1,14 @@
+import io
 import shutil
 import tempfile
 
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from PIL import Image
 from django.urls import reverse
+from .. import images
 from ..models import Group, Post, Comment
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -146,3 +151,90 @@ class PostCreateFormTests(TestCase):
         post_2 = Post.objects.get(id=self.group.id)
         self.assertEqual(response_edit.status_code, 200)
         self.assertEqual(post_2.text, 'Измененный тестовый текст')
+
+
+def make_jpeg(size, orientation=None):
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    if orientation is not None:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, 'JPEG', exif=exif.tobytes())
+    return output.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_FORMAT='JPEG',
+                   IMAGE_MAX_SIDE=600)
+class ImageIngestTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='photographer')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, content, name='photo.jpg'):
+        return self.client.post(reverse('posts:post_create'), {
+            'text': 'Фото',
+            'image': SimpleUploadedFile(name, content, 'image/jpeg'),
+        })
+
+    def test_photo_is_rotated_downscaled_and_stripped(self):
+        '''Фото поворачивается по EXIF, уменьшается и теряет EXIF.'''
+        original = make_jpeg((1200, 800), orientation=6)
+        self.upload(original)
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (400, 600))
+            self.assertEqual(dict(stored.getexif()), {})
+        self.assertLess(post.image.size, len(original))
+
+    @override_settings(IMAGE_MAX_UPLOAD_BYTES=100)
+    def test_large_file_is_rejected(self):
+        '''Файл больше предела отклоняется до декодирования.'''
+        response = self.upload(make_jpeg((100, 100)))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 100\xa0байт.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_MAX_PIXELS=100 * 99)
+    def test_too_many_pixels_are_rejected(self):
+        '''Картинка больше предела пикселей отклоняется по заголовку.'''
+        response = self.upload(make_jpeg((100, 100)))
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка больше 9900 пикселей.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_truncated_file_is_rejected(self):
+        '''Обрезанный файл — ошибка формы, а не ошибка сервера.'''
+        original = make_jpeg((1200, 800))
+        response = self.upload(original[:len(original) // 2])
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response, 'form', 'image',
+            'Файл поврежден или не является картинкой.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_savings_are_reported(self):
+        '''Выигрыш приема копится в счетчиках и виден в команде.'''
+        original = make_jpeg((1200, 800))
+        self.upload(original)
+        counts = images.stats()
+        self.assertEqual(counts['images'], 1)
+        self.assertEqual(counts['bytes_in'], len(original))
+        self.assertEqual(counts['bytes_out'], Post.objects.get().image.size)
+        self.assertEqual(counts['pixels_out'], 600 * 400)
+        output, errors = io.StringIO(), io.StringIO()
+        call_command('image_ingest', scan=True, stdout=output, stderr=errors)
+        self.assertEqual(errors.getvalue(), '')
+        self.assertIn('Принято картинок: 1', output.getvalue())
+        self.assertIn('Измерено картинок: 1', output.getvalue())
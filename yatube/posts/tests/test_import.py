@@ -0,0 +1,195 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from .. import importer, search
+from ..models import AuthorStats, Comment, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class ImportContentTests(TestCase):
+    '''import_content грузит вход пачками, доводит счетчики и ленты
+       и продолжает прерванный импорт с контрольной точки.'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, rows, name='input.jsonl'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        return path
+
+    def rows(self, count=6):
+        rows = []
+        for number in range(count):
+            rows.append({
+                'kind': 'post', 'id': f'p{number}', 'author': 'author',
+                'group': 'group', 'text': f'Импортированный пост {number}',
+                'pub_date': f'2020-01-0{number + 1}T12:00:00',
+            })
+            rows.append({
+                'kind': 'comment', 'post': f'p{number}', 'author': 'reader',
+                'text': f'Ответ {number}', 'created': '2020-02-01T12:00:00',
+            })
+        return rows
+
+    def run_import(self, path, **options):
+        output = StringIO()
+        call_command('import_content', path, stdout=output, **options)
+        return output.getvalue()
+
+    def test_import_keeps_dates_and_reconciles_derived_data(self):
+        output = self.run_import(self.write(self.rows()), chunk_size=4)
+        self.assertIn('постов 6, комментариев 6', output)
+        self.assertIn('строк/с', output)
+        post = Post.objects.get(text='Импортированный пост 0')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.comments.get().text, 'Ответ 0')
+        self.assertEqual(AuthorStats.objects.get(user=self.author)
+                         .posts_count, 6)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 6
+        )
+        if search.available():
+            self.assertEqual(search.SearchResults('импортированный')
+                             .count(), 6)
+
+    def test_unknown_users_and_groups_are_skipped_or_created(self):
+        rows = [
+            {'kind': 'post', 'id': 1, 'author': 'newcomer',
+             'group': 'new-group', 'text': 'Новый автор'},
+            {'kind': 'follow', 'user': 'reader', 'author': 'newcomer'},
+            {'kind': 'follow', 'user': 'reader', 'author': 'reader'},
+        ]
+        output = self.run_import(self.write(rows))
+        self.assertIn('пропущено 3', output)
+        self.assertFalse(User.objects.filter(username='newcomer').exists())
+        self.run_import(
+            self.write(rows, 'again.jsonl'),
+            create_users=True, create_groups=True,
+        )
+        newcomer = User.objects.get(username='newcomer')
+        self.assertFalse(newcomer.has_usable_password())
+        self.assertTrue(Post.objects.filter(
+            author=newcomer, group__slug='new-group'
+        ).exists())
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=newcomer
+        ).exists())
+        self.assertEqual(AuthorStats.objects.get(user=newcomer)
+                         .followers_count, 1)
+
+    def test_csv_input(self):
+        path = os.path.join(self.directory, 'input.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('kind,id,post,author,group,text,pub_date\n')
+            file.write('post,7,,author,,Пост из CSV,2019-05-05T10:00:00\n')
+            file.write('comment,,7,reader,,Ответ из CSV,\n')
+        self.run_import(path)
+        post = Post.objects.get(text='Пост из CSV')
+        self.assertIsNone(post.group)
+        self.assertEqual(post.comments.get().text, 'Ответ из CSV')
+
+    def test_resume_after_failure(self):
+        path = self.write(self.rows())
+        load = importer.Importer._load
+        calls = []
+
+        def failing_load(self, chunk):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            return load(self, chunk)
+
+        with mock.patch.object(importer.Importer, '_load', failing_load):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, chunk_size=4)
+        self.assertEqual(Post.objects.count(), 2)
+        output = self.run_import(path, chunk_size=4)
+        self.assertIn('Продолжение со строки 4', output)
+        self.assertEqual(Post.objects.count(), 6)
+        self.assertEqual(Comment.objects.count(), 6)
+        for post in Post.objects.all():
+            number = post.text.rsplit(' ', 1)[1]
+            self.assertEqual(post.comments.get().text, f'Ответ {number}')
+        self.assertIn('уже завершен', self.run_import(path))
+        self.assertEqual(Post.objects.count(), 6)
+
+    def test_resume_after_crash_before_checkpoint(self):
+        '''Пачка зафиксирована, а точка не записана: повтор не падает.'''
+        path = self.write(self.rows())
+        save = importer.Checkpoint.save
+
+        def failing_save(self, **values):
+            if values.get('row') == 8:
+                raise RuntimeError('сбой')
+            return save(self, **values)
+
+        with mock.patch.object(importer.Checkpoint, 'save', failing_save):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, chunk_size=4)
+        self.assertEqual(Post.objects.count(), 4)
+        # Пост с сайта во время импорта не занимает id импорта.
+        Post.objects.create(author=self.reader, text='Пост с сайта')
+        output = self.run_import(path, chunk_size=4)
+        self.assertIn('постов 6, комментариев 6', output)
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 6)
+        self.assertEqual(Comment.objects.count(), 6)
+        self.assertTrue(Post.objects.filter(text='Пост с сайта').exists())
+
+    def test_deferred_indexes_are_restored(self):
+        def state():
+            with connection.cursor() as cursor:
+                indexes = set(connection.introspection.get_constraints(
+                    cursor, Comment._meta.db_table
+                ))
+                cursor.execute(
+                    "SELECT count(*) FROM sqlite_master WHERE type = "
+                    "'trigger'" if search.available() else 'SELECT 0'
+                )
+                return indexes, cursor.fetchone()[0]
+
+        before = state()
+        self.run_import(self.write(self.rows()), defer_indexes=True)
+        self.assertEqual(state(), before)
+        self.assertIn('comment_created_idx', before[0])
+        if search.available():
+            self.assertEqual(search.SearchResults('ответ').count(), 6)
+
+    def test_deferred_indexes_are_restored_after_failure(self):
+        old = Post.objects.create(author=self.author, text='Старый пост')
+        before = importer._existing_indexes(Post)
+
+        def failing_load(self, chunk):
+            # Правка на сайте, пока триггеры поиска сняты.
+            Post.objects.filter(pk=old.pk).update(text='Исправленный пост')
+            raise importer.InputError('плохая строка')
+
+        with mock.patch.object(importer.Importer, '_load', failing_load):
+            with self.assertRaises(CommandError):
+                self.run_import(self.write(self.rows()), defer_indexes=True)
+        self.assertEqual(importer._existing_indexes(Post), before)
+        if search.available():
+            self.assertEqual(search.SearchResults('исправленный').count(), 1)
+            self.assertEqual(search.SearchResults('старый').count(), 0)
@@ -0,0 +1,140 @@
+import re
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)$')
+TEMP_SORT = 'USE TEMP B-TREE'
+# Каждый COUNT(*) страниц — по своему индексу. Проход по всему
+# покрывающему индексу тоже скан, поэтому индекс назван явно. Число
+# без фильтра считается, только пока таблица не больше
+# PAGINATOR_APPROXIMATE_COUNT, и для лент — раз на время жизни кэша.
+COUNT_PLANS = (
+    (r'FROM "posts_post"$',
+     r'SCAN posts_post USING (COVERING )?INDEX posts_post_group_id_\w+$'),
+    (r'FROM "posts_comment"$',
+     r'SCAN posts_comment USING (COVERING )?INDEX '
+     r'posts_comment_post_id_\w+$'),
+    (r'WHERE "posts_post"\."group_id" = \d+$',
+     r'SEARCH posts_post USING (COVERING )?INDEX posts_post_group_id_\w+ '
+     r'\(group_id=\?\)$'),
+    (r'"posts_post"\."pub_date" >= ',
+     r'SEARCH posts_post USING (COVERING )?INDEX post_pub_date_idx \('),
+    (r'"posts_comment"\."created" >= ',
+     r'SEARCH posts_comment USING (COVERING )?INDEX comment_created_idx \('),
+)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTests(TestCase):
+    '''Запросы страниц ленты идут по индексам, без полного скана
+       таблиц и сортировки во временном B-дереве.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        for number in range(15):
+            post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {number}'
+            )
+        Comment.objects.create(post=post, author=cls.reader, text='Текст')
+        cls.post = post
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        # Иначе запросы страницы спрячутся за кэшем фрагментов.
+        cache.clear()
+        self.tables = connection.introspection.table_names()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_plans_use_indexes(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            plan = self.explain(sql)
+            if sql.startswith('SELECT COUNT('):
+                self.assert_count_plan(sql, plan)
+            for step in plan:
+                with self.subTest(url=url, sql=sql, step=step):
+                    # Проход по результату подзапроса — не скан таблицы.
+                    scan = FULL_SCAN.match(step)
+                    self.assertFalse(scan and scan['table'] in self.tables)
+                    self.assertNotIn(TEMP_SORT, step)
+        return response
+
+    def assert_count_plan(self, sql, plan):
+        with self.subTest(sql=sql, plan=plan):
+            expected = [
+                step_pattern for sql_pattern, step_pattern in COUNT_PLANS
+                if re.search(sql_pattern, sql)
+            ]
+            self.assertTrue(expected, 'COUNT(*) без ожидаемого плана')
+            self.assertTrue(any(
+                re.match(expected[0], step) for step in plan
+            ))
+
+    def assert_feed_plans(self, url):
+        response = self.assert_plans_use_indexes(url)
+        cursor = response.context['page_obj'].next_cursor
+        response = self.assert_plans_use_indexes(url, {'cursor': cursor})
+        cursor = response.context['page_obj'].previous_cursor
+        self.assert_plans_use_indexes(url, {'cursor': cursor})
+
+    def test_index_plans(self):
+        self.assert_feed_plans(reverse('posts:index'))
+
+    def test_group_list_plans(self):
+        self.assert_feed_plans(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+
+    def test_profile_plans(self):
+        self.assert_feed_plans(
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username})
+        )
+
+    def test_follow_index_plans(self):
+        self.assert_feed_plans(reverse('posts:follow_index'))
+
+    def test_post_detail_plans(self):
+        self.assert_plans_use_indexes(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+
+    def test_admin_changelist_plans(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        year = self.post.pub_date.year
+        for name, field in (('admin:posts_post_changelist', 'pub_date'),
+                            ('admin:posts_comment_changelist', 'created')):
+            url = reverse(name)
+            self.assert_plans_use_indexes(url)
+            self.assert_plans_use_indexes(url, {f'{field}__year': year})
@@ -0,0 +1,109 @@
+import html
+import re
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="[^"]*"')
+
+
+def normalize(content):
+    # Движки по-разному расставляют пробелы и экранируют кавычки,
+    # а CSRF-токен маскируется заново на каждый рендер.
+    text = html.unescape(content.decode())
+    text = CSRF_TOKEN.sub('name="csrfmiddlewaretoken"', text)
+    text = re.sub(r'\s+', ' ', text)
+    return re.sub(r'> <', '><', text).strip()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class JinjaParityTests(TestCase):
+    '''Шаблоны Jinja2 дают тот же HTML, что и шаблоны Django.'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа "Классики"', slug='classics',
+            description='Описание <группы>'
+        )
+        for number in range(12):
+            post = Post.objects.create(
+                author=cls.author,
+                group=cls.group if number % 2 else None,
+                text=f'Пост №{number} & "кавычки" <b>',
+            )
+        post.image = SimpleUploadedFile(
+            'small.gif', SMALL_GIF, content_type='image/gif'
+        )
+        post.save()
+        for number in range(4):
+            Comment.objects.create(
+                post=post, author=cls.reader, text=f'Комментарий {number}'
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = post
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def render(self, client, engine, url, params=None):
+        cache.clear()
+        with self.settings(POSTS_TEMPLATE_ENGINE=engine):
+            response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_parity(self, client, url, params=None):
+        django = self.render(client, 'django', url, params)
+        jinja = self.render(client, 'jinja2', url, params)
+        self.assertEqual(normalize(jinja.content), normalize(django.content))
+        return django
+
+    def test_pages_match(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        reader = Client()
+        reader.force_login(self.reader)
+        for client in (Client(), reader):
+            for url in urls:
+                if url == urls[3] and client is not reader:
+                    continue
+                with self.subTest(url=url, user=client is reader):
+                    response = self.assert_parity(client, url)
+                    page_obj = response.context and response.context.get(
+                        'page_obj'
+                    )
+                    if page_obj and page_obj.next_cursor:
+                        self.assert_parity(
+                            client, url, {'cursor': page_obj.next_cursor}
+                        )
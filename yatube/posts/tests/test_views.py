@@ -1,20 +1,35 @@
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from .. import fragments, thumbnails, views
+from ..cards import attach_cards
 from ..forms import PostForm
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from core.cache import stampede
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 
-from ..models import Group, Post, Follow
+from ..paginators import FeedPaginator
+from ..models import (
+    Comment, Group, Post, Follow, ThumbnailTask, TimelineEntry
+)
 
 
 User = get_user_model()
 
+# Картинки лежат в хранилище по содержимому: posts/ab/cd/abcd….gif.
+SMALL_GIF_NAME = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
+
 
 class PostsPagesTests(TestCase):
 
@@ -90,7 +105,7 @@ class PostsPagesTests(TestCase):
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response.context['posts'][0].text,
                          PostsPagesTests.post.text)
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertRegex(Post.objects.first().image.name, SMALL_GIF_NAME)
 
     def test_group_list_correct_context(self):
 
@@ -100,7 +115,7 @@ class PostsPagesTests(TestCase):
         ))
         self.assertEqual(response.context['group'].title,
                          PostsPagesTests.group.title)
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertRegex(Post.objects.first().image.name, SMALL_GIF_NAME)
 
     def test_profile_correct_context(self):
 
@@ -110,7 +125,7 @@ class PostsPagesTests(TestCase):
         ))
         self.assertEqual(response.context['author_posts'][0].author,
                          PostsPagesTests.user)
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertRegex(Post.objects.first().image.name, SMALL_GIF_NAME)
 
     def test_post_detail_correct_context(self):
 
@@ -120,7 +135,7 @@ class PostsPagesTests(TestCase):
         ))
         self.assertEqual(response.context['post_id'],
                          int(PostsPagesTests.post.id))
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertRegex(Post.objects.first().image.name, SMALL_GIF_NAME)
 
     def test_post_edit_correct_context(self):
 
@@ -150,6 +165,269 @@ class PostsPagesTests(TestCase):
         self.assertEqual(post1, post2)
 
 
+class FragmentCacheTests(TestCase):
+    '''Фрагменты лент сбрасываются сразу по поколениям.'''
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Первый пост'
+        )
+
+    def test_new_post_is_visible_immediately(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+        ]
+        for url in urls:
+            self.client.get(url)
+        Post.objects.create(
+            author=self.author, group=self.group, text='Свежий пост'
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
+
+    def test_edited_post_leaves_old_group(self):
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.assertContains(self.client.get(url), 'Первый пост')
+        self.post.group = None
+        self.post.save()
+        self.assertNotContains(self.client.get(url), 'Первый пост')
+
+    def test_hits_and_misses_are_counted(self):
+        self.client.force_login(self.author)
+        url = reverse('posts:profile',
+                      kwargs={'username': self.author.username})
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(
+            fragments.stats()['profile'], {'hits': 1, 'misses': 1}
+        )
+
+    def test_post_cards_are_shared_between_feeds(self):
+        self.client.force_login(self.author)
+        Post.objects.create(author=self.author, text='Второй пост')
+        self.client.get(reverse('posts:index'))
+        self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+        self.assertEqual(
+            fragments.stats()['card'], {'hits': 2, 'misses': 2}
+        )
+
+    def test_author_rename_invalidates_cards(self):
+        posts = Post.objects.select_related('author')
+        attach_cards(posts.all())
+        self.author.first_name = 'Лев'
+        self.author.last_name = 'Толстой'
+        self.author.save()
+        self.assertIn('Лев Толстой', attach_cards(posts.all())[0].card)
+        self.author.save(update_fields=['last_login'])
+        attach_cards(posts.all())
+        self.assertEqual(
+            fragments.stats()['card'], {'hits': 1, 'misses': 2}
+        )
+
+    def test_renames_reach_cached_feeds(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        ]
+        for url in urls:
+            self.client.get(url)
+        self.author.first_name = 'Новое'
+        self.author.last_name = 'Имя'
+        self.author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Новое Имя')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.client.get(urls[1]), 'Новое название')
+
+    def test_edit_invalidates_one_card(self):
+        self.client.force_login(self.author)
+        Post.objects.create(author=self.author, text='Второй пост')
+        self.client.get(reverse('posts:index'))
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            {'text': 'Исправленный пост'},
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Исправленный пост')
+        self.assertEqual(
+            fragments.stats()['card'], {'hits': 1, 'misses': 3}
+        )
+
+
+class PageCacheTests(TestCase):
+    '''Анонимные страницы отдаются из кэша целиком до смены тегов.'''
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+
+    def test_anonymous_page_is_served_without_queries(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Пост')
+
+    def test_tags_invalidate_cached_pages(self):
+        url = reverse('posts:profile',
+                      kwargs={'username': self.author.username})
+        self.client.get(url)
+        Post.objects.create(author=self.author, text='Свежий пост')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Свежий пост')
+
+    @override_settings(DEBUG=True)
+    def test_diagnostic_headers_are_not_cached(self):
+        url = reverse('posts:index')
+        client = Client()
+        self.assertTrue(client.get(url).has_header('X-Query-Count'))
+        response = client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertFalse(response.has_header('X-Query-Count'))
+
+    def test_logged_in_pages_are_not_cached(self):
+        self.client.force_login(self.author)
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+
+class ConditionalGetTests(TestCase):
+    '''Неизменившиеся страницы отдаются ответом 304 до работы view.'''
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост'
+        )
+        self.client.force_login(self.author)
+        self.urls = (
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+        )
+
+    def test_matching_etag_returns_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                # Сессия, пользователь и один запрос валидатора.
+                with self.assertNumQueries(3):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+
+    def test_if_modified_since(self):
+        url = self.urls[0]
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_update_validators(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            {'text': 'Исправленный пост', 'group': self.group.pk},
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        Comment.objects.create(post=self.post, author=self.author, text='К')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 3)
+
+    def test_anonymous_cached_page_returns_not_modified(self):
+        client = Client()
+        etag = client.get(self.urls[0])['ETag']
+        with self.assertNumQueries(0):
+            response = client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    '''В режиме DEBUG число запросов сверяется с бюджетом view.'''
+
+    @override_settings(DEBUG=True, QUERY_BUDGET_RAISE=True)
+    def test_query_count_header(self):
+        user = User.objects.create_user(username='author')
+        Post.objects.create(author=user, text='Пост')
+        response = Client().get(reverse('posts:index'))
+        self.assertLessEqual(
+            int(response['X-Query-Count']), views.index.query_budget
+        )
+
+
+class CommentPreviewTests(TestCase):
+    '''Карточки ленты показывают число и последние комментарии.'''
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client.force_login(self.author)
+
+    def test_latest_comments_on_card(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        for number in range(settings.COMMENT_PREVIEW_SIZE + 2):
+            Comment.objects.create(
+                post=post, author=self.author, text=f'Комментарий {number}'
+            )
+        response = self.client.get(reverse('posts:index'))
+        page_post = response.context['page_obj'][0]
+        self.assertEqual(page_post.comments_count,
+                         settings.COMMENT_PREVIEW_SIZE + 2)
+        self.assertEqual(
+            [comment.text for comment in page_post.latest_comments()],
+            [f'Комментарий {number}' for number in range(
+                settings.COMMENT_PREVIEW_SIZE + 1, 1, -1
+            )]
+        )
+        self.assertNotContains(response, 'Комментарий 0')
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        posts = Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {number}')
+            for number in range(100)
+        )
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.author, text='Комментарий')
+            for post in posts
+        )
+        counts = []
+        for size in (10, 100):
+            cache.clear()
+            with mock.patch.object(views, 'per_page', size):
+                with CaptureQueriesContext(connection) as context:
+                    self.client.get(reverse('posts:index'))
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+
 class PaginatorViewsTest(TestCase):
     '''Тестирование работы паджинатора.'''
 
@@ -172,6 +450,7 @@ class PaginatorViewsTest(TestCase):
         Post.objects.bulk_create(cls.posts)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.create_user(username='username')
         self.authorized_client = Client()
@@ -211,6 +490,121 @@ class PaginatorViewsTest(TestCase):
                 len(response.context.get('page_obj').object_list), 3
             )
 
+    def test_cursor_links_walk_the_feed(self):
+        '''Курсоры следующей и предыдущей страниц ведут по ленте.'''
+        url = reverse('posts:index')
+        first_page = self.client.get(url).context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        response = self.client.get(
+            url, {'cursor': first_page.next_cursor}
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page.object_list), 3)
+        self.assertEqual(second_page.number, 2)
+        self.assertFalse(second_page.has_next())
+        response = self.client.get(
+            url, {'cursor': second_page.previous_cursor}
+        )
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            list(first_page.object_list)
+        )
+
+    def test_legacy_page_resolves_to_cursor(self):
+        '''Ссылка ?page=N отдает ту же страницу, что и курсор.'''
+        url = reverse('posts:index')
+        first_page = self.client.get(url).context['page_obj']
+        by_number = self.client.get(url, {'page': 2}).context['page_obj']
+        by_cursor = self.client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(by_number.cursor, first_page.next_cursor)
+        self.assertEqual(
+            list(by_number.object_list), list(by_cursor.object_list)
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        '''Битый курсор отдает первую страницу.'''
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(
+            len(response.context['page_obj'].object_list), 10
+        )
+
+    def test_page_range_is_elided(self):
+        '''Номера страниц сворачиваются вокруг текущей.'''
+        paginator = FeedPaginator(Post.objects.all(), 10, count=50000)
+        self.assertEqual(
+            list(paginator.get_elided_page_range(1)),
+            [1, 2, 3, '…']
+        )
+        with override_settings(PAGINATOR_APPROXIMATE_COUNT=100000):
+            self.assertEqual(
+                list(paginator.get_elided_page_range(2500)),
+                [1, '…', 2498, 2499, 2500, 2501, 2502, '…', 5000]
+            )
+
+    def test_page_links_resolve_without_offset(self):
+        '''Каждая ссылка на номер страницы открывает эту страницу
+           без OFFSET.'''
+        Post.objects.bulk_create(
+            Post(text=f'Еще пост №{i}', author=self.author)
+            for i in range(60)
+        )
+        url = reverse('posts:index')
+        ordered = list(Post.objects.order_by('-pub_date', '-pk'))
+        page = self.authorized_client.get(url).context['page_obj']
+        for _ in range(3):
+            page = self.authorized_client.get(
+                url, {'cursor': page.next_cursor}
+            ).context['page_obj']
+        self.assertEqual(page.number, 4)
+        links = [link for link in page.page_links if link[1] is not None]
+        self.assertEqual(
+            [number for number, _ in links], [1, 2, 3, 5, 6, 7, 8]
+        )
+        for number, query in links:
+            with self.subTest(number=number):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.authorized_client.get(f'{url}?{query}')
+                self.assertFalse(
+                    any('OFFSET' in query['sql'] for query in context)
+                )
+                target = response.context['page_obj']
+                self.assertEqual(target.number, number)
+                self.assertEqual(
+                    list(target.object_list),
+                    ordered[(number - 1) * 10:number * 10]
+                )
+
+    def test_count_is_cached_and_reset_by_new_post(self):
+        '''Число постов считается раз и сбрасывается новым постом.'''
+        url = reverse('posts:index')
+        self.assertEqual(
+            self.client.get(url).context['page_obj'].paginator.count, 13
+        )
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url, {'page': 2})
+        self.assertFalse(
+            any('COUNT' in query['sql'] for query in context)
+        )
+        Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(
+            self.client.get(url).context['page_obj'].paginator.count, 14
+        )
+
+    @override_settings(PAGINATOR_APPROXIMATE_COUNT=10)
+    def test_large_count_is_approximate(self):
+        '''Большое число записей показывается приблизительно.'''
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertContains(response, 'около 13')
+        Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+
 
 class FollowTests(TestCase):
     def setUp(self):
@@ -255,3 +649,332 @@ class FollowTests(TestCase):
             '/follow/'
         )
         self.assertNotContains(response, self.post.text)
+
+    def test_timeline_is_filled_and_pruned(self):
+        '''Лента подписок пополняется при подписке и новом посте
+           и очищается при отписке.'''
+        self.client_auth_follower.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.user_following.username})
+        )
+        Post.objects.create(author=self.user_following, text='Новый пост')
+        timeline = TimelineEntry.objects.filter(user=self.user_follower)
+        self.assertEqual(timeline.count(), 2)
+        self.client_auth_follower.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user_following.username})
+        )
+        self.assertFalse(timeline.exists())
+
+    def test_rebuild_timelines_command(self):
+        '''Команда rebuild_timelines восстанавливает ленты.'''
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        TimelineEntry.objects.all().delete()
+        output = StringIO()
+        call_command('rebuild_timelines', stdout=output)
+        self.assertIn('подписок обработано: 1', output.getvalue())
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(
+            list(response.context['page_obj'].object_list), [self.post]
+        )
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=1)
+    def test_hybrid_feed_merges_pulled_authors(self):
+        '''Посты авторов выше порога не раскладываются по лентам,
+           а подмешиваются в ленту при чтении.'''
+        popular = User.objects.create_user(username='popular')
+        Follow.objects.create(user=self.user_following, author=popular)
+        Follow.objects.create(user=self.user_follower, author=popular)
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        pulled_post = Post.objects.create(author=popular, text='Звезда')
+        pushed_post = Post.objects.create(
+            author=self.user_following, text='Обычный автор'
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=pulled_post).exists()
+        )
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            [pushed_post, pulled_post, self.post]
+        )
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=1)
+    def test_author_back_under_threshold_is_pushed(self):
+        '''Посты, опубликованные выше порога, остаются в ленте, когда
+           автор опускается до порога.'''
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        Follow.objects.create(user=reader, author=self.user_following)
+        pulled_post = Post.objects.create(
+            author=self.user_following, text='Выше порога'
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=pulled_post).exists()
+        )
+        Follow.objects.filter(user=reader).delete()
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            [pulled_post, self.post]
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ThumbnailTests(TestCase):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, name='small.gif', shade=0xFF):
+        # Оттенок второго цвета палитры дает картинки с разным
+        # содержимым: одинаковые хранилище сложило бы в один файл.
+        content = self.small_gif.replace(b'\xFF\xFF\xFF', bytes([shade] * 3))
+        return SimpleUploadedFile(name, content, 'image/gif')
+
+    def create_post(self):
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой', 'image': self.upload(),
+        })
+        return Post.objects.get()
+
+    def page(self, url):
+        response = self.client.get(url)
+        return response.content.decode()
+
+    def test_create_enqueues_without_resizing(self):
+        '''Создание поста ставит миниатюры в очередь, а страницы
+           до нарезки показывают заглушку.'''
+        with mock.patch.object(thumbnails, 'get_thumbnail') as resize:
+            post = self.create_post()
+            index = self.page(reverse('posts:index'))
+            detail = self.page(
+                reverse('posts:post_detail', args=[post.pk])
+            )
+        resize.assert_not_called()
+        self.assertEqual(
+            list(ThumbnailTask.objects.values_list('post', 'size')),
+            [(post.pk, size) for size in thumbnails.SIZES]
+        )
+        self.assertIn('data:image/svg+xml', index)
+        self.assertIn('data:image/svg+xml', detail)
+
+    def test_worker_generates_and_publishes(self):
+        '''Воркер нарезает миниатюру, и страницы показывают ее.'''
+        post = self.create_post()
+        self.page(reverse('posts:index'))
+        call_command('thumbnail_worker', workers=0, once=True,
+                     stdout=StringIO())
+        self.assertFalse(ThumbnailTask.objects.exists())
+        post.refresh_from_db()
+        thumbnail = thumbnails.for_post(post, 'card')
+        self.assertFalse(getattr(thumbnail, 'pending', False))
+        self.assertTrue(thumbnail.exists())
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        index = self.page(reverse('posts:index'))
+        self.assertIn(thumbnail.url, index)
+        self.assertNotIn('data:image/svg+xml', index)
+
+    def test_failed_task_is_retried(self):
+        '''Неудачная нарезка остается в очереди и повторяется
+           после паузы.'''
+        self.create_post()
+        with mock.patch.object(thumbnails, 'get_thumbnail',
+                               side_effect=OSError('битый файл')):
+            call_command('thumbnail_worker', workers=0, once=True,
+                         stdout=StringIO())
+        task = ThumbnailTask.objects.get()
+        self.assertEqual(task.attempts, 1)
+        self.assertIn('битый файл', task.error)
+        self.assertEqual(task.claimed_by, '')
+        self.assertGreater(task.available_at, timezone.now())
+        ThumbnailTask.objects.update(available_at=timezone.now())
+        call_command('thumbnail_worker', workers=0, once=True,
+                     stdout=StringIO())
+        self.assertFalse(ThumbnailTask.objects.exists())
+
+    def test_claimed_tasks_go_to_one_worker(self):
+        '''Захваченные задачи не достаются второму воркеру, пока
+           захват не истек.'''
+        post = self.create_post()
+        claimed = thumbnails.claim('first', 10)
+        self.assertEqual(
+            [(post_id, size) for _, post_id, size in claimed],
+            [(post.pk, size) for size in thumbnails.SIZES]
+        )
+        self.assertEqual(thumbnails.claim('second', 10), [])
+        ThumbnailTask.objects.update(available_at=timezone.now())
+        self.assertEqual(len(thumbnails.claim('second', 10)), len(claimed))
+
+    def test_name_matches_sorl(self):
+        '''Имя готовой миниатюры совпадает с именем из sorl.'''
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload()
+        )
+        geometry, options = thumbnails.SIZES['card']
+        generated = thumbnails.get_thumbnail(post.image, geometry, **options)
+        self.assertEqual(
+            thumbnails.thumbnail_file(post.image, 'card').name,
+            generated.name
+        )
+
+    def test_edit_without_new_image_does_not_enqueue(self):
+        '''Правка текста не ставит миниатюры в очередь заново.'''
+        post = self.create_post()
+        ThumbnailTask.objects.all().delete()
+        self.client.post(
+            reverse('posts:post_edit', args=[post.pk]), {'text': 'Правка'}
+        )
+        self.assertFalse(ThumbnailTask.objects.exists())
+        self.client.post(reverse('posts:post_edit', args=[post.pk]), {
+            'text': 'Новая картинка', 'image': self.upload('other.gif'),
+        })
+        self.assertEqual(ThumbnailTask.objects.count(), len(thumbnails.SIZES))
+
+    def test_page_fetches_thumbnails_in_one_batch(self):
+        '''Метаданные миниатюр страницы читаются одной пачкой,
+           а счетчики запроса видны в заголовке и в статистике.'''
+        for number in range(5):
+            Post.objects.create(
+                author=self.user, text=f'Пост {number}',
+                image=self.upload(f'{number}.gif', shade=number)
+            )
+        call_command('thumbnail_worker', workers=0, all=True, once=True,
+                     stdout=StringIO())
+        self.assertEqual(stampede.stats()['thumbnail:worker']['recomputes'], 5)
+        Post.objects.create(
+            author=self.user, text='Свежий',
+            image=self.upload('new.gif', shade=0x80)
+        )
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in context.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertTrue(
+            response['X-Thumbnails'].startswith('hits=5, misses=1, ms=')
+        )
+        self.assertEqual(stampede.stats()['thumbnail:index']['hits'], 5)
+        # Повторный рендер берет готовые карточки и не ищет миниатюры.
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('X-Thumbnails', response)
+
+
+class SearchTests(TestCase):
+    '''Поиск идет по индексу FTS5, который держат в курсе триггеры.'''
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='tolstoy')
+        self.other = User.objects.create_user(username='chekhov')
+        self.group = Group.objects.create(
+            title='Проза', slug='prose', description='Описание'
+        )
+        self.client = Client()
+
+    def found(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [post.text for post in response.context['page_obj']]
+
+    def test_ranking_and_prefix(self):
+        Post.objects.create(author=self.author, text='Война и мир, война')
+        Post.objects.create(
+            author=self.author,
+            text='Про войну здесь одно слово и много других слов ' * 3,
+        )
+        Post.objects.create(author=self.author, text='Анна Каренина')
+        self.assertEqual(
+            self.found('война')[0], 'Война и мир, война'
+        )
+        self.assertEqual(len(self.found('вой')), 2)
+        self.assertEqual(self.found('каренина'), ['Анна Каренина'])
+        self.assertEqual(self.found('"OR*'), [])
+
+    def test_comment_finds_post_and_triggers_keep_index(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.other, text='Отличный рассказ'
+        )
+        self.assertEqual(self.found('рассказ'), ['Пост'])
+        Comment.objects.filter(pk=comment.pk).update(text='Скучно')
+        self.assertEqual(self.found('рассказ'), [])
+        Post.objects.filter(pk=post.pk).update(text='Новый текст')
+        self.assertEqual(self.found('скучно'), ['Новый текст'])
+        self.assertEqual(self.found('новый'), ['Новый текст'])
+        post.delete()
+        self.assertEqual(self.found('новый'), [])
+
+    def test_group_and_author_filters(self):
+        Post.objects.create(author=self.author, text='Степь', group=self.group)
+        Post.objects.create(author=self.other, text='Степь')
+        self.assertEqual(len(self.found('степь')), 2)
+        self.assertEqual(len(self.found('степь', group='prose')), 1)
+        self.assertEqual(len(self.found('степь', author='chekhov')), 1)
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'степь', 'group': 'missing'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_snippet_is_escaped_and_pages_keep_query(self):
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'<b>Сад</b> номер {number}')
+            for number in range(12)
+        )
+        response = self.client.get(reverse('posts:search'), {'q': 'сад'})
+        self.assertContains(response, '&lt;b&gt;<mark>Сад</mark>&lt;/b&gt;')
+        self.assertContains(response, '?q=%D1%81%D0%B0%D0%B4&page=2')
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+
+    def test_admin_search_and_rebuild(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        post = Post.objects.create(author=self.author, text='Вишневый сад')
+        Comment.objects.create(post=post, author=self.other, text='Сад!')
+        Post.objects.create(author=self.author, text='Чайка')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'сад'}
+        )
+        self.assertEqual(list(response.context['cl'].result_list), [post])
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'сад'}
+        )
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_search')
+        self.assertEqual(self.found('сад'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('строк: 3', out.getvalue())
+        self.assertEqual(self.found('сад'), ['Вишневый сад'])
@@ -0,0 +1,257 @@
+"""Миниатюры картинок постов, нарезанные заранее.
+
+Шаблоны не ресайзят картинки сами: ``post_create`` и ``post_edit``
+ставят в очередь ``ThumbnailTask`` все размеры из ``SIZES``, а команда
+``thumbnail_worker`` нарезает их в пуле процессов. Пока миниатюры нет,
+страница показывает заглушку того же размера. Метаданные миниатюр
+страницы читаются одной пачкой в ``prefetch``, а счетчики попаданий
+за запрос собирает ``core.middleware.ThumbnailStatsMiddleware``.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from sorl.thumbnail.parsers import parse_geometry
+
+from core.cache.stampede import record
+
+from . import fragments
+from .models import Post, ThumbnailTask
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, которые используют шаблоны: имя -> (геометрия, опции).
+SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" '
+    'viewBox="0 0 {0} {1}"><rect width="100%" height="100%" '
+    'fill="#e9ecef"/></svg>'
+)
+
+
+class Placeholder:
+    """Заглушка вместо миниатюры, которая еще не готова."""
+
+    pending = True
+
+    def __init__(self, geometry):
+        self.width, self.height = parse_geometry(geometry)
+        svg = PLACEHOLDER_SVG.format(self.width, self.height)
+        self.url = f'data:image/svg+xml,{quote(svg)}'
+
+
+def thumbnail_file(source, size):
+    """Файл миниатюры размера ``size``, без обращения к хранилищу.
+
+    Имя считается так же, как в ``ThumbnailBackend.get_thumbnail``:
+    опции по умолчанию дополняются из настроек sorl.
+    """
+    geometry, options = SIZES[size]
+    backend = default.backend
+    source = ImageFile(source)
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+class PageStats:
+    """Поиски миниатюр за один запрос: попадания, заглушки и время."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    @property
+    def ms(self):
+        return round(self.seconds * 1000)
+
+    def publish(self, prefix):
+        """Добавляет счетчики страницы к общим (см. ``cache_stats``)."""
+        for metric, amount in (('hits', self.hits), ('misses', self.misses)):
+            if amount:
+                record(prefix, metric, amount)
+
+
+_page = threading.local()
+
+
+def start_page():
+    _page.stats = PageStats()
+
+
+def finish_page():
+    stats = getattr(_page, 'stats', None) or PageStats()
+    _page.stats = None
+    return stats
+
+
+def _fetch_raw(keys):
+    """Сырые значения хранилища ключей sorl для пачки ключей.
+
+    Для ``cached_db`` это один ``get_many`` кэша и один запрос к базе
+    на промахи кэша; отсутствие миниатюры тоже кэшируется, как это
+    делает сам sorl. Другие хранилища опрашиваются поштучно.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    kv_cache = kvstore.cache
+    values = kv_cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing
+        ).values_list('key', 'value'))
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kv_cache.set_many(fetched, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        key: None if value == EMPTY_VALUE else value
+        for key, value in values.items()
+    }
+
+
+def prefetch(posts, sizes=tuple(SIZES)):
+    """Дает постам ``thumbnails``: готовые миниатюры или заглушки.
+
+    Метаданные миниатюр всех постов читаются одной пачкой, а не
+    отдельным запросом на каждый тег. Смотрит только в хранилище
+    ключей sorl и никогда не ресайзит.
+    """
+    started = time.monotonic()
+    wanted = []
+    for post in posts:
+        found = post.__dict__.setdefault('thumbnails', {})
+        for size in sizes:
+            found[size] = None
+            if post.image:
+                file = thumbnail_file(post.image, size)
+                wanted.append((found, size, add_prefix(file.key)))
+    if not wanted:
+        return posts
+    values = _fetch_raw(list({key for _, _, key in wanted}))
+    stats = getattr(_page, 'stats', None) or PageStats()
+    for found, size, key in wanted:
+        if values.get(key):
+            found[size] = deserialize_image_file(values[key])
+            stats.hits += 1
+        else:
+            found[size] = Placeholder(SIZES[size][0])
+            stats.misses += 1
+    stats.seconds += time.monotonic() - started
+    return posts
+
+
+def for_post(post, size):
+    """Миниатюра поста из ``prefetch`` или, если ее не было, поиском."""
+    prefetched = getattr(post, 'thumbnails', {})
+    if size not in prefetched:
+        prefetch([post], (size,))
+    return post.thumbnails[size]
+
+
+def enqueue(post):
+    """Ставит в очередь все размеры миниатюр картинки поста."""
+    if post.image:
+        ThumbnailTask.objects.bulk_create(
+            ThumbnailTask(post=post, size=size) for size in SIZES
+        )
+
+
+def claim(worker, limit):
+    """Забирает до ``limit`` доступных задач для воркера ``worker``.
+
+    Захват — условный UPDATE по ``available_at``: задачу, которую
+    одновременно выбрали два воркера, получит только один. Возвращает
+    кортежи (pk, post_id, size) захваченных задач.
+    """
+    now = timezone.now()
+    available = ThumbnailTask.objects.filter(
+        available_at__lte=now, attempts__lt=settings.THUMBNAIL_MAX_ATTEMPTS
+    )
+    with transaction.atomic():
+        pks = list(available.values_list('pk', flat=True)[:limit])
+        available.filter(pk__in=pks).update(
+            claimed_by=worker,
+            available_at=now + timedelta(
+                seconds=settings.THUMBNAIL_CLAIM_TIMEOUT
+            ),
+        )
+    return list(ThumbnailTask.objects.filter(
+        pk__in=pks, claimed_by=worker
+    ).values_list('pk', 'post_id', 'size'))
+
+
+def fail(pks, error):
+    """Возвращает задачи в очередь после неудачи, с паузой до повтора."""
+    ThumbnailTask.objects.filter(pk__in=pks).update(
+        claimed_by='',
+        attempts=F('attempts') + 1,
+        error=error,
+        available_at=timezone.now() + timedelta(
+            seconds=settings.THUMBNAIL_RETRY_DELAY
+        ),
+    )
+
+
+def generate(post_id, size):
+    """Нарезает одну миниатюру; выполняется в процессе пула.
+
+    Возвращает пару (время нарезки в секундах, ошибка). Если нарезать
+    нечего — поста или картинки уже нет, — обе части None.
+    """
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is None or not post.image:
+        return None, None
+    geometry, options = SIZES[size]
+    started = time.monotonic()
+    try:
+        get_thumbnail(post.image, geometry, **options)
+    except Exception as error:
+        logger.exception('Не удалось нарезать миниатюру %s', post.image)
+        return None, repr(error)
+    return time.monotonic() - started, None
+
+
+def publish(post_ids):
+    """Сбрасывает карточки и страницы постов с готовыми миниатюрами.
+
+    Как и новый комментарий, новая миниатюра меняет версию поста,
+    а с ней ключ карточки и валидаторы условных запросов.
+    """
+    Post.objects.filter(pk__in=post_ids).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    for post in Post.objects.filter(pk__in=post_ids).only('author', 'group'):
+        fragments.bump(*fragments.post_scopes(post))
@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.db import connection
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+BATCH_SIZE = 500
+
+
+def is_pulled(author_id):
+    """Посты автора с множеством подписчиков не раскладываются по лентам,
+    а подтягиваются при чтении."""
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_PULL_THRESHOLD,
+    ).exists()
+
+
+def pulled_authors(user_id):
+    """Авторы из подписок читателя, чьи посты читаются на лету."""
+    return list(Follow.objects.filter(
+        user_id=user_id,
+        author__stats__followers_count__gt=settings.TIMELINE_PULL_THRESHOLD,
+    ).values_list('author_id', flat=True))
+
+
+def pulled_posts(user_id):
+    """Отдельный поток постов на каждого «тяжелого» автора подписок."""
+    return [
+        Post.objects.filter(author_id=author_id).select_related(
+            'author', 'group'
+        )
+        for author_id in pulled_authors(user_id)
+    ]
+
+
+def _entries(user_ids, posts):
+    return (
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in user_ids
+        for post_id, author_id, pub_date in posts
+    )
+
+
+def push_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        _entries(followers, [(post.pk, post.author_id, post.pub_date)]),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def add_author(user_id, author_id):
+    """Добавляет в ленту читателя уже опубликованные посты автора."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'author_id', 'pub_date'
+    )
+    TimelineEntry.objects.bulk_create(
+        _entries([user_id], posts.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты читателя посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+
+
+def _insert_from_follows(condition, params):
+    """Вставляет записи из соединения подписок с постами авторов.
+
+    ``condition`` отбирает пары по ``f`` (подписка) и ``p`` (пост);
+    посты «тяжелых» авторов и уже разложенные записи пропускаются.
+    """
+    sql = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+        f'{TimelineEntry._meta.db_table} '
+        f'(user_id, post_id, author_id, pub_date) '
+        f'SELECT f.user_id, p.id, p.author_id, p.pub_date '
+        f'FROM {Follow._meta.db_table} f '
+        f'INNER JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+        f'WHERE {condition} AND f.author_id NOT IN ('
+        f'SELECT user_id FROM {AuthorStats._meta.db_table} '
+        f'WHERE followers_count > %s) '
+        f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, settings.TIMELINE_PULL_THRESHOLD])
+        return cursor.rowcount
+
+
+def push_author(author_id):
+    """Раскладывает все посты автора по лентам его подписчиков.
+
+    Пока автор был «тяжелым», его посты в ленты не попадали; когда
+    подписчиков становится не больше порога, ленты их уже не подтянут.
+    """
+    return _insert_from_follows('f.author_id = %s', [author_id])
+
+
+def unfollowed(author_id):
+    """Раскладывает посты автора, если отписка опустила его до порога."""
+    at_threshold = AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_PULL_THRESHOLD,
+    ).exists()
+    if at_threshold:
+        push_author(author_id)
+
+
+def add_imported(first_post_id, first_follow_id):
+    """Раскладывает по лентам посты и подписки, загруженные в обход
+    сигналов.
+
+    Новые — посты и подписки с id не меньше данных; первая вставка идет
+    от новых постов, вторая от новых подписок.
+    """
+    return (
+        _insert_from_follows('p.id >= %s', [first_post_id])
+        + _insert_from_follows('f.id >= %s', [first_follow_id])
+    )
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты заново по текущим подпискам.
+
+    Нужна и после смены ``TIMELINE_PULL_THRESHOLD``: авторы, переставшие
+    быть «тяжелыми», снова раскладываются по лентам.
+    """
+    follows = Follow.objects.all()
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+    entries.delete()
+    created = 0
+    pairs = follows.values_list('user_id', 'author_id').distinct()
+    for user_id, author_id in pairs.iterator():
+        add_author(user_id, author_id)
+        created += 1
+    return created
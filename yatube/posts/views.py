@@ -1,10 +1,21 @@
 from xml.etree.ElementTree import Comment
-from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect, reverse
-from .models import Post, Group, Comment, Follow
+from .models import (
+    AuthorStats, Post, Group, Comment, Follow, TimelineEntry
+)
 from django.contrib.auth import get_user_model
 from .forms import PostForm, CommentForm
+from . import conditions, counters, fragments, search, thumbnails, timeline
+from .paginators import FeedPaginator, TimelinePaginator
+from .previews import attach_comment_previews
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Sum
+from django.views.decorators.http import condition
+
+from core.query_budget import query_budget
 
 
 User = get_user_model()
@@ -13,42 +24,69 @@ User = get_user_model()
 per_page = 10
 
 
+def render_page(request, template, context):
+    # Горячие страницы можно переключить на Jinja2, см. settings.
+    return render(
+        request, template, context, using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+def get_page_obj(request, posts, paginator_class=FeedPaginator, **kwargs):
+    paginator = paginator_class(posts, per_page, **kwargs)
+    page_obj = paginator.get_page(
+        request.GET.get('cursor'), request.GET.get('page')
+    )
+    attach_comment_previews(page_obj.object_list)
+    return page_obj
+
+
 # Create your views here.
+@query_budget(7)
 def index(request):
     template = 'posts/index.html'
-    posts = Post.objects.select_related('group').all()
-    paginator = Paginator(posts, per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.select_related('author', 'group').all()
+    page_obj = get_page_obj(request, posts, scope=fragments.FEED)
     context = {
         'page_obj': page_obj,
-        'posts': posts
+        'posts': posts,
+        'generation': fragments.version(fragments.FEED),
     }
-    return render(request, template, context)
+    response = render_page(request, template, context)
+    response.cache_tags = [fragments.FEED]
+    return response
 
 
+@query_budget(9)
+@condition(etag_func=conditions.group_etag,
+           last_modified_func=conditions.group_last_modified)
 def group_list(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
     posts = group.posts.select_related('author').all()
-    paginator = Paginator(posts, per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = get_page_obj(
+        request, posts, scope=fragments.group_scope(group.pk)
+    )
     context = {
         'group': group,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'generation': fragments.version(fragments.group_scope(group.pk)),
     }
-    return render(request, template, context)
+    response = render_page(request, template, context)
+    response.cache_tags = [fragments.group_scope(group.pk)]
+    return response
 
 
+@query_budget(10)
+@condition(etag_func=conditions.profile_etag,
+           last_modified_func=conditions.profile_last_modified)
 def profile(request, username):
     template = 'posts/profile.html'
     user_name = get_object_or_404(User, username=username)
     author_posts = user_name.posts.select_related('group', 'author')
-    posts_count = author_posts.count()
-    paginator = Paginator(author_posts, per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    stats = counters.get_stats(user_name)
+    page_obj = get_page_obj(
+        request, author_posts, count=stats.posts_count
+    )
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user, author=user_name
@@ -59,20 +97,29 @@ def profile(request, username):
         'author': user_name,
         'author_posts': author_posts,
         'page_obj': page_obj,
-        'posts_count': posts_count,
-        'following': following
+        'posts_count': stats.posts_count,
+        'stats': stats,
+        'following': following,
+        'generation': fragments.version(fragments.author_scope(user_name.pk)),
     }
-    return render(request, template, context)
+    response = render_page(request, template, context)
+    response.cache_tags = [fragments.author_scope(user_name.pk)]
+    return response
 
 
+@query_budget(6)
+@condition(etag_func=conditions.post_etag,
+           last_modified_func=conditions.post_last_modified)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     first_30 = post.text[:30]
-    posts_count = post.author.posts.count()
+    posts_count = counters.get_stats(post.author).posts_count
     is_author = post.author == request.user
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.select_related('post').filter(post=post)
+    comments = Comment.objects.select_related('author').filter(post=post)
 
     context = {
         'post_id': post_id,
@@ -83,10 +130,48 @@ def post_detail(request, post_id):
         'form': form,
         'comments': comments,
     }
+    response = render_page(request, template, context)
+    response.cache_tags = [
+        fragments.post_scope(post.pk), fragments.author_scope(post.author_id)
+    ]
+    return response
+
+
+@query_budget(8)
+def search_posts(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+    if request.GET.get('author'):
+        author = get_object_or_404(User, username=request.GET['author'])
+    if search.available():
+        results = search.SearchResults(query, group=group, author=author)
+    else:
+        results = Post.objects.select_related('author', 'group').filter(
+            text__icontains=query
+        ) if query else Post.objects.none()
+        if group is not None:
+            results = results.filter(group=group)
+        if author is not None:
+            results = results.filter(author=author)
+    page_obj = Paginator(results, per_page).get_page(request.GET.get('page'))
+    attach_comment_previews(page_obj.object_list)
+    params = request.GET.copy()
+    params.pop('page', None)
+    context = {
+        'query': query,
+        'group': group,
+        'author': author,
+        'page_obj': page_obj,
+        'params': params.urlencode(),
+    }
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(
@@ -103,10 +188,12 @@ def post_create(request):
     form = form.save(commit=False)
     form.author = request.user
     form.save()
+    thumbnails.enqueue(form)
     return redirect('posts:profile', request.user.username)
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
     post = get_object_or_404(Post, pk=post_id)
@@ -126,15 +213,19 @@ def post_edit(request, post_id):
     }
 
     if form.is_valid():
+        image_changed = 'image' in form.changed_data
         form = form.save(commit=False)
         form.author = request.user
         form.save()
+        if image_changed:
+            thumbnails.enqueue(form)
         return redirect('posts:post_detail', post_id=post.id)
 
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -146,18 +237,33 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(10)
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    list_of_posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(list_of_posts, per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {'page_obj': page_obj}
-    return render(request, template, context)
+    entries = TimelineEntry.objects.filter(
+        user=request.user
+    ).select_related('post__author', 'post__group')
+    author_ids = list(Follow.objects.filter(
+        user=request.user
+    ).values_list('author_id', flat=True))
+    # В ленте ровно посты подписок, их число уже есть в счетчиках авторов.
+    count = AuthorStats.objects.filter(user__in=author_ids).aggregate(
+        count=Sum('posts_count')
+    )['count']
+    page_obj = get_page_obj(
+        request, entries, TimelinePaginator,
+        pulled=timeline.pulled_posts(request.user.pk), count=count or 0
+    )
+    context = {
+        'page_obj': page_obj,
+        'generation': fragments.follow_version(request.user.pk, author_ids),
+    }
+    return render_page(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -169,6 +275,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     is_follower = Follow.objects.filter(user=request.user, author=author)
@@ -48,12 +48,112 @@ ALLOWED_HOSTS = [
 ]
 
 
+# Перед общим кэшем стоит LRU процесса: горячие ключи (поколения,
+# фрагменты ленты) читаются без похода в общий кэш. Локальный ярус
+# ограничен по байтам, а не по числу записей: несколько больших
+# страниц не вытеснят все остальное.
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.tiered.TieredCache',
+        'OPTIONS': {
+            'LOCAL': 'local',
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': 5,
+        },
+    },
+    'local': {
+        'BACKEND': 'core.cache.bounded.BoundedMemoryCache',
+        'LOCATION': 'local',
+        'OPTIONS': {
+            'MAX_BYTES': 32 * 1024 * 1024,
+            'COMPRESS_MIN_SIZE': 1024,
+            'COMPRESSOR': 'zlib',
+            'STATS_CACHE': 'shared',
+        },
+    },
+    'shared': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
 }
 
+# Без DEBUG общий ярус — файл в разделяемой памяти: одна копия фрагментов
+# на машину, clear() и сдвиг поколений сразу видны всем воркерам. При
+# разработке и в тестах остается LocMemCache, который не переживает
+# перезапуск вместе с тестовой базой.
+if not DEBUG:
+    CACHES['shared'] = {
+        'BACKEND': 'core.cache.shared_memory.SharedMemoryCache',
+        'LOCATION': '/dev/shm/yatube-cache',
+        'OPTIONS': {
+            'MAX_SIZE': 256 * 1024 * 1024,
+            'SLOT_SIZE': 64 * 1024,
+            'WAYS': 8,
+        },
+    }
+    # Чтение из файла почти так же дешево, как из LRU процесса, а
+    # локальный ярус задержал бы сброс у соседних воркеров.
+    CACHES['default']['OPTIONS']['LOCAL_TIMEOUT'] = 0
+
+# Фрагменты лент сбрасываются сигналами через поколения ключей,
+# поэтому могут жить долго.
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Карточки постов общие для всех лент; правка поста меняет его версию
+# и ключ, так что старая карточка просто доживает до таймаута.
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько последних комментариев показывать в карточке поста в ленте.
+COMMENT_PREVIEW_SIZE = 3
+
+# Число записей в ленте кэшируется по областям. Начиная с этого порога
+# оно показывается как «около N» и не пересчитывается на каждый пост.
+PAGINATOR_APPROXIMATE_COUNT = 10000
+PAGINATOR_COUNT_TIMEOUT = 60 * 10
+
+# Размер страницы JSON API по умолчанию и наибольший для ?limit=.
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Прием картинок постов: пределы до декодирования, наибольшая сторона
+# после уменьшения и формат хранения ('WEBP' или 'JPEG').
+IMAGE_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+IMAGE_MAX_SIDE = 1920
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 85
+
+# Загрузки отдает core.views.serve_media. За nginx ставьте
+# 'x-accel-redirect' (и internal-location MEDIA_SENDFILE_PREFIX),
+# за Apache или lighttpd — 'x-sendfile'; иначе файл уходит через
+# wsgi.file_wrapper. Файлы не по содержимому кэшируются MEDIA_CACHE_MAX_AGE.
+MEDIA_SENDFILE = None
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
+# Файлы хранилища по содержимому, на которые не осталось ссылок,
+# удаляются ``manage.py collect_media`` не раньше чем через столько секунд.
+MEDIA_GC_GRACE = 60 * 60
+
+# Сколько процессов нарезают миниатюры в ``manage.py thumbnail_worker``.
+THUMBNAIL_WORKERS = 2
+# Захват задач воркером истекает через столько секунд: задачи упавшего
+# воркера достаются другим. Неудачная нарезка повторяется не раньше чем
+# через THUMBNAIL_RETRY_DELAY секунд и не больше THUMBNAIL_MAX_ATTEMPTS раз.
+THUMBNAIL_CLAIM_TIMEOUT = 10 * 60
+THUMBNAIL_RETRY_DELAY = 60
+THUMBNAIL_MAX_ATTEMPTS = 5
+
+# Целые страницы для анонимных читателей, сбрасываются по тем же поколениям.
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Авторы с большим числом подписчиков не раскладываются по лентам
+# при публикации, а подтягиваются в ленту подписок при чтении.
+TIMELINE_PULL_THRESHOLD = 1000
+
+# При DEBUG превышение бюджета запросов view прерывает запрос, а не только
+# пишется в лог.
+QUERY_BUDGET_RAISE = False
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -61,6 +161,7 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -72,12 +173,19 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Отвечает 304 и на страницы из кэша ответов, у которых сохранены
+    # ETag и Last-Modified view.
+    'django.middleware.http.ConditionalGetMiddleware',
+    # Снаружи кэша ответов: сохраненная страница не несет чужих счетчиков.
+    'core.middleware.ThumbnailStatsMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -98,8 +206,24 @@ TEMPLATES = [
             ],
         },
     },
+    {
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [os.path.join(BASE_DIR, 'jinja2')],
+        'OPTIONS': {
+            'environment': 'core.jinja_env.environment',
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'core.context_processors.year.year',
+            ],
+        },
+    },
 ]
 
+# Движок для страниц лент и поста: 'django' или 'jinja2'. Шаблоны
+# Jinja2 в yatube/jinja2 дают тот же HTML, но рендерятся быстрее.
+POSTS_TEMPLATE_ENGINE = 'django'
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 